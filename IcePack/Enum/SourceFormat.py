@@ -0,0 +1,35 @@
+from enum import Enum
+
+"""
+@author: cyan.jo
+Summary:
+Defines the storage format of the source pulses and truth PMTfier reads from.
+(1) SQLite: one merged_part_<part_no>.db per part with all tables (SQLiteBackend)
+(2) Parquet: GraphNeT-style <table>/<table>_<part_no>.parquet per table (ParquetBackend)
+Both formats produce the same PMTfied shards and truth for the same events.
+"""
+
+
+class SourceFormat(Enum):
+    SQLITE = (0, "sqlite")
+    PARQUET = (1, "parquet")
+
+    def __init__(self, index: int, name: str):
+        self._index = index
+        self._name = name
+
+    @property
+    def index(self) -> int:
+        """Return the index of the source format."""
+        return self._index
+
+    def __str__(self) -> str:
+        return self._name
+
+    @staticmethod
+    def from_index(index: int) -> "SourceFormat":
+        """Return the source format from the index."""
+        for source_format in SourceFormat:
+            if source_format.index == index:
+                return source_format
+        raise ValueError(f"Invalid index: {index}")
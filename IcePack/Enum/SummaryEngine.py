@@ -0,0 +1,36 @@
+from enum import Enum
+
+"""
+@author: cyan.jo
+Summary:
+Defines the computation engines PMTSummariser can use to produce the PMT-wise features.
+(1) Loop: the original event -> string -> DOM Python loop
+(2) Segmented: all pulses of a shard are sorted once and every feature is computed
+    with segmented NumPy reductions (see SegmentedFeatureEngine)
+Both engines produce the same columns for a given SummaryMode.
+"""
+
+
+class SummaryEngine(Enum):
+    LOOP = (0, "loop")
+    SEGMENTED = (1, "segmented")
+
+    def __init__(self, index: int, name: str):
+        self._index = index
+        self._name = name
+
+    @property
+    def index(self) -> int:
+        """Return the index of the summary engine."""
+        return self._index
+
+    def __str__(self) -> str:
+        return self._name
+
+    @staticmethod
+    def from_index(index: int) -> "SummaryEngine":
+        """Return the summary engine from the index."""
+        for engine in SummaryEngine:
+            if engine.index == index:
+                return engine
+        raise ValueError(f"Invalid index: {index}")
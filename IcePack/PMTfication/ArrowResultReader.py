@@ -0,0 +1,96 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+from typing import Dict, Iterator
+
+"""
+@author: cyan.jo
+Summary:
+Reads the result of a SQLite query, or a pa.Table read by a SourceBackend,
+into a pa.Table typed by a schema, with the default of each column in place of NULL and NaN.
+
+(1) the rows are fetched n_rows_per_fetch at a time, and each chunk goes column by column
+    straight into Arrow arrays of the schema types, without a dict of Python lists in between
+(2) the defaults are applied once per column on the whole table, with a single NULL-or-NaN mask;
+    columns without NULL or NaN are kept as they are
+Columns of the result that are not in the schema keep their inferred type, e.g. N_doms.
+If a column name appears twice in the result, the last one is kept.
+
+Usage:
+    reader = ArrowResultReader(schema, defaults)  # defaults: {column: value}
+    cursor.execute(query, params)
+    table = reader.from_cursor(cursor)
+"""
+
+
+class ArrowResultReader:
+    _ROWS_PER_FETCH = 65536
+
+    def __init__(
+        self, schema: pa.Schema, defaults: Dict[str, object] = None
+    ) -> None:
+        self.schema = schema
+        self.defaults = defaults or {}
+
+    def from_cursor(self, cursor, n_rows_per_fetch: int = None) -> pa.Table:
+        """all rows of an executed cursor"""
+        column_idx = {
+            description[0]: idx
+            for idx, description in enumerate(cursor.description)
+        }
+        chunks = list(
+            self._iter_chunks(
+                cursor, column_idx, n_rows_per_fetch or self._ROWS_PER_FETCH
+            )
+        )
+        if not chunks:
+            return pa.table(
+                {
+                    name: pa.array([], type=self._get_type(name) or pa.null())
+                    for name in column_idx
+                }
+            )
+        return self.from_table(pa.concat_tables(chunks))
+
+    def from_table(self, table: pa.Table) -> pa.Table:
+        """table in the schema types, with the defaults applied"""
+        columns = []
+        for name in table.column_names:
+            column = table[name]
+            dtype = self._get_type(name)
+            if dtype is not None and column.type != dtype:
+                column = column.cast(dtype)
+            columns.append(self._apply_default(name, column))
+        return pa.Table.from_arrays(columns, names=table.column_names)
+
+    # --------- HELPERS ---------
+    def _iter_chunks(
+        self, cursor, column_idx: Dict[str, int], n_rows_per_fetch: int
+    ) -> Iterator[pa.Table]:
+        while True:
+            rows = cursor.fetchmany(n_rows_per_fetch)
+            if not rows:
+                return
+            values = list(zip(*rows))
+            yield pa.Table.from_arrays(
+                [
+                    pa.array(values[idx], type=self._get_type(name))
+                    for name, idx in column_idx.items()
+                ],
+                names=list(column_idx),
+            )
+
+    def _apply_default(self, name: str, column: pa.ChunkedArray):
+        if name not in self.defaults or pa.types.is_null(column.type):
+            return column
+        is_missing = pc.is_null(column, nan_is_null=True)
+        if not pc.any(is_missing).as_py():
+            return column
+        return pc.if_else(
+            is_missing,
+            pa.scalar(self.defaults[name]).cast(column.type),
+            column,
+        )
+
+    def _get_type(self, name: str) -> pa.DataType:
+        field_idx = self.schema.get_field_index(name)
+        return None if field_idx < 0 else self.schema.field(field_idx).type
@@ -0,0 +1,318 @@
+import numpy as np
+from typing import Tuple
+
+"""
+@author: cyan.jo
+Summary:
+Event-wise geometric features of the second round (eccentricity_PCA, aspect_contrast_PCA, hypotenuse)
+for all events of a shard at once, without per-event PCA/ConvexHull/cdist objects.
+
+Input is one row per high-charge DOM, grouped by event:
+    (event index, string, dom_x, dom_y, dom_z)
+
+(1) XY points: the first DOM of every (event, string) in the given order represents the string in XY
+(2) XY boundary: a vectorised monotone-chain convex hull, run for all events in lock-step
+    on a padded (n_events, max_points) array. Events whose points are fewer than three or collinear
+    keep all their points, as the ConvexHull fallback of PMTSummariser does.
+(3) PCA: eigenvalues of the 2x2 covariance of the boundary points in closed form
+        lambda_major = (a + c) / 2 + sqrt(((a - c) / 2)^2 + b^2)
+        lambda_minor = (a * c - b^2) / lambda_major
+(4) max XY extent: the hull diameter, searched among the boundary points only
+(5) max Z stretch: grouped max - min of dom_z per (event, string)
+
+NOTE
+When the boundary is collinear (e.g. two strings) the minor axis is zero.
+sklearn's PCA returns a rounding-level minor variance for almost all such inputs,
+so the loop path reports eccentricity_PCA and aspect_contrast_PCA of 1 there; this is kept here.
+"""
+
+_FILL_INCOMPLETE = -1
+
+
+class BatchedEventGeometry:
+    def __call__(
+        self,
+        event_index: np.ndarray,
+        string: np.ndarray,
+        dom_x: np.ndarray,
+        dom_y: np.ndarray,
+        dom_z: np.ndarray,
+        n_events: int,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns eccentricity_PCA, aspect_contrast_PCA and hypotenuse per event (n_events,).
+        Events without any DOM get -1 for all three.
+        """
+        order = np.lexsort((string, event_index))
+        event_index = event_index[order]
+        string = string[order]
+        dom_x = dom_x[order].astype(np.float64)
+        dom_y = dom_y[order].astype(np.float64)
+        dom_z = dom_z[order].astype(np.float64)
+
+        string_starts = self._get_segment_starts(event_index, string)
+        string_event = event_index[string_starts]
+
+        max_Z_stretch = self._get_max_Z_stretch(
+            dom_z, string_starts, string_event, n_events
+        )
+
+        # XY points, one per (event, string)
+        xy_x = dom_x[string_starts]
+        xy_y = dom_y[string_starts]
+        is_boundary = self._get_XY_boundary(xy_x, xy_y, string_event, n_events)
+
+        boundary_event = string_event[is_boundary]
+        boundary_x = xy_x[is_boundary]
+        boundary_y = xy_y[is_boundary]
+
+        major_PCA, minor_PCA = self._get_PCA(
+            boundary_x, boundary_y, boundary_event, n_events
+        )
+        eccentricity_PCA = self._get_eccentricity(major_PCA, minor_PCA)
+        aspect_contrast_PCA = self._get_aspect_contrast(major_PCA, minor_PCA)
+        xy_extent = self._get_max_xy_extent(
+            boundary_x, boundary_y, boundary_event, n_events
+        )
+        hypotenuse = self._get_hypotenuse(xy_extent, max_Z_stretch)
+
+        return (
+            eccentricity_PCA.astype(np.float32),
+            aspect_contrast_PCA.astype(np.float32),
+            hypotenuse.astype(np.float32),
+        )
+
+    # --------- GROUPING ---------
+    def _get_segment_starts(self, *keys: np.ndarray) -> np.ndarray:
+        n = keys[0].shape[0]
+        is_new_segment = np.zeros(n, dtype=bool)
+        is_new_segment[:1] = True
+        for values in keys:
+            is_new_segment[1:] |= values[1:] != values[:-1]
+        return np.flatnonzero(is_new_segment)
+
+    def _get_max_Z_stretch(
+        self,
+        dom_z: np.ndarray,
+        string_starts: np.ndarray,
+        string_event: np.ndarray,
+        n_events: int,
+    ) -> np.ndarray:
+        max_z_stretch = np.full(n_events, _FILL_INCOMPLETE, dtype=np.float64)
+        if string_starts.shape[0] == 0:
+            return max_z_stretch
+        z_stretch = np.maximum.reduceat(
+            dom_z, string_starts
+        ) - np.minimum.reduceat(dom_z, string_starts)
+        np.maximum.at(max_z_stretch, string_event, z_stretch)
+        return max_z_stretch
+
+    # --------- CONVEX HULL ---------
+    def _get_XY_boundary(
+        self,
+        x: np.ndarray,
+        y: np.ndarray,
+        point_event: np.ndarray,
+        n_events: int,
+    ) -> np.ndarray:
+        """
+        Boolean mask over the points: True for the hull vertices of each event,
+        or for every point of the events whose hull is degenerate.
+        """
+        is_boundary = np.ones(x.shape[0], dtype=bool)
+        counts = np.bincount(point_event, minlength=n_events)
+        hull_events = np.flatnonzero(counts >= 3)
+        if hull_events.shape[0] == 0:
+            return is_boundary
+
+        # padded (n_hull_events, max_points) arrays, points sorted by (x, y) per event
+        in_hull_event = counts[point_event] >= 3
+        point_idx = np.flatnonzero(in_hull_event)
+        row_of_event = np.full(n_events, -1, dtype=np.int64)
+        row_of_event[hull_events] = np.arange(hull_events.shape[0])
+        rows = row_of_event[point_event[point_idx]]
+        point_idx = point_idx[np.lexsort((y[point_idx], x[point_idx], rows))]
+        rows = row_of_event[point_event[point_idx]]
+
+        n_points = counts[hull_events]
+        row_starts = np.concatenate(([0], np.cumsum(n_points)[:-1]))
+        columns = np.arange(point_idx.shape[0]) - np.repeat(
+            row_starts, n_points
+        )
+        max_points = int(n_points.max())
+        padded_idx = np.zeros(
+            (hull_events.shape[0], max_points), dtype=np.int64
+        )
+        padded_idx[rows, columns] = point_idx
+        padded_x = x[padded_idx]
+        padded_y = y[padded_idx]
+
+        lower, n_lower = self._monotone_chain(
+            padded_x, padded_y, n_points, reverse=False
+        )
+        upper, n_upper = self._monotone_chain(
+            padded_x, padded_y, n_points, reverse=True
+        )
+
+        # the last point of each chain is the first point of the other chain
+        is_vertex = np.zeros((hull_events.shape[0], max_points), dtype=bool)
+        chain_columns = np.arange(max_points)
+        for chain, n_chain in ((lower, n_lower), (upper, n_upper)):
+            in_chain = chain_columns[None, :] < (n_chain - 1)[:, None]
+            hull_rows = np.broadcast_to(
+                np.arange(hull_events.shape[0])[:, None], chain.shape
+            )
+            is_vertex[hull_rows[in_chain], chain[in_chain]] = True
+
+        n_vertices = is_vertex.sum(axis=1)
+        is_hull_proper = n_vertices >= 3
+        is_boundary[point_idx] = (
+            is_vertex[rows, columns] | ~is_hull_proper[rows]
+        )
+        return is_boundary
+
+    def _monotone_chain(
+        self,
+        padded_x: np.ndarray,
+        padded_y: np.ndarray,
+        n_points: np.ndarray,
+        reverse: bool,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        One half of Andrew's monotone chain for every row at once.
+        Returns the stack of column indices per row and the stack heights.
+        """
+        n_rows, max_points = padded_x.shape
+        rows = np.arange(n_rows)
+        stack = np.zeros((n_rows, max_points), dtype=np.int64)
+        height = np.zeros(n_rows, dtype=np.int64)
+
+        for step in range(max_points):
+            is_active = step < n_points
+            column = n_points - 1 - step if reverse else np.full(n_rows, step)
+            column = np.where(is_active, column, 0)
+            x_k = padded_x[rows, column]
+            y_k = padded_y[rows, column]
+            while True:
+                can_pop = is_active & (height >= 2)
+                if not np.any(can_pop):
+                    break
+                a = stack[rows, np.maximum(height - 2, 0)]
+                b = stack[rows, np.maximum(height - 1, 0)]
+                x_a, y_a = padded_x[rows, a], padded_y[rows, a]
+                x_b, y_b = padded_x[rows, b], padded_y[rows, b]
+                cross = (x_b - x_a) * (y_k - y_a) - (y_b - y_a) * (x_k - x_a)
+                is_popped = can_pop & (cross <= 0)
+                if not np.any(is_popped):
+                    break
+                height[is_popped] -= 1
+            stack[rows[is_active], height[is_active]] = column[is_active]
+            height[is_active] += 1
+
+        return stack, height
+
+    # --------- PCA ---------
+    def _get_PCA(
+        self,
+        x: np.ndarray,
+        y: np.ndarray,
+        point_event: np.ndarray,
+        n_events: int,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        major_axis_length = np.full(n_events, _FILL_INCOMPLETE, np.float64)
+        minor_axis_length = np.full(n_events, _FILL_INCOMPLETE, np.float64)
+
+        n = np.bincount(point_event, minlength=n_events).astype(np.float64)
+        has_points = n >= 2
+        n_safe = np.where(has_points, n, 1)
+        mean_x = np.bincount(point_event, x, n_events) / np.maximum(n, 1)
+        mean_y = np.bincount(point_event, y, n_events) / np.maximum(n, 1)
+        dx = x - mean_x[point_event]
+        dy = y - mean_y[point_event]
+        # sample covariance (ddof=1), as PCA.explained_variance_
+        a = np.bincount(point_event, dx * dx, n_events) / (
+            n_safe - 1 + ~has_points
+        )
+        c = np.bincount(point_event, dy * dy, n_events) / (
+            n_safe - 1 + ~has_points
+        )
+        b = np.bincount(point_event, dx * dy, n_events) / (
+            n_safe - 1 + ~has_points
+        )
+
+        half_trace = (a + c) / 2
+        lambda_major = half_trace + np.sqrt(((a - c) / 2) ** 2 + b**2)
+        is_valid = has_points & (lambda_major > 0)
+        lambda_minor = np.zeros(n_events)
+        np.divide(a * c - b**2, lambda_major, out=lambda_minor, where=is_valid)
+        lambda_minor = np.maximum(lambda_minor, 0)
+
+        major_axis_length[is_valid] = np.sqrt(lambda_major[is_valid])
+        minor_axis_length[is_valid] = np.sqrt(lambda_minor[is_valid])
+        return major_axis_length, minor_axis_length
+
+    def _get_eccentricity(
+        self, major_axis_length: np.ndarray, minor_axis_length: np.ndarray
+    ) -> np.ndarray:
+        is_valid = (major_axis_length > 0) & (minor_axis_length >= 0)
+        ratio = np.divide(
+            minor_axis_length,
+            major_axis_length,
+            out=np.zeros_like(major_axis_length),
+            where=is_valid,
+        )
+        return np.where(is_valid, np.sqrt(1 - ratio**2), _FILL_INCOMPLETE)
+
+    def _get_aspect_contrast(
+        self, major_axis_length: np.ndarray, minor_axis_length: np.ndarray
+    ) -> np.ndarray:
+        is_valid = (major_axis_length > 0) & (minor_axis_length >= 0)
+        total = major_axis_length + minor_axis_length
+        aspect_contrast = np.divide(
+            major_axis_length - minor_axis_length,
+            total,
+            out=np.zeros_like(total),
+            where=is_valid,
+        )
+        return np.where(is_valid, aspect_contrast, _FILL_INCOMPLETE)
+
+    # --------- EXTENT ---------
+    def _get_max_xy_extent(
+        self,
+        x: np.ndarray,
+        y: np.ndarray,
+        point_event: np.ndarray,
+        n_events: int,
+    ) -> np.ndarray:
+        max_extent = np.full(n_events, _FILL_INCOMPLETE, dtype=np.float64)
+        counts = np.bincount(point_event, minlength=n_events)
+        if x.shape[0] == 0:
+            return max_extent
+
+        # every point against the points j steps further in its event (cyclic)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        point_counts = counts[point_event]
+        local = np.arange(x.shape[0]) - starts[point_event]
+        max_distance_sq = np.zeros(x.shape[0])
+        for step in range(1, int(counts.max())):
+            partner = starts[point_event] + (local + step) % point_counts
+            distance_sq = (x - x[partner]) ** 2 + (y - y[partner]) ** 2
+            np.maximum(max_distance_sq, distance_sq, out=max_distance_sq)
+
+        event_max = np.zeros(n_events)
+        np.maximum.at(event_max, point_event, max_distance_sq)
+        has_pair = counts >= 2
+        max_extent[has_pair] = np.sqrt(event_max[has_pair])
+        return max_extent
+
+    def _get_hypotenuse(
+        self, xy_extent: np.ndarray, z_stretch: np.ndarray
+    ) -> np.ndarray:
+        hypotenuse = np.full(xy_extent.shape[0], _FILL_INCOMPLETE, np.float64)
+        has_xy = xy_extent > 0
+        has_z = z_stretch > 0
+        both = has_xy & has_z
+        hypotenuse[both] = np.sqrt(xy_extent[both] ** 2 + z_stretch[both] ** 2)
+        hypotenuse[has_xy & ~has_z] = xy_extent[has_xy & ~has_z]
+        hypotenuse[~has_xy & has_z] = z_stretch[~has_xy & has_z]
+        return hypotenuse
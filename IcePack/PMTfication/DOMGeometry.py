@@ -0,0 +1,237 @@
+import logging
+import os
+import numpy as np
+from typing import Dict, Tuple
+
+"""
+@author: cyan.jo
+Summary:
+The reference DOM table, kept as memory-mappable .npy files next to the reference CSV,
+with a hash index from a quantized position to the DOM at that position.
+
+The CSV is parsed once, by the first process that needs it, into
+    <reference>.dom_geometry.npy   string, dom_number, dom_x, dom_y, dom_z of each DOM
+    <reference>.dom_hash.npy       open-addressing hash table: key of a position cell -> DOM row
+and every later instance, in any process, maps these files (np.load(mmap_mode="r")) instead.
+The files are rebuilt when the CSV is newer; if the directory is not writable,
+the table is built in memory and simply not cached.
+
+Position hash:
+(1) space is cut into cells of _QUANTUM (1 m), far below the DOM spacing (>= 7 m, DeepCore),
+    so that a cell never holds two DOMs
+(2) each DOM is put in every cell its box of half-width _EPSILON touches (at most 8),
+    so float32 rounding of a coordinate near a cell edge still finds it
+(3) a lookup hashes the cell of the position (Fibonacci hashing, linear probing),
+    then checks the position is within _EPSILON of the DOM found, on each axis
+A position within _EPSILON of a DOM resolves to it in constant time; any other position gets -1.
+
+Usage:
+    dom_geometry = DOMGeometry.get()  # once per process and reference file
+    dom_idx = dom_geometry.get_dom_idx(positions)  # (N, 3) -> (N,), -1 if not a DOM position
+    dom_geometry.doms["string"][dom_idx[dom_idx >= 0]]
+"""
+
+
+class DOMGeometry:
+    _REFERENCE_FILE = os.path.join(
+        os.path.dirname(__file__),
+        "..",
+        "ReferencePosition",
+        "unique_string_dom_combinations_completed.csv",
+    )
+    _GEOMETRY_SUFFIX = ".dom_geometry.npy"
+    _HASH_SUFFIX = ".dom_hash.npy"
+    # m, edge of a position cell
+    _QUANTUM = 1.0
+    # m, a position this close to a DOM on each axis is that DOM
+    _EPSILON = 0.01
+    # cells are packed into a key with _CELL_BITS bits per axis
+    _CELL_BITS = 21
+    _EMPTY_KEY = -1
+    _FIBONACCI = np.uint64(0x9E3779B97F4A7C15)
+    _DOM_DTYPE = np.dtype(
+        [
+            ("string", np.int32),
+            ("dom_number", np.int32),
+            ("dom_x", np.float64),
+            ("dom_y", np.float64),
+            ("dom_z", np.float64),
+        ]
+    )
+    _HASH_DTYPE = np.dtype([("key", np.int64), ("dom_idx", np.int32)])
+    # keyed by reference_file
+    _LOADED: Dict[str, "DOMGeometry"] = {}
+
+    def __init__(self, reference_file: str = None, use_cache: bool = True):
+        self.reference_file = os.path.abspath(
+            reference_file or DOMGeometry._REFERENCE_FILE
+        )
+        self.use_cache = use_cache
+        self.doms, self.hash_table = self._get_tables()
+        # (n_doms, 3) dom_x, dom_y, dom_z
+        self.positions = np.column_stack(
+            (self.doms["dom_x"], self.doms["dom_y"], self.doms["dom_z"])
+        )
+        self._hash_shift = np.uint64(
+            64 - int(np.log2(self.hash_table.shape[0]))
+        )
+
+    @classmethod
+    def get(cls, reference_file: str = None) -> "DOMGeometry":
+        """the DOMGeometry of reference_file, loaded once per process"""
+        reference_file = os.path.abspath(reference_file or cls._REFERENCE_FILE)
+        if reference_file not in cls._LOADED:
+            cls._LOADED[reference_file] = cls(reference_file)
+        return cls._LOADED[reference_file]
+
+    @property
+    def n_doms(self) -> int:
+        return self.doms.shape[0]
+
+    def get_dom_idx(self, positions: np.ndarray) -> np.ndarray:
+        """
+        row in doms of the DOM at each (dom_x, dom_y, dom_z), -1 if there is none
+        """
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        keys, is_valid = self._get_keys(
+            np.floor(positions / DOMGeometry._QUANTUM)
+        )
+        dom_idx = np.full(positions.shape[0], -1, dtype=np.int32)
+        pending = np.flatnonzero(is_valid)
+        slots = self._get_slots(keys[pending])
+        mask = self.hash_table.shape[0] - 1
+        while pending.shape[0] > 0:
+            stored = self.hash_table[slots]
+            is_hit = stored["key"] == keys[pending]
+            dom_idx[pending[is_hit]] = stored["dom_idx"][is_hit]
+            is_open = ~is_hit & (stored["key"] != DOMGeometry._EMPTY_KEY)
+            pending = pending[is_open]
+            slots = (slots[is_open] + 1) & mask
+
+        # a hit only says the cell is next to a DOM
+        found = np.flatnonzero(dom_idx >= 0)
+        is_near = np.all(
+            np.abs(positions[found] - self.positions[dom_idx[found]])
+            <= DOMGeometry._EPSILON,
+            axis=1,
+        )
+        dom_idx[found[~is_near]] = -1
+        return dom_idx
+
+    # --------- HELPERS ---------
+    def _get_tables(self) -> Tuple[np.ndarray, np.ndarray]:
+        base = os.path.splitext(self.reference_file)[0]
+        geometry_file = base + DOMGeometry._GEOMETRY_SUFFIX
+        hash_file = base + DOMGeometry._HASH_SUFFIX
+        if self.use_cache and all(
+            os.path.isfile(file)
+            and os.path.getmtime(file) >= os.path.getmtime(self.reference_file)
+            for file in (geometry_file, hash_file)
+        ):
+            return (
+                np.load(geometry_file, mmap_mode="r"),
+                np.load(hash_file, mmap_mode="r"),
+            )
+
+        doms = self._read_reference()
+        hash_table = self._build_hash_table(doms)
+        if self.use_cache:
+            self._write_cache(geometry_file, doms)
+            self._write_cache(hash_file, hash_table)
+        return doms, hash_table
+
+    def _read_reference(self) -> np.ndarray:
+        reference = np.loadtxt(
+            self.reference_file, delimiter=",", skiprows=1, ndmin=2
+        )
+        doms = np.empty(reference.shape[0], dtype=DOMGeometry._DOM_DTYPE)
+        for idx, name in enumerate(DOMGeometry._DOM_DTYPE.names):
+            doms[name] = reference[:, idx]
+        return doms
+
+    def _build_hash_table(self, doms: np.ndarray) -> np.ndarray:
+        positions = np.column_stack(
+            (doms["dom_x"], doms["dom_y"], doms["dom_z"])
+        )
+        low = np.floor(
+            (positions - DOMGeometry._EPSILON) / DOMGeometry._QUANTUM
+        )
+        high = np.floor(
+            (positions + DOMGeometry._EPSILON) / DOMGeometry._QUANTUM
+        )
+        # the (up to 8) cells of each DOM, as (key, dom_idx) pairs
+        corners = [
+            np.column_stack(
+                (
+                    (high if use_high_x else low)[:, 0],
+                    (high if use_high_y else low)[:, 1],
+                    (high if use_high_z else low)[:, 2],
+                )
+            )
+            for use_high_x in (False, True)
+            for use_high_y in (False, True)
+            for use_high_z in (False, True)
+        ]
+        keys, _ = self._get_keys(np.concatenate(corners))
+        dom_idx = np.tile(np.arange(doms.shape[0], dtype=np.int64), 8)
+        pairs = np.unique(np.column_stack((keys, dom_idx)), axis=0)
+        cell_keys, n_doms_per_cell = np.unique(pairs[:, 0], return_counts=True)
+        if np.any(n_doms_per_cell > 1):
+            raise ValueError(
+                f"{self.reference_file} has DOMs closer than {DOMGeometry._QUANTUM} m."
+            )
+
+        # at most half full, so probing is short and always ends
+        size = 1 << int(np.ceil(np.log2(2 * cell_keys.shape[0] + 1)))
+        self._hash_shift = np.uint64(64 - int(np.log2(size)))
+        hash_table = np.empty(size, dtype=DOMGeometry._HASH_DTYPE)
+        hash_table["key"] = DOMGeometry._EMPTY_KEY
+        hash_table["dom_idx"] = -1
+        pending_keys, pending_idx = pairs[:, 0], pairs[:, 1]
+        slots = self._get_slots(pending_keys)
+        while pending_keys.shape[0] > 0:
+            # the first key claiming a free slot takes it, the others probe on
+            is_free = hash_table["key"][slots] == DOMGeometry._EMPTY_KEY
+            _, first = np.unique(slots, return_index=True)
+            is_placed = np.zeros(slots.shape[0], dtype=bool)
+            is_placed[first] = True
+            is_placed &= is_free
+            hash_table["key"][slots[is_placed]] = pending_keys[is_placed]
+            hash_table["dom_idx"][slots[is_placed]] = pending_idx[is_placed]
+            pending_keys = pending_keys[~is_placed]
+            pending_idx = pending_idx[~is_placed]
+            slots = (slots[~is_placed] + 1) & (size - 1)
+        return hash_table
+
+    @staticmethod
+    def _get_keys(cells: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """key of each cell, and whether the cell fits in the key"""
+        offset = 1 << (DOMGeometry._CELL_BITS - 1)
+        with np.errstate(invalid="ignore"):
+            is_valid = np.all(
+                np.isfinite(cells) & (np.abs(cells) < offset), axis=1
+            )
+        cells = np.where(is_valid[:, None], cells, 0).astype(np.int64)
+        cells += offset
+        keys = (
+            (cells[:, 0] << (2 * DOMGeometry._CELL_BITS))
+            | (cells[:, 1] << DOMGeometry._CELL_BITS)
+            | cells[:, 2]
+        )
+        return keys, is_valid
+
+    def _get_slots(self, keys: np.ndarray) -> np.ndarray:
+        return (
+            (keys.astype(np.uint64) * DOMGeometry._FIBONACCI)
+            >> self._hash_shift
+        ).astype(np.int64)
+
+    @staticmethod
+    def _write_cache(file: str, table: np.ndarray) -> None:
+        tmp_file = f"{file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, "wb") as cache:
+                np.save(cache, table)
+            os.replace(tmp_file, file)
+        except OSError as e:
+            logging.warning(f"DOM geometry not cached at {file}: {e}")
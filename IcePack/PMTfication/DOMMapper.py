@@ -0,0 +1,148 @@
+import logging
+import numpy as np
+from scipy.spatial import cKDTree
+from typing import Dict, List, Tuple
+
+from IcePack.PMTfication.DOMGeometry import DOMGeometry
+
+"""
+@author: cyan.jo
+Summary:
+Identifies the DOM of each pulse from its position, when the pulsemap has no string and dom_number.
+It assigns string and dom_number to the pulse arrays in memory and never writes to the source.
+
+A pulse belongs to a reference DOM if
+    |dom_x - ref_x| <= tolerance_xy, |dom_y - ref_y| <= tolerance_xy, |dom_z - ref_z| <= tolerance_z
+which is a Chebyshev (L-inf) distance of at most tolerance_xy once z is scaled by tolerance_xy / tolerance_z.
+(1) the pulses of a DOM share its position, so each distinct position is looked up once
+(2) a position at a reference DOM (within DOMGeometry._EPSILON) is resolved by the position hash of DOMGeometry
+(3) any other position is assigned the nearest reference DOM within the tolerances, from a cKDTree
+    of the scaled positions, built once per process and tolerances
+(4) a position matching no reference DOM gets string = dom_number = -1, and their count is logged
+
+The reference positions are in ReferencePosition/unique_string_dom_combinations_completed.csv,
+read through the memory-mapped DOMGeometry tables:
+```bash
+string,dom_number,dom_x,dom_y,dom_z
+1.0,1.0,-256.14,-521.08,496.03
+...
+```
+
+Usage:
+    dom_mapper = DOMMapper(tolerance_xy=10, tolerance_z=2)
+    columns = dom_mapper(columns)  # {"dom_x": ..., "dom_y": ..., "dom_z": ..., ...} + string, dom_number
+"""
+
+
+class DOMMapper:
+    # the columns DOMMapper assigns
+    _ID_COLUMNS = ("string", "dom_number")
+    # keyed by (reference_file, tolerance_xy, tolerance_z)
+    _TREES: Dict[Tuple[str, float, float], cKDTree] = {}
+
+    def __init__(
+        self,
+        tolerance_xy: float = 10,
+        tolerance_z: float = 2,
+        reference_file: str = None,
+    ) -> None:
+        self.tolerance_xy = tolerance_xy
+        self.tolerance_z = tolerance_z
+        self.dom_geometry = DOMGeometry.get(reference_file)
+        self.reference_ids = np.column_stack(
+            (
+                self.dom_geometry.doms["string"],
+                self.dom_geometry.doms["dom_number"],
+            )
+        )
+        # the hash only stands in for the tree where its match is as strict
+        self.use_hash = min(tolerance_xy, tolerance_z) >= DOMGeometry._EPSILON
+
+    def __call__(
+        self, columns: Dict[str, np.ndarray]
+    ) -> Dict[str, np.ndarray]:
+        """columns with the string and dom_number of each pulse"""
+        string, dom_number = self.get_string_dom_number(
+            columns["dom_x"], columns["dom_y"], columns["dom_z"]
+        )
+        return {**columns, "string": string, "dom_number": dom_number}
+
+    def get_string_dom_number(
+        self, dom_x: np.ndarray, dom_y: np.ndarray, dom_z: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        positions = np.column_stack((dom_x, dom_y, dom_z)).astype(np.float64)
+        if positions.shape[0] == 0:
+            return np.empty(0, np.int32), np.empty(0, np.int32)
+        unique_positions, inverse = np.unique(
+            positions, axis=0, return_inverse=True
+        )
+        reference_idx = (
+            self.dom_geometry.get_dom_idx(unique_positions)
+            if self.use_hash
+            else np.full(unique_positions.shape[0], -1, dtype=np.int32)
+        )
+        misses = np.flatnonzero(reference_idx < 0)
+        if misses.shape[0] > 0:
+            reference_idx[misses] = self._query_tree(unique_positions[misses])
+        is_matched = reference_idx >= 0
+        ids = np.full((unique_positions.shape[0], 2), -1, dtype=np.int32)
+        ids[is_matched] = self.reference_ids[reference_idx[is_matched]]
+
+        pulse_ids = ids[inverse.reshape(-1)]
+        n_unmatched = int(np.count_nonzero(pulse_ids[:, 0] < 0))
+        if n_unmatched > 0:
+            logging.warning(
+                f"{n_unmatched} of {pulse_ids.shape[0]} pulses match no reference DOM"
+                f" within {self.tolerance_xy} (xy) and {self.tolerance_z} (z)"
+            )
+        return (
+            np.ascontiguousarray(pulse_ids[:, 0]),
+            np.ascontiguousarray(pulse_ids[:, 1]),
+        )
+
+    @staticmethod
+    def get_source_columns(columns: List[str]) -> List[str]:
+        """columns to read from a source without string and dom_number"""
+        return [
+            column for column in columns if column not in DOMMapper._ID_COLUMNS
+        ]
+
+    @staticmethod
+    def get_dom_key_columns(columns: List[str]) -> List[str]:
+        """
+        columns telling the DOMs of an event apart, e.g. to count them at the source:
+        string and dom_number if the source has them, else the DOM position
+        """
+        if all(column in columns for column in DOMMapper._ID_COLUMNS):
+            return list(DOMMapper._ID_COLUMNS)
+        return ["dom_x", "dom_y", "dom_z"]
+
+    # --------- HELPERS ---------
+    def _query_tree(self, positions: np.ndarray) -> np.ndarray:
+        """row of the nearest reference DOM within the tolerances, -1 if none"""
+        distances, reference_idx = self._get_tree().query(
+            self._scale(positions),
+            k=1,
+            p=np.inf,
+            # the tolerances are inclusive
+            distance_upper_bound=np.nextafter(self.tolerance_xy, np.inf),
+        )
+        return np.where(np.isfinite(distances), reference_idx, -1)
+
+    def _get_tree(self) -> cKDTree:
+        key = (
+            self.dom_geometry.reference_file,
+            self.tolerance_xy,
+            self.tolerance_z,
+        )
+        if key not in DOMMapper._TREES:
+            DOMMapper._TREES[key] = cKDTree(
+                self._scale(self.dom_geometry.positions)
+            )
+        return DOMMapper._TREES[key]
+
+    def _scale(self, positions: np.ndarray) -> np.ndarray:
+        """positions with z scaled so that both tolerances become tolerance_xy"""
+        return positions * np.array(
+            [1.0, 1.0, self.tolerance_xy / self.tolerance_z]
+        )
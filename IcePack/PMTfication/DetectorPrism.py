@@ -0,0 +1,137 @@
+import numpy as np
+from typing import Tuple
+
+"""
+@author: cyan.jo
+Summary:
+A convex prism (a convex polygon in XY, extruded between z_min and z_max) as a set of half-spaces
+    n_f . x <= h_f  for each face f (the polygon edges, the bottom and the top)
+computed once, and the segment of a ray inside it for all rays at once.
+
+Ray x(t) = pos + t * dir, against every face (Liang-Barsky / slab clip):
+    n_f . dir < 0: the ray enters through f at  t_f = (h_f - n_f . pos) / (n_f . dir)
+    n_f . dir > 0: the ray leaves through f at t_f
+    n_f . dir = 0: the ray is parallel to f, and misses the prism if pos is outside f
+    t_in = max of the entering t_f, t_out = min of the leaving t_f
+The line meets the prism iff t_in <= t_out, and the post-vertex segment is
+    t_in >= 0:         |dir| * (t_out - t_in)  (vertex before the prism)
+    t_in < 0 < t_out:  |dir| * t_out           (vertex inside the prism)
+    otherwise:         0                       (prism behind the vertex, or missed)
+Rays with a non-finite or zero pos/dir get 0.
+
+The default prism (DetectorPrism.icecube()) is the hexagon around the IceCube strings,
+between the lowest and the highest DOM.
+
+Usage:
+    detector_prism = DetectorPrism.icecube()
+    detector_prism = DetectorPrism(corners_xy, z_min, z_max)  # corners in order, either orientation
+    segment = detector_prism.get_post_vertex_segment(pos, dir)  # (N, 3), (N, 3) -> (N,)
+"""
+
+
+class DetectorPrism:
+    # |n . dir| below this is parallel, n of unit length
+    _PARALLEL_TOLERANCE = 1e-12
+    _ICECUBE_CORNERS_XY = (
+        (269.70961549, 548.30058428),
+        (576.36999512, 170.91999817),
+        (361.0, -422.82998657),
+        (-256.14001465, -521.08001709),
+        (-570.90002441, -125.13999939),
+        (-347.88000488, 451.51998901),
+    )
+    _ICECUBE_Z_RANGE = (-512.82, 524.56)
+
+    def __init__(
+        self, corners_xy: np.ndarray, z_min: float, z_max: float
+    ) -> None:
+        self.corners_xy = self._get_counterclockwise(
+            np.asarray(corners_xy, dtype=np.float64)
+        )
+        if not z_min < z_max:
+            raise ValueError(f"z_min {z_min} is not below z_max {z_max}.")
+        self.z_min = z_min
+        self.z_max = z_max
+        self.normals, self.offsets = self._get_half_spaces()
+
+    @classmethod
+    def icecube(cls) -> "DetectorPrism":
+        return cls(cls._ICECUBE_CORNERS_XY, *cls._ICECUBE_Z_RANGE)
+
+    def get_post_vertex_segment(
+        self, pos: np.ndarray, direction: np.ndarray
+    ) -> np.ndarray:
+        """length of each ray from pos along direction inside the prism"""
+        pos = np.asarray(pos, dtype=np.float64).reshape(-1, 3)
+        direction = np.asarray(direction, dtype=np.float64).reshape(-1, 3)
+        t_in, t_out = self._get_entry_exit(pos, direction)
+        speed = np.linalg.norm(direction, axis=1)
+
+        with np.errstate(invalid="ignore"):
+            segment = np.where(
+                t_in >= 0,
+                (t_out - t_in) * speed,
+                np.where(t_out > 0, t_out * speed, 0.0),
+            )
+            is_valid = (
+                (t_in <= t_out)
+                & np.isfinite(segment)
+                & np.all(np.isfinite(pos), axis=1)
+                & (speed > 0)
+            )
+        return np.where(is_valid, segment, 0.0)
+
+    # --------- HELPERS ---------
+    def _get_entry_exit(
+        self, pos: np.ndarray, direction: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """t_in and t_out of each ray, (N,) each"""
+        # (N, n_faces)
+        distance = self.offsets - pos @ self.normals.T
+        approach = direction @ self.normals.T
+        is_parallel = np.abs(approach) < DetectorPrism._PARALLEL_TOLERANCE
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t_face = distance / np.where(is_parallel, 1.0, approach)
+        t_in = np.max(
+            np.where(~is_parallel & (approach < 0), t_face, -np.inf), axis=1
+        )
+        t_out = np.min(
+            np.where(~is_parallel & (approach > 0), t_face, np.inf), axis=1
+        )
+        # parallel to a face it is outside of: never inside the prism
+        is_outside = np.any(is_parallel & (distance < 0), axis=1)
+        t_in[is_outside] = np.inf
+        t_out[is_outside] = -np.inf
+        return t_in, t_out
+
+    def _get_half_spaces(self) -> Tuple[np.ndarray, np.ndarray]:
+        """unit outward normals (n_faces, 3) and offsets (n_faces,)"""
+        edges = np.roll(self.corners_xy, -1, axis=0) - self.corners_xy
+        side_normals = np.column_stack(
+            (edges[:, 1], -edges[:, 0], np.zeros(edges.shape[0]))
+        )
+        side_normals /= np.linalg.norm(side_normals, axis=1, keepdims=True)
+        normals = np.vstack((side_normals, [(0, 0, -1), (0, 0, 1)]))
+        offsets = np.concatenate(
+            (
+                np.einsum("ij,ij->i", side_normals[:, :2], self.corners_xy),
+                [-self.z_min, self.z_max],
+            )
+        )
+        return normals, offsets
+
+    @staticmethod
+    def _get_counterclockwise(corners_xy: np.ndarray) -> np.ndarray:
+        """corners in counterclockwise order; the polygon must be convex"""
+        if corners_xy.ndim != 2 or corners_xy.shape[0] < 3:
+            raise ValueError("A prism needs at least 3 XY corners.")
+        edges = np.roll(corners_xy, -1, axis=0) - corners_xy
+        next_edges = np.roll(edges, -1, axis=0)
+        turns = edges[:, 0] * next_edges[:, 1] - edges[:, 1] * next_edges[:, 0]
+        if np.all(turns < 0):
+            return corners_xy[::-1].copy()
+        if not np.all(turns > 0):
+            raise ValueError(
+                f"The prism corners are not a convex polygon in order: {corners_xy}"
+            )
+        return corners_xy
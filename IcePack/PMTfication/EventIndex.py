@@ -0,0 +1,170 @@
+import json
+import logging
+import os
+import numpy as np
+import sqlite3 as sql
+from typing import List, Tuple, Union
+from zipfile import BadZipFile
+
+"""
+@author: cyan.jo
+Summary:
+All distinct event_no of a pulsemap table with their pulse counts, from one scan.
+
+    SELECT event_no, COUNT(*) FROM <table> GROUP BY event_no ORDER BY event_no
+is answered from the event_no index alone (created by SourceConnector.prepare), and drives the shard planning of PMTfier
+instead of one DISTINCT/ORDER BY/LIMIT query per shard.
+
+The result is cached next to the source database as
+    <database>.<table>.event_index.npz
+and reused while its fingerprint, as in PulseStaging,
+    absolute path, size and mtime_ns of the database file, the table and its MAX(rowid)
+is unchanged, so a rerun on the same part skips the scan,
+and a rewritten or replaced database is scanned again.
+The cache is written to a temporary file and renamed into place; an unreadable cache,
+e.g. truncated by a killed job, is scanned and written again.
+If the directory is not writable, the index is simply not cached.
+
+Usage:
+    event_index = EventIndex(con_source, "SRTInIcePulses")
+    for event_no_batch in event_index.get_event_no_batches(N_events_per_shard):
+        ...
+    event_index.n_events, event_index.n_pulses, event_index.pulse_counts.max()
+"""
+
+
+class EventIndex:
+    _SUFFIX = ".event_index.npz"
+
+    def __init__(
+        self,
+        con_source: sql.Connection,
+        source_table: str,
+        use_cache: bool = True,
+    ) -> None:
+        self.con_source = con_source
+        self.source_table = source_table
+        self.source_file = self._get_source_file()
+        self.cache_file = (
+            f"{self.source_file}.{source_table}{EventIndex._SUFFIX}"
+            if use_cache and self.source_file is not None
+            else None
+        )
+        self.event_nos, self.pulse_counts = self._get_event_index()
+
+    @property
+    def n_events(self) -> int:
+        return self.event_nos.shape[0]
+
+    @property
+    def n_pulses(self) -> int:
+        return int(self.pulse_counts.sum())
+
+    def get_event_no_batches(self, N_events_per_shard: int) -> List[List[int]]:
+        """
+        event_no of each shard, in order, N_events_per_shard per shard.
+        """
+        return [
+            self.event_nos[start : start + N_events_per_shard].tolist()
+            for start in range(0, self.n_events, N_events_per_shard)
+        ]
+
+    def get_pulse_counts(self, event_no_batch: List[int]) -> np.ndarray:
+        """pulse count of each event of the batch"""
+        return self.pulse_counts[
+            np.searchsorted(self.event_nos, np.asarray(event_no_batch))
+        ]
+
+    # --------- HELPERS ---------
+    def _get_event_index(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self.cache_file is None:
+            return self._scan()
+
+        fingerprint = self._get_fingerprint()
+        if os.path.isfile(self.cache_file):
+            cached = self._read_cache(fingerprint)
+            if cached is not None:
+                return cached
+
+        event_nos, pulse_counts = self._scan()
+        self._write_cache(event_nos, pulse_counts, fingerprint)
+        return event_nos, pulse_counts
+
+    def _scan(self) -> Tuple[np.ndarray, np.ndarray]:
+        cursor = self.con_source.cursor()
+        cursor.execute(f"""SELECT event_no, COUNT(*)
+                FROM {self.source_table}
+                GROUP BY event_no
+                ORDER BY event_no
+            """)
+        rows = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+        return rows[:, 0], rows[:, 1]
+
+    def _get_fingerprint(self) -> str:
+        source_stat = os.stat(self.source_file)
+        return json.dumps(
+            {
+                "source": os.path.abspath(self.source_file),
+                "size": source_stat.st_size,
+                "mtime_ns": source_stat.st_mtime_ns,
+                "source_table": self.source_table,
+                "max_rowid": self._get_max_rowid(),
+            },
+            sort_keys=True,
+        )
+
+    def _get_max_rowid(self) -> int:
+        cursor = self.con_source.cursor()
+        cursor.execute(f"SELECT MAX(rowid) FROM {self.source_table}")
+        max_rowid = cursor.fetchone()[0]
+        return -1 if max_rowid is None else max_rowid
+
+    def _get_source_file(self) -> str:
+        """the main database file, None for in-memory databases"""
+        for _, name, file in self.con_source.execute(
+            "PRAGMA database_list"
+        ).fetchall():
+            if name == "main" and file:
+                return file
+        return None
+
+    def _read_cache(
+        self, fingerprint: str
+    ) -> Union[Tuple[np.ndarray, np.ndarray], None]:
+        """the cached index if it matches fingerprint, None if stale or unreadable"""
+        try:
+            with np.load(self.cache_file) as cached:
+                if (
+                    "fingerprint" not in cached
+                    or str(cached["fingerprint"]) != fingerprint
+                ):
+                    return None
+                return cached["event_no"], cached["pulse_count"]
+        except (OSError, ValueError, EOFError, KeyError, BadZipFile) as e:
+            # e.g. truncated by an interrupted write: scanned and written again
+            logging.warning(
+                f"Event index cache {self.cache_file} unreadable, rescanning: {e}"
+            )
+            return None
+
+    def _write_cache(
+        self, event_nos: np.ndarray, pulse_counts: np.ndarray, fingerprint: str
+    ) -> None:
+        # written aside and renamed, so a reader never sees a partial file
+        tmp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+        try:
+            # np.savez appends .npz unless the name already ends with it
+            with open(tmp_file, "wb") as cache:
+                np.savez(
+                    cache,
+                    event_no=event_nos,
+                    pulse_count=pulse_counts,
+                    fingerprint=np.str_(fingerprint),
+                )
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            logging.warning(
+                f"Event index not cached at {self.cache_file}: {e}"
+            )
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
@@ -0,0 +1,88 @@
+import hashlib
+import numpy as np
+import sqlite3 as sql
+from typing import List, Tuple
+
+"""
+@author: cyan.jo
+Summary:
+SQL condition selecting the rows of an event_no subset with bound parameters,
+instead of an "event_no IN (1, 2, 3, ...)" literal list of the whole shard.
+
+(1) consecutive event_no, e.g. the shards of PMTfier._get_event_no_batches in the usual case:
+        event_no BETWEEN ? AND ?            -> a range scan on the event_no index
+(2) any other subset: the event_no are inserted once into a temp table of the connection
+        event_no IN (SELECT event_no FROM temp.event_no_subset_<hash>)
+    The table is named after its content, so queries repeating the same subset reuse it,
+    and the table of a previous subset is dropped when a new one is loaded.
+
+The SQL text does not depend on the subset size, so parsing and planning stay flat in shard size.
+
+Usage:
+    condition, params = EventNoSelection(con_source, event_no_subset)("t.event_no")
+    cursor.execute(f"SELECT ... FROM truth t WHERE {condition}", params)
+"""
+
+
+class EventNoSelection:
+    _TEMP_TABLE_PREFIX = "event_no_subset_"
+
+    def __init__(
+        self, con_source: sql.Connection, event_no_subset: List[int]
+    ) -> None:
+        self.con_source = con_source
+        self.event_nos = np.unique(np.asarray(event_no_subset, dtype=np.int64))
+        self.is_range = (
+            self.event_nos.shape[0] > 0
+            and self.event_nos[-1] - self.event_nos[0] + 1
+            == self.event_nos.shape[0]
+        )
+        self.temp_table = None if self.is_range else self._load_temp_table()
+
+    def __call__(
+        self, column: str = "event_no"
+    ) -> Tuple[str, Tuple[int, ...]]:
+        """
+        (condition on column, parameters to bind)
+        """
+        if self.is_range:
+            return f"{column} BETWEEN ? AND ?", (
+                int(self.event_nos[0]),
+                int(self.event_nos[-1]),
+            )
+        return f"{column} IN (SELECT event_no FROM temp.{self.temp_table})", ()
+
+    def _load_temp_table(self) -> str:
+        digest = hashlib.blake2b(
+            self.event_nos.tobytes(), digest_size=8
+        ).hexdigest()
+        temp_table = f"{EventNoSelection._TEMP_TABLE_PREFIX}{digest}"
+
+        cursor = self.con_source.cursor()
+        cursor.execute(
+            "SELECT name FROM sqlite_temp_master WHERE type = 'table' AND name LIKE ?",
+            (f"{EventNoSelection._TEMP_TABLE_PREFIX}%",),
+        )
+        loaded_tables = [row[0] for row in cursor.fetchall()]
+        if temp_table in loaded_tables:
+            return temp_table
+
+        # query_only of a SourceConnector connection also covers temp tables,
+        # while its mode=ro already keeps the source database itself unchanged
+        cursor.execute("PRAGMA query_only")
+        query_only = cursor.fetchone()[0]
+        cursor.execute("PRAGMA query_only = OFF")
+        try:
+            for loaded_table in loaded_tables:
+                cursor.execute(f"DROP TABLE temp.{loaded_table}")
+            cursor.execute(
+                f"CREATE TEMP TABLE {temp_table} (event_no INTEGER PRIMARY KEY)"
+            )
+            cursor.executemany(
+                f"INSERT INTO temp.{temp_table} (event_no) VALUES (?)",
+                ((event_no,) for event_no in self.event_nos.tolist()),
+            )
+            self.con_source.commit()
+        finally:
+            cursor.execute(f"PRAGMA query_only = {query_only}")
+        return temp_table
@@ -0,0 +1,231 @@
+import re
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+"""
+@author: cyan.jo
+Summary:
+Declarative registry of the PMT-wise features and the intermediates they are built from.
+
+An intermediate is an array shared by several features, e.g.
+    cumulated_charge    : segmented cumulative charge, used by T10, T50, T70, T90, Qtotal
+    top_charge_indices  : pulse indices of the two highest charges, used by t_qmax, q_max1, ...
+    half_time_masks     : first/second-half masks, used by Q_halftime, q_max_bottom, t_qmax_bottom
+A feature is one output column and declares the intermediates it reads.
+Intermediates may depend on other intermediates.
+
+Parametrised features are registered once as a family with "{i}" (integer) or "{x}" (number)
+in the name, and the value in the requested name is passed to the function, e.g.
+    "q{i}" : q1, q2, ... with the 1-based pulse index
+    "Q{i}" : Q10, Q25, Q150, ... with the time window in ns
+    "T{i}" : T10, T50, T90, ... with the charge fraction in %
+    "hypotenuse_Qcut{x}" : hypotenuse_Qcut0, hypotenuse_Qcut0.5, hypotenuse_Qcut-1, ...
+
+FeatureContext holds the intermediates of one DOM batch and computes each of them at most once,
+so a run requesting only a few columns computes only the intermediates those columns need.
+
+Usage:
+    registry = FeatureRegistry()
+
+    @registry.intermediate("cumulated_charge", requires=("charges",))
+    def _cumulated_charge(owner, context): ...
+
+    @registry.feature("T50", requires=("cumulated_charge",))
+    def _T50(owner, context): ...
+
+    context = FeatureContext(registry, owner, pulse_batch)
+    registry.compute("T50", context)
+"""
+
+
+class FeatureRegistry:
+    # placeholder -> (regular expression of the value, type of the value)
+    _PLACEHOLDERS = {
+        "{i}": ("([1-9][0-9]*)", int),
+        "{x}": ("(-?[0-9]+(?:\\.[0-9]+)?)", float),
+    }
+
+    def __init__(self) -> None:
+        self._intermediates: Dict[str, Tuple[Callable, Tuple[str, ...]]] = {}
+        self._features: Dict[str, Tuple[Callable, Tuple[str, ...]]] = {}
+        self._indexed_features: Dict[
+            str, Tuple[re.Pattern, type, Callable, Tuple[str, ...]]
+        ] = {}
+
+    # --------- REGISTRATION ---------
+    def intermediate(
+        self, name: str, requires: Tuple[str, ...] = ()
+    ) -> Callable:
+        def register(function: Callable) -> Callable:
+            self._check_requirements(name, requires)
+            self._intermediates[name] = (function, tuple(requires))
+            return function
+
+        return register
+
+    def feature(self, name: str, requires: Tuple[str, ...] = ()) -> Callable:
+        def register(function: Callable) -> Callable:
+            self._check_requirements(name, requires)
+            placeholder = self._get_placeholder(name)
+            if placeholder is not None:
+                value_pattern, value_type = FeatureRegistry._PLACEHOLDERS[
+                    placeholder
+                ]
+                prefix, suffix = name.split(placeholder)
+                pattern = re.compile(
+                    f"^{re.escape(prefix)}{value_pattern}{re.escape(suffix)}$"
+                )
+                self._indexed_features[name] = (
+                    pattern,
+                    value_type,
+                    function,
+                    tuple(requires),
+                )
+            else:
+                self._features[name] = (function, tuple(requires))
+            return function
+
+        return register
+
+    # --------- LOOKUP ---------
+    def __contains__(self, feature_name: str) -> bool:
+        try:
+            self._get_feature(feature_name)
+        except KeyError:
+            return False
+        return True
+
+    def get_feature_names(self, n_pulse_collect: int) -> List[str]:
+        """
+        every plain feature, and the "{i}" families expanded up to n_pulse_collect
+        """
+        feature_names = list(self._features.keys())
+        for name in self._indexed_features:
+            if self._get_placeholder(name) == "{i}":
+                feature_names += [
+                    name.replace("{i}", str(i + 1))
+                    for i in range(n_pulse_collect)
+                ]
+        return feature_names
+
+    def get_family(self, feature_name: str) -> str:
+        """registered name of the feature, e.g. "q{i}" for q3"""
+        if feature_name in self._features:
+            return feature_name
+        for name, (pattern, _, _, _) in self._indexed_features.items():
+            if pattern.match(feature_name):
+                return name
+        raise KeyError(f"Unknown feature: {feature_name}")
+
+    def get_parameter(self, feature_name: str) -> Union[int, float, None]:
+        """value in the name of a "{i}"/"{x}" feature, None for plain features"""
+        _, _, parameter = self._get_feature(feature_name)
+        return parameter
+
+    def get_intermediates(self, feature_names: List[str]) -> List[str]:
+        """
+        Intermediates needed by the features, in an order where every intermediate
+        comes after the intermediates it requires.
+        """
+        ordered = []
+
+        def visit(name: str) -> None:
+            if name in ordered:
+                return
+            _, requires = self._intermediates[name]
+            for required in requires:
+                visit(required)
+            ordered.append(name)
+
+        for feature_name in feature_names:
+            _, requires, _ = self._get_feature(feature_name)
+            for required in requires:
+                visit(required)
+        return ordered
+
+    # --------- EVALUATION ---------
+    def resolve(self, feature_name: str) -> Tuple[Callable, Any]:
+        """function and parameter of a feature, to be resolved once and reused"""
+        function, _, parameter = self._get_feature(feature_name)
+        return function, parameter
+
+    def compute(self, feature_name: str, context: "FeatureContext") -> Any:
+        return self.compute_resolved(*self.resolve(feature_name), context)
+
+    @staticmethod
+    def compute_resolved(
+        function: Callable, parameter: Any, context: "FeatureContext"
+    ) -> Any:
+        if parameter is not None:
+            return function(context.owner, context, parameter)
+        return function(context.owner, context)
+
+    def compute_intermediate(
+        self, name: str, context: "FeatureContext"
+    ) -> Any:
+        function, _ = self._intermediates[name]
+        return function(context.owner, context)
+
+    # --------- HELPERS ---------
+    def _get_feature(self, feature_name: str) -> Tuple[Callable, Tuple, Any]:
+        if feature_name in self._features:
+            function, requires = self._features[feature_name]
+            return function, requires, None
+        for (
+            pattern,
+            value_type,
+            function,
+            requires,
+        ) in self._indexed_features.values():
+            match = pattern.match(feature_name)
+            if match:
+                return function, requires, value_type(match.group(1))
+        raise KeyError(f"Unknown feature: {feature_name}")
+
+    @staticmethod
+    def _get_placeholder(name: str) -> Union[str, None]:
+        for placeholder in FeatureRegistry._PLACEHOLDERS:
+            if placeholder in name:
+                return placeholder
+        return None
+
+    def _check_requirements(
+        self, name: str, requires: Tuple[str, ...]
+    ) -> None:
+        unknown = [r for r in requires if r not in self._intermediates]
+        if unknown:
+            raise KeyError(
+                f"{name} requires unregistered intermediates {unknown}. "
+                "Register intermediates before the features using them."
+            )
+
+
+class FeatureContext:
+    """
+    Intermediates of one DOM batch, each computed once on first access.
+    """
+
+    def __init__(self, registry: FeatureRegistry, owner: Any, pulse_batch):
+        self.registry = registry
+        self.owner = owner
+        self.pulse_batch = pulse_batch
+        self.dom_starts = pulse_batch.dom_starts
+        self.dom_counts = pulse_batch.dom_counts
+        self.event_dom_starts = pulse_batch.event_dom_starts
+        self.n_events = pulse_batch.n_events
+        self._values: Dict[str, Any] = {}
+
+    def __getitem__(self, name: str) -> Any:
+        if name not in self._values:
+            self._values[name] = self.registry.compute_intermediate(name, self)
+        return self._values[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._values
+
+    def prepare(self, intermediates: List[str]) -> None:
+        """
+        computes the intermediates in the given order,
+        see FeatureRegistry.get_intermediates
+        """
+        for name in intermediates:
+            self[name]
@@ -1,3 +1,4 @@
+import os
 from pydantic import BaseModel
 from typing import Optional
 from IcePack.Enum.EnergyRange import EnergyRange
@@ -10,6 +11,11 @@ class SourceLayout(BaseModel):
     def get_db_file_name(self, file_idx: int) -> str:
         return f"merged_part_{int(file_idx)}.db"
 
+    def get_parquet_file_name(self, table_name: str, file_idx: int) -> str:
+        return os.path.join(
+            table_name, f"{table_name}_{int(file_idx)}.parquet"
+        )
+
     def extract_part_no(self, filename: str) -> int:
         try:
             return int(filename.split("_")[-1].split(".")[0])
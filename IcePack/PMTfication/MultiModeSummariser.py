@@ -0,0 +1,192 @@
+import pyarrow as pa
+import sqlite3 as sql
+from typing import Dict, Iterable, Iterator, List, Union
+
+from IcePack.PMTfication.PMTSummariser import PMTSummariser
+from IcePack.PMTfication.PulseBatch import PulseBatch
+from IcePack.Enum.SummaryMode import SummaryMode
+from IcePack.Enum.SummaryEngine import SummaryEngine
+
+"""
+@author: cyan.jo
+Summary:
+Summarises one shard into several SummaryModes from a single pulse fetch.
+
+(1) the pulses of the shard are read once into a PulseBatch
+(2) SummaryEngine.SEGMENTED: the union of the columns of all modes is computed once,
+    and each mode's table is a projection of it onto the mode's schema
+    SummaryEngine.LOOP: a pass writes the columns of one mode, so only the modes whose
+    columns no other requested mode contains are summarised, and the others are projected
+    (e.g. CLASSIC and SECOND from EQUINOX); EQUINOX and SANKTHANS still take a pass each
+(3) returns {summary_mode: pa.Table}, each identical to PMTSummariser(summary_mode=mode)()
+
+With memory_budget_MB, iter_pmtfied_per_mode() streams the shard in chunks of whole events,
+through summarisers built once for the shard.
+
+SummaryEngine.SEGMENTED is the default here, as it computes the union of all modes in one pass.
+
+Usage:
+    pa_pmtfied_per_mode = MultiModeSummariser(
+        con_source=con_source,
+        source_table="SRTInIcePulses",
+        event_no_subset=event_batch,
+        summary_modes={SummaryMode.CLASSIC, SummaryMode.SANKTHANS},
+        summary_engine=SummaryEngine.SEGMENTED,
+    )()
+    for pa_pmtfied_per_mode in MultiModeSummariser(..., memory_budget_MB=256).iter_pmtfied_per_mode():
+        ...
+"""
+
+
+class MultiModeSummariser:
+    def __init__(
+        self,
+        con_source: sql.Connection = None,
+        source_table: str = None,
+        event_no_subset: List[int] = None,
+        summary_modes: Iterable[SummaryMode] = (SummaryMode.CLASSIC,),
+        Q_adj_cut_second_round: Union[float, List[float]] = 0,
+        summary_engine: SummaryEngine = SummaryEngine.SEGMENTED,
+        pulse_batch: PulseBatch = None,
+        charge_windows: List[int] = None,
+        charge_fractions: List[int] = None,
+        memory_budget_MB: float = None,
+    ) -> None:
+        self.con_source = con_source
+        self.source_table = source_table
+        self.event_no_subset = event_no_subset
+        self.summary_modes = sorted(set(summary_modes), key=lambda m: m.index)
+        self.Q_adj_cut_second_round = Q_adj_cut_second_round
+        self.summary_engine = summary_engine
+        self.pulse_batch = pulse_batch
+        self.charge_windows = charge_windows
+        self.charge_fractions = charge_fractions
+        self.memory_budget_MB = memory_budget_MB
+        self.superset_summariser = None
+
+        if not self.summary_modes:
+            raise ValueError("At least one summary mode must be given.")
+
+    def __call__(self) -> Dict[SummaryMode, pa.Table]:
+        summarisers = self._get_summarisers()
+        pulse_batch = self.pulse_batch
+        if pulse_batch is None:
+            # the first summariser also completes string/dom_number if missing
+            pulse_batch = summarisers[self.summary_modes[0]]._get_pulse_batch()
+        return self._get_tables(pulse_batch, summarisers)
+
+    def iter_pmtfied_per_mode(self) -> Iterator[Dict[SummaryMode, pa.Table]]:
+        """
+        {summary_mode: pa.Table} of consecutive groups of whole events,
+        each summarised from at most about memory_budget_MB of pulses
+        by summarisers built once for the shard.
+        """
+        summarisers = self._get_summarisers()
+        for pulse_batch in summarisers[
+            self.summary_modes[0]
+        ].iter_pulse_batches():
+            yield self._get_tables(pulse_batch, summarisers)
+
+    def _get_summarisers(self) -> Dict[SummaryMode, PMTSummariser]:
+        summarisers = {
+            summary_mode: self._get_summariser(summary_mode)
+            for summary_mode in self.summary_modes
+        }
+        if self.summary_engine == SummaryEngine.SEGMENTED:
+            self.superset_summariser = self._get_superset_summariser(
+                summarisers
+            )
+        return summarisers
+
+    def _get_tables(
+        self,
+        pulse_batch: PulseBatch,
+        summarisers: Dict[SummaryMode, PMTSummariser],
+    ) -> Dict[SummaryMode, pa.Table]:
+        if self.summary_engine == SummaryEngine.LOOP:
+            return self._get_covered_tables(pulse_batch, summarisers)
+        return self._get_projected_tables(pulse_batch, summarisers)
+
+    def _get_summariser(
+        self,
+        summary_mode: SummaryMode,
+        feature_names: List[str] = None,
+    ) -> PMTSummariser:
+        return PMTSummariser(
+            con_source=self.con_source,
+            source_table=self.source_table,
+            event_no_subset=self.event_no_subset,
+            summary_mode=summary_mode,
+            Q_adj_cut_second_round=self.Q_adj_cut_second_round,
+            summary_engine=self.summary_engine,
+            pulse_batch=self.pulse_batch,
+            feature_names=feature_names,
+            charge_windows=None if feature_names else self.charge_windows,
+            charge_fractions=None if feature_names else self.charge_fractions,
+            memory_budget_MB=self.memory_budget_MB,
+        )
+
+    def _get_superset_summariser(
+        self, summarisers: Dict[SummaryMode, PMTSummariser]
+    ) -> PMTSummariser:
+        superset_names = list(
+            dict.fromkeys(
+                name
+                for summariser in summarisers.values()
+                for name in summariser.schema.names
+            )
+        )
+        # n_collect may differ between the modes, take the mode collecting the most pulses
+        widest_mode = max(
+            summarisers, key=lambda summary_mode: summary_mode.n_collect
+        )
+        return self._get_summariser(widest_mode, feature_names=superset_names)
+
+    def _get_projected_tables(
+        self,
+        pulse_batch: PulseBatch,
+        summarisers: Dict[SummaryMode, PMTSummariser],
+    ) -> Dict[SummaryMode, pa.Table]:
+        pa_superset = self.superset_summariser(pulse_batch)
+        return {
+            summary_mode: self._project(pa_superset, summariser.schema)
+            for summary_mode, summariser in summarisers.items()
+        }
+
+    def _get_covered_tables(
+        self,
+        pulse_batch: PulseBatch,
+        summarisers: Dict[SummaryMode, PMTSummariser],
+    ) -> Dict[SummaryMode, pa.Table]:
+        """
+        Summarises the modes from the widest schema down,
+        projecting each mode whose columns an already summarised table has.
+        """
+        pa_tables = {}
+        for summary_mode, summariser in sorted(
+            summarisers.items(), key=lambda item: -len(item[1].schema)
+        ):
+            pa_covering = next(
+                (
+                    pa_table
+                    for pa_table in pa_tables.values()
+                    if set(summariser.schema.names)
+                    <= set(pa_table.column_names)
+                ),
+                None,
+            )
+            pa_tables[summary_mode] = (
+                summariser(pulse_batch)
+                if pa_covering is None
+                else self._project(pa_covering, summariser.schema)
+            )
+        return {
+            summary_mode: pa_tables[summary_mode]
+            for summary_mode in summarisers
+        }
+
+    @staticmethod
+    def _project(pa_table: pa.Table, schema: pa.Schema) -> pa.Table:
+        return pa.Table.from_arrays(
+            [pa_table[name] for name in schema.names], schema=schema
+        )
@@ -1,14 +1,20 @@
 import pyarrow as pa
 import numpy as np
-from collections import defaultdict
-from typing import List, Dict, Tuple
+import re
+import sys
+from typing import Iterator, List, Dict, Tuple, Union
 import sqlite3 as sql
 from scipy.spatial import ConvexHull
 from scipy.spatial.distance import cdist
 from sklearn.decomposition import PCA
 
-from IcePack.PMTfication.ReferencePositionAdder import ReferencePositionAdder
+from IcePack.PMTfication.DOMMapper import DOMMapper
+from IcePack.PMTfication.EventNoSelection import EventNoSelection
+from IcePack.PMTfication.SegmentedFeatureEngine import SegmentedFeatureEngine
+from IcePack.PMTfication.PulseBatch import PulseBatch
+from IcePack.PMTfication.SourceConnector import SourceConnector
 from IcePack.Enum.SummaryMode import SummaryMode
+from IcePack.Enum.SummaryEngine import SummaryEngine
 
 """
 @author: cyan.jo
@@ -24,111 +30,246 @@ t_qmax_50: time at the highest charge pulse within t[:-50%]
 T70, T90: time elapsed until 60% and 80% of the total charge is reached
 Q_50t : accumulated charge until t_middle = (t[-1] - t[0]) / 2
 
+summary_engine selects how the features are computed:
+    SummaryEngine.LOOP      : event -> string -> DOM Python loop (below)
+    SummaryEngine.SEGMENTED : segmented NumPy reductions over the whole shard (SegmentedFeatureEngine)
+
+feature_names selects the output columns instead of the full summary_mode schema.
+Any column of any summary mode can be requested, e.g. ["dom_x", "dom_y", "dom_z", "Qtotal", "T70"];
+event_no is always included. The segmented engine computes only what the requested columns need.
+charge_windows / charge_fractions replace the Q25, Q75 / T10, T50 (, T70, T90) columns,
+e.g. charge_windows=[10, 25, 50, 75, 150] writes Q10, Q25, Q50, Q75, Q150 (segmented engine).
+Q_adj_cut_second_round given as a list sweeps the DOM charge threshold of the geometric features
+in one pass: [0, 0.5] writes eccentricity_PCA_Qcut0, ..., hypotenuse_Qcut0.5 (segmented engine).
+The loop path computes the summary_mode row and keeps the requested columns of it.
+memory_budget_MB bounds the pulses held at once: iter_PMTfied_pa() streams the shard
+ordered by event_no and yields one table per chunk of whole events of about that size,
+counted from the dtypes of the selected columns and their fetched SQL rows,
+so peak memory is set by the budget (or by the largest single event) instead of the shard size.
+
 TODO The core processing functions may be replaced by a class
-TODO The pulses data format can be replaced by a class instead of List[List[float]]
 TODO Consider adding these features:
     - t at where q is max. #  wait, there already is t_qmax ;;;
     - ...
-    
-NOTE data structure of events_doms_pulses
+
+NOTE the pulses of a shard are held in a PulseBatch (see PulseBatch.py):
+typed column arrays sorted by (event_no, string, dom_number, dom_time)
+with DOM and event offset arrays. The loop path reads each DOM as views of the typed columns
 ```python
-    events_doms_pulses  : {
-        event_no: {
-            string: {
-                dom_number: [pulse, ...],
-                ...
-            },
-            ...
-        },
-        ...
-    }
+    pulses = {name: columns[name][dom_offsets[d] : dom_offsets[d + 1]] for name in _PULSE_COLUMNS}
+    pulses["charge"]  # float32, pulses["hlc"]  # int8, pulses["event_no"]  # int64
 ```
+so identifiers and flags are never cast to float.
+A PulseBatch can also be given directly instead of a source connection:
+    PMTSummariser(pulse_batch=pulse_batch, summary_mode=SummaryMode.CLASSIC)()
 """
 
+# typed column views of the pulses of one DOM, keyed by PMTSummariser._PULSE_COLUMNS
+DOMPulses = Dict[str, np.ndarray]
+
 
 class PMTSummariser:
-    _SCHEMA = None
-    _DEFAULT_ARRAYS = None
+    # keyed by (summary_mode, n_pulse_collect)
+    _SCHEMAS: Dict[Tuple[SummaryMode, int], pa.Schema] = {}
+    # the pulse columns used by the summarisation, in the order of the loop path matrix
+    _PULSE_COLUMNS = [
+        "event_no",
+        "string",
+        "dom_number",
+        "dom_x",
+        "dom_y",
+        "dom_z",
+        "dom_time",
+        "hlc",
+        "charge",
+        "pmt_area",
+        "rde",
+        "is_saturated_dom",
+        "is_bad_dom",
+        "is_bright_dom",
+    ]
 
     def __init__(
         self,
-        con_source: sql.Connection,
-        source_table: str,
-        event_no_subset: List[int],
+        con_source: sql.Connection = None,
+        source_table: str = None,
+        event_no_subset: List[int] = None,
         summary_mode: SummaryMode = SummaryMode.CLASSIC,
-        Q_adj_cut_second_round: float = 0,
+        Q_adj_cut_second_round: Union[float, List[float]] = 0,
+        summary_engine: SummaryEngine = SummaryEngine.LOOP,
+        pulse_batch: PulseBatch = None,
+        feature_names: List[str] = None,
+        charge_windows: List[int] = None,
+        charge_fractions: List[int] = None,
+        memory_budget_MB: float = None,
     ) -> None:
         self.con_source = con_source
         self.source_table = source_table
         self.event_no_subset = event_no_subset
         self.summary_mode = summary_mode
         self.n_pulse_collect = summary_mode.n_collect
-        self.Q_adj_cut_second_round = Q_adj_cut_second_round
+        self.Q_adj_cuts = (
+            list(Q_adj_cut_second_round)
+            if isinstance(Q_adj_cut_second_round, (list, tuple))
+            else None
+        )
+        self.Q_adj_cut_second_round = (
+            self.Q_adj_cuts[0] if self.Q_adj_cuts else Q_adj_cut_second_round
+        )
+        self.summary_engine = summary_engine
+        self.pulse_batch = pulse_batch
+        self.memory_budget_MB = memory_budget_MB
 
-        query = f"SELECT * FROM {self.source_table} LIMIT 1"
-        cur_source = self.con_source.cursor()
-        cur_source.execute(query)
-        columns = [description[0] for description in cur_source.description]
+        if pulse_batch is None and con_source is None:
+            raise ValueError("Either con_source or pulse_batch must be given.")
+
+        if pulse_batch is not None:
+            columns = pulse_batch.column_names
+        else:
+            query = f"SELECT * FROM {self.source_table} LIMIT 1"
+            cur_source = self.con_source.cursor()
+            cur_source.execute(query)
+            columns = [
+                description[0] for description in cur_source.description
+            ]
         need_string_dom_number = (
             "string" not in columns or "dom_number" not in columns
         )
 
-        if need_string_dom_number:
-            # NOTE
-            # ReferencePositionAdder adds string and dom_number based on
-            # the reference data
-            # HACK The reference is hardcoded in PMT_ref_pos_adder.py
-            ref_pos_adder = ReferencePositionAdder(
-                con_source=con_source,
-                source_table=source_table,
-                event_no_subset=event_no_subset,
-                tolerance_xy=10,
-                tolerance_z=2,
+        if need_string_dom_number and pulse_batch is not None:
+            raise ValueError(
+                "pulse_batch must carry string and dom_number columns."
+            )
+        # NOTE
+        # DOMMapper assigns string and dom_number to the pulses as they are read,
+        # from the reference DOM positions; the source is never written
+        self.dom_mapper = (
+            DOMMapper(tolerance_xy=10, tolerance_z=2)
+            if need_string_dom_number
+            else None
+        )
+        # a prepared source is read in the order of its sort index, see SourceConnector
+        self.is_presorted = (
+            pulse_batch is None
+            and not need_string_dom_number
+            and SourceConnector.has_sort_index(con_source, source_table)
+        )
+
+        self.mode_schema = self._get_mode_schema(summary_mode)
+        if charge_windows is not None or charge_fractions is not None:
+            feature_names = feature_names or self.mode_schema.names
+            feature_names = self._replace_feature_family(
+                feature_names, "Q", charge_windows
+            )
+            feature_names = self._replace_feature_family(
+                feature_names, "T", charge_fractions
+            )
+        if self.Q_adj_cuts is not None:
+            feature_names = self._replace_geometric_features(
+                feature_names or self.mode_schema.names, self.Q_adj_cuts
+            )
+        self.schema = (
+            self.mode_schema
+            if feature_names is None
+            else self._build_feature_schema(feature_names)
+        )
+        # resolved once, for every pulse batch of the shard
+        self.segmented_engine = (
+            SegmentedFeatureEngine(
+                feature_names=self.schema.names,
+                n_pulse_collect=self.n_pulse_collect,
+                Q_adj_cut_second_round=self.Q_adj_cut_second_round,
+            )
+            if summary_engine == SummaryEngine.SEGMENTED
+            else None
+        )
+
+    def __call__(self, pulse_batch: PulseBatch = None) -> pa.Table:
+        """
+        PMTfied table of the shard, or of the given pulse_batch,
+        e.g. each chunk of iter_pulse_batches() of a summariser built once per shard.
+        """
+        return self._get_PMTfied_pa(pulse_batch)
+
+    def iter_PMTfied_pa(self) -> Iterator[pa.Table]:
+        """
+        PMTfied tables of consecutive groups of whole events,
+        each summarised from at most about memory_budget_MB of pulses.
+        """
+        for pulse_batch in self.iter_pulse_batches():
+            yield self._get_PMTfied_pa(pulse_batch)
+
+    def iter_pulse_batches(self) -> Iterator[PulseBatch]:
+        """
+        Streams the pulses of event_no_subset ordered by event_no, in chunks of
+        whole events whose size is set by memory_budget_MB (one chunk if None).
+        An event larger than the budget is still yielded whole, as every feature
+        of a DOM may depend on the other DOMs of its event.
+        """
+        if self.pulse_batch is not None or self.memory_budget_MB is None:
+            yield (
+                self.pulse_batch
+                if self.pulse_batch is not None
+                else self._get_pulse_batch()
+            )
+            return
+
+        n_rows_per_fetch = max(
+            1, int(self.memory_budget_MB * 1024**2 / self._get_pulse_nbytes())
+        )
+        yield from PulseBatch.iter_from_cursor(
+            self._execute_pulse_query(order_by_event_no=True),
+            n_rows_per_fetch,
+            presorted=self.is_presorted,
+            map_columns=self.dom_mapper,
+        )
+
+    def _get_PMTfied_pa(self, pulse_batch: PulseBatch = None) -> pa.Table:
+        if pulse_batch is None:
+            pulse_batch = (
+                self.pulse_batch
+                if self.pulse_batch is not None
+                else self._get_pulse_batch()
             )
-            ref_pos_adder()
-
-        self.event_no_idx = columns.index("event_no")
-        self.dom_string_idx = columns.index("string")
-        self.dom_number_idx = columns.index("dom_number")
-        self.dom_x_idx = columns.index("dom_x")
-        self.dom_y_idx = columns.index("dom_y")
-        self.dom_z_idx = columns.index("dom_z")
-        self.dom_time_idx = columns.index("dom_time")
-        self.dom_hlc_idx = columns.index("hlc")
-        self.dom_charge_idx = columns.index("charge")
-        self.pmt_area_idx = columns.index("pmt_area")
-        self.rde_idx = columns.index("rde")
-        self.saturation_status_idx = columns.index("is_saturated_dom")
-        self.bad_dom_status_idx = columns.index("is_bad_dom")
-        self.bright_dom_status_idx = columns.index("is_bright_dom")
-
-        if PMTSummariser._SCHEMA is None:
-            PMTSummariser._SCHEMA = self._build_schema()
-        if PMTSummariser._DEFAULT_ARRAYS is None:
-            PMTSummariser._DEFAULT_ARRAYS = self._build_empty_arrays()
-
-    def __call__(self) -> pa.Table:
-        return self._get_PMTfied_pa()
-
-    def _get_PMTfied_pa(self) -> pa.Table:
-        event_filter = ",".join(map(str, self.event_no_subset))
-        query = f"""SELECT * 
-                    FROM {self.source_table}
-                    WHERE event_no IN ({event_filter})
-                """
-        cur_source = self.con_source.cursor()
-        cur_source.execute(query)
-        rows = cur_source.fetchall()
 
-        events_doms_pulses = self._build_events_doms_pulses(rows)
-        processed_data = []
+        if self.summary_engine == SummaryEngine.SEGMENTED:
+            return self._get_PMTfied_pa_segmented(pulse_batch)
 
-        for (
-            event_no,
-            strings_doms_pulses,
-        ) in events_doms_pulses.items():  # event level loop
+        # typed views of the pulse columns, e.g. hlc stays int8 and event_no int64
+        columns = {
+            name: pulse_batch[name] for name in PMTSummariser._PULSE_COLUMNS
+        }
+        dom_offsets = pulse_batch.dom_offsets
+        event_offsets = pulse_batch.event_offsets
+        # one typed buffer per column, one row per DOM
+        buffers = self._build_output_buffers(pulse_batch.n_doms)
+        row_buffers = [buffers[name] for name in self.mode_schema.names[1:]]
+        buffers["event_no"][:] = np.repeat(
+            pulse_batch.event_no, pulse_batch.event_dom_counts
+        )
+        # rows are written in the sorted DOM order, events are summed in the read order
+        read_dom_order = pulse_batch.get_read_dom_order()
+
+        for event_idx, event_no in enumerate(
+            pulse_batch.event_no
+        ):  # event level loop
+            doms_pulses = [
+                {
+                    name: values[dom_offsets[dom] : dom_offsets[dom + 1]]
+                    for name, values in columns.items()
+                }
+                for dom in range(
+                    event_offsets[event_idx], event_offsets[event_idx + 1]
+                )
+            ]
+            read_doms_pulses = [
+                doms_pulses[dom - event_offsets[event_idx]]
+                for dom in read_dom_order[
+                    event_offsets[event_idx] : event_offsets[event_idx + 1]
+                ]
+            ]
             avg_dom_position = self._get_Q_weighted_DOM_position(
-                strings_doms_pulses
+                read_doms_pulses
             )  # one per event
 
             # Compute additional features if needed
@@ -139,88 +280,146 @@ class PMTSummariser:
             ):
                 eccentricity_PCA, aspect_contrast_PCA, hypotenuse = (
                     self._get_second_round_event_wise_features(
-                        strings_doms_pulses, self.Q_adj_cut_second_round
+                        read_doms_pulses, self.Q_adj_cut_second_round
                     )
                 )
 
-            for (
-                string,
-                doms_pulses,
-            ) in strings_doms_pulses.items():  # string level loop
-                for dom_no, pulses in doms_pulses.items():  # dom level loop
-                    if (
-                        self.summary_mode == SummaryMode.SECOND
-                        or self.summary_mode == SummaryMode.EQUINOX
-                        or self.summary_mode == SummaryMode.SANKTHANS
-                    ):
-                        dom_data = self._process_DOM(
-                            pulses=pulses,
-                            avg_dom_position=avg_dom_position,
-                            eccentricity_PCA=eccentricity_PCA,
-                            aspect_contrast_PCA=aspect_contrast_PCA,
-                            hypotenuse=hypotenuse,
-                        )
-                    else:
-                        dom_data = self._process_DOM(
-                            pulses=pulses, avg_dom_position=avg_dom_position
-                        )
-
-                    processed_data.append(
-                        np.hstack(([event_no], dom_data))
-                    )  # Convert to NumPy row
-
-        # Convert list of arrays into a single NumPy array (efficient bulk processing)
-        processed_data = (
-            np.vstack(processed_data)
-            if processed_data
-            else np.empty(
-                (0, len(PMTSummariser._SCHEMA.names)), dtype=np.float32
-            )
+            for row, pulses in enumerate(
+                doms_pulses, start=event_offsets[event_idx]
+            ):  # dom level loop
+                if (
+                    self.summary_mode == SummaryMode.SECOND
+                    or self.summary_mode == SummaryMode.EQUINOX
+                    or self.summary_mode == SummaryMode.SANKTHANS
+                ):
+                    self._process_DOM(
+                        pulses=pulses,
+                        avg_dom_position=avg_dom_position,
+                        row_buffers=row_buffers,
+                        row=row,
+                        eccentricity_PCA=eccentricity_PCA,
+                        aspect_contrast_PCA=aspect_contrast_PCA,
+                        hypotenuse=hypotenuse,
+                    )
+                else:
+                    self._process_DOM(
+                        pulses=pulses,
+                        avg_dom_position=avg_dom_position,
+                        row_buffers=row_buffers,
+                        row=row,
+                    )
+
+        # Arrow wraps the typed buffers without a copy
+        pa_pmtfied = pa.Table.from_arrays(
+            [pa.array(buffers[name]) for name in self.mode_schema.names],
+            schema=self.mode_schema,
         )
+        return pa_pmtfied.select(self.schema.names)
 
-        # Build PyArrow Table
-        pa_arrays = {
-            field: pa.array(processed_data[:, idx])
-            for idx, field in enumerate(PMTSummariser._SCHEMA.names)
-        }
-        return pa.Table.from_pydict(pa_arrays, schema=PMTSummariser._SCHEMA)
+    def _get_PMTfied_pa_segmented(self, pulse_batch: PulseBatch) -> pa.Table:
+        if pulse_batch.n_pulses == 0:
+            return self.schema.empty_table()
 
-    def _build_events_doms_pulses(
-        self, rows: List[tuple]
-    ) -> defaultdict[int, defaultdict[int, defaultdict[int, np.ndarray]]]:
-        events_doms_pulses = defaultdict(
-            lambda: defaultdict(lambda: defaultdict(list))
+        return self.features_to_arrow(
+            self.segmented_engine(pulse_batch), self.schema
         )
 
-        for row in rows:
-            event_no = row[self.event_no_idx]
-            string = row[self.dom_string_idx]
-            dom_number = row[self.dom_number_idx]
-            events_doms_pulses[event_no][string][dom_number].append(row)
-
-        for event_no, string_dict in events_doms_pulses.items():
-            for string, dom_dict in string_dict.items():
-                for dom_no, pulse_list in dom_dict.items():
-                    events_doms_pulses[event_no][string][dom_no] = np.array(
-                        pulse_list, dtype=np.float32
-                    )
+    @staticmethod
+    def features_to_arrow(
+        features: Dict[str, np.ndarray],
+        schema: pa.Schema,
+        numpy_dtypes: List[np.dtype] = None,
+    ) -> pa.Table:
+        """
+        Feature arrays of the segmented engine as a table of the given schema.
+        Each array is cast once in NumPy into a contiguous buffer,
+        which the Arrow array wraps without a copy (the columns are fixed-width, without nulls).
+        numpy_dtypes (see get_numpy_dtypes) may be given to skip resolving them per call.
+        """
+        numpy_dtypes = numpy_dtypes or PMTSummariser.get_numpy_dtypes(schema)
+        pa_arrays = []
+        for field, dtype in zip(schema, numpy_dtypes):
+            values = np.ascontiguousarray(features[field.name], dtype=dtype)
+            pa_arrays.append(
+                pa.Array.from_buffers(
+                    field.type, values.shape[0], [None, pa.py_buffer(values)]
+                )
+            )
+        return pa.Table.from_arrays(pa_arrays, schema=schema)
 
-        return events_doms_pulses
+    @staticmethod
+    def get_numpy_dtypes(schema: pa.Schema) -> List[np.dtype]:
+        return [np.dtype(field.type.to_pandas_dtype()) for field in schema]
+
+    def _get_pulse_batch(self) -> PulseBatch:
+        return PulseBatch.from_cursor(
+            self._execute_pulse_query(),
+            presorted=self.is_presorted,
+            map_columns=self.dom_mapper,
+        )
+
+    def _execute_pulse_query(
+        self, order_by_event_no: bool = False
+    ) -> sql.Cursor:
+        event_condition, params = EventNoSelection(
+            self.con_source, self.event_no_subset
+        )()
+        select_clause = ", ".join(self._get_source_columns())
+        if self.is_presorted:
+            # satisfied by the sort index, without a sort in SQLite
+            order_clause = f"ORDER BY {', '.join(PulseBatch._SORT_KEYS)}"
+        elif order_by_event_no:
+            order_clause = "ORDER BY event_no"
+        else:
+            order_clause = ""
+        query = f"""SELECT {select_clause}
+                    FROM {self.source_table}
+                    WHERE {event_condition}
+                    {order_clause}
+                """
+        cur_source = self.con_source.cursor()
+        cur_source.execute(query, params)
+        return cur_source
+
+    def _get_source_columns(self) -> List[str]:
+        """
+        pulse columns read from the source, string/dom_number are mapped if missing,
+        and the rowid telling the order the DOMs appear in the source
+        """
+        pulse_columns = (
+            PMTSummariser._PULSE_COLUMNS
+            if self.dom_mapper is None
+            else DOMMapper.get_source_columns(PMTSummariser._PULSE_COLUMNS)
+        )
+        return [PulseBatch._ROW_ID] + pulse_columns
+
+    def _get_pulse_nbytes(self) -> int:
+        """
+        bytes of one pulse while a chunk is read: its fetched SQL row,
+        a tuple of one Python number per source column, and its typed PulseBatch columns
+        """
+        n_columns = len(self._get_source_columns())
+        row_nbytes = sys.getsizeof((0.0,) * n_columns) + n_columns * (
+            sys.getsizeof(0.0)
+        )
+        return row_nbytes + PulseBatch.get_pulse_nbytes(
+            [PulseBatch._ROW_ID] + PMTSummariser._PULSE_COLUMNS
+        )
 
     def _get_Q_weighted_DOM_position(
-        self, strings_doms_pulses: Dict[int, Dict[int, np.ndarray]]
+        self, doms_pulses: List[DOMPulses]
     ) -> np.ndarray:
         total_weighted_position = np.zeros(3, dtype=np.float32)
         Q_event = 0.0
-        for doms_pulses in strings_doms_pulses.values():
-            for pulses in doms_pulses.values():
-                q = pulses[:, self.dom_charge_idx]
-                total_weighted_position += np.sum(
-                    pulses[:, [self.dom_x_idx, self.dom_y_idx, self.dom_z_idx]]
-                    * q[:, None],
-                    axis=0,
-                )
-                Q_event += np.sum(q)
+        for pulses in doms_pulses:
+            q = pulses["charge"]
+            # each coordinate contiguous, so np.sum adds it pairwise
+            total_weighted_position += np.sum(
+                np.stack((pulses["dom_x"], pulses["dom_y"], pulses["dom_z"]))
+                * q,
+                axis=1,
+            )
+            Q_event += np.sum(q)
         return (
             total_weighted_position / Q_event
             if Q_event > 0
@@ -229,12 +428,18 @@ class PMTSummariser:
 
     def _process_DOM(
         self,
-        pulses: np.ndarray,
+        pulses: DOMPulses,
         avg_dom_position: np.ndarray,
+        row_buffers: List[np.ndarray],
+        row: int,
         eccentricity_PCA: float = None,
         aspect_contrast_PCA: float = None,
         hypotenuse: float = None,
-    ) -> np.ndarray:
+    ) -> None:
+        """
+        Writes the features of one DOM to the given row of the column buffers,
+        which follow the mode schema without event_no.
+        """
         dom_position = self._get_DOM_position(pulses)
         rel_dom_pos = self._get_relative_DOM_position(
             dom_position, avg_dom_position
@@ -257,31 +462,29 @@ class PMTSummariser:
         )
         standard_deviation = self._get_time_standard_deviation(pulses)
 
-        dom_data = np.hstack(
-            (
-                dom_position,
-                rel_dom_pos,
-                [
-                    pmt_area,
-                    rde,
-                    saturation_status,
-                    bad_dom_status,
-                    bright_dom_status,
-                ],
-                first_charge_readout,
-                accumulated_charge_after_nc,
-                first_hlc,
-                first_pulse_time,
-                elapsed_time_until_charge_fraction,
-                [standard_deviation],
-            )
-        ).astype(np.float32)
+        dom_data = [
+            *dom_position,
+            *rel_dom_pos,
+            pmt_area,
+            rde,
+            saturation_status,
+            bad_dom_status,
+            bright_dom_status,
+            *first_charge_readout,
+            *accumulated_charge_after_nc,
+            *first_hlc,
+            *first_pulse_time,
+            *elapsed_time_until_charge_fraction,
+            standard_deviation,
+        ]
 
         # Append extra features depending on the summary mode
         if self.summary_mode == SummaryMode.SECOND:
-            dom_data = np.hstack(
-                (dom_data, [eccentricity_PCA, aspect_contrast_PCA, hypotenuse])
-            )  # 32 + 3 = 35
+            dom_data += [
+                eccentricity_PCA,
+                aspect_contrast_PCA,
+                hypotenuse,
+            ]  # 32 + 3 = 35
         elif self.summary_mode == SummaryMode.EQUINOX:
             t_max_q = self._get_time_at_highest_charge_pulse(
                 pulses, how_many=1
@@ -295,14 +498,15 @@ class PMTSummariser:
                     pulses, percentile1=70, percentile2=90
                 )
             )
-            dom_data = np.hstack(
-                (
-                    dom_data,
-                    [t_max_q, t_max_q_bottom, Q_halftime],
-                    elapsed_time_until_charge_fraction_late,
-                    [eccentricity_PCA, aspect_contrast_PCA, hypotenuse],
-                )
-            )  # 32 + 3 + 2 +3 = 40
+            dom_data += [
+                *t_max_q,
+                t_max_q_bottom,
+                Q_halftime,
+                *elapsed_time_until_charge_fraction_late,
+                eccentricity_PCA,
+                aspect_contrast_PCA,
+                hypotenuse,
+            ]  # 32 + 3 + 2 +3 = 40
         elif self.summary_mode == SummaryMode.SANKTHANS:
             # Sankthans mode does not require additional features
             q_max1, q_max_2 = self._get_max_charge(pulses, how_many=2)
@@ -314,24 +518,22 @@ class PMTSummariser:
                 pulses
             )
             Q_halftime = self._get_accumulated_charge_in_the_first_half(pulses)
-            dom_data = np.hstack(
-                (
-                    dom_data,  # 32
-                    [
-                        q_max1,
-                        q_max_2,
-                        q_max_bottom,  # 3
-                        t_max_q1,
-                        t_max_q2,
-                        t_max_q_bottom,
-                        Q_halftime,
-                    ],  # 4
-                    [eccentricity_PCA, aspect_contrast_PCA, hypotenuse],
-                )
-            )  # 3
+            dom_data += [
+                q_max1,
+                q_max_2,
+                q_max_bottom,  # 3
+                t_max_q1,
+                t_max_q2,
+                t_max_q_bottom,
+                Q_halftime,  # 4
+                eccentricity_PCA,
+                aspect_contrast_PCA,
+                hypotenuse,  # 3
+            ]
             # 32 + 3 + 4 + 3 = 42
 
-        return dom_data
+        for buffer, value in zip(row_buffers, dom_data):
+            buffer[row] = value
 
     def _get_relative_DOM_position(
         self, dom_position: np.ndarray, avg_dom_position: np.ndarray
@@ -339,67 +541,68 @@ class PMTSummariser:
         rel_position = dom_position - avg_dom_position
         return rel_position
 
-    def _get_DOM_position(self, pulses: np.ndarray) -> np.ndarray:
-        return pulses[0, [self.dom_x_idx, self.dom_y_idx, self.dom_z_idx]]
+    def _get_DOM_position(self, pulses: DOMPulses) -> np.ndarray:
+        return np.array(
+            [pulses["dom_x"][0], pulses["dom_y"][0], pulses["dom_z"][0]],
+            dtype=np.float32,
+        )
 
-    def _get_DOM_string(self, pulses: np.ndarray) -> int:
-        return pulses[0, self.dom_string_idx]
+    def _get_DOM_string(self, pulses: DOMPulses) -> int:
+        return pulses["string"][0]
 
-    def _get_DOM_number(self, pulses: np.ndarray) -> int:
-        return pulses[0, self.dom_number_idx]
+    def _get_DOM_number(self, pulses: DOMPulses) -> int:
+        return pulses["dom_number"][0]
 
-    def _get_pmt_area(self, pulses: np.ndarray) -> float:
-        return pulses[0, self.pmt_area_idx]
+    def _get_pmt_area(self, pulses: DOMPulses) -> float:
+        return pulses["pmt_area"][0]
 
-    def _get_rde(self, pulses: np.ndarray) -> float:
-        return pulses[0, self.rde_idx]
+    def _get_rde(self, pulses: DOMPulses) -> float:
+        return pulses["rde"][0]
 
-    def _get_saturation_status(self, pulses: np.ndarray) -> int:
-        return pulses[0, self.saturation_status_idx]
+    def _get_saturation_status(self, pulses: DOMPulses) -> int:
+        return pulses["is_saturated_dom"][0]
 
-    def _get_bad_dom_status(self, pulses: np.ndarray) -> int:
-        return pulses[0, self.bad_dom_status_idx]
+    def _get_bad_dom_status(self, pulses: DOMPulses) -> int:
+        return pulses["is_bad_dom"][0]
 
-    def _get_bright_dom_status(self, pulses: np.ndarray) -> int:
-        return pulses[0, self.bright_dom_status_idx]
+    def _get_bright_dom_status(self, pulses: DOMPulses) -> int:
+        return pulses["is_bright_dom"][0]
 
-    def _get_first_hlc(self, pulses: np.ndarray) -> np.ndarray:
+    def _get_first_hlc(self, pulses: DOMPulses) -> np.ndarray:
         _fillIncomplete = -1
-        if pulses.shape[0] < self.n_pulse_collect:
+        if len(pulses["charge"]) < self.n_pulse_collect:
             hlc = np.pad(
-                pulses[:, self.dom_hlc_idx],
-                (0, self.n_pulse_collect - pulses.shape[0]),
+                pulses["hlc"],
+                (0, self.n_pulse_collect - len(pulses["charge"])),
                 constant_values=_fillIncomplete,
             )
         else:
-            hlc = pulses[: self.n_pulse_collect, self.dom_hlc_idx]
+            hlc = pulses["hlc"][: self.n_pulse_collect]
         return hlc.astype(np.int32)
 
-    def _get_first_charge_readout(self, pulses: np.ndarray) -> np.ndarray:
+    def _get_first_charge_readout(self, pulses: DOMPulses) -> np.ndarray:
         _fillIncomplete = -1
-        if pulses.shape[0] < self.n_pulse_collect:
+        if len(pulses["charge"]) < self.n_pulse_collect:
             charge_readouts = np.pad(
-                pulses[:, self.dom_charge_idx],
-                (0, self.n_pulse_collect - pulses.shape[0]),
+                pulses["charge"],
+                (0, self.n_pulse_collect - len(pulses["charge"])),
                 constant_values=_fillIncomplete,
             )
         else:
-            charge_readouts = pulses[
-                : self.n_pulse_collect, self.dom_charge_idx
-            ]
+            charge_readouts = pulses["charge"][: self.n_pulse_collect]
 
         return charge_readouts.astype(np.float32)
 
     def _get_accumulated_charge_after_ns(
-        self, pulses: np.ndarray, interval1=25, interval2=75
+        self, pulses: DOMPulses, interval1=25, interval2=75
     ) -> np.ndarray:
         _fillIncomplete = -1
-        if pulses.shape[0] < 1:
+        if len(pulses["charge"]) < 1:
             return np.full(3, _fillIncomplete, dtype=np.float32)
 
-        t_0 = pulses[0, self.dom_time_idx]
-        time_offsets = pulses[:, self.dom_time_idx] - t_0
-        charges = pulses[:, self.dom_charge_idx]
+        t_0 = pulses["dom_time"][0]
+        time_offsets = pulses["dom_time"] - t_0
+        charges = pulses["charge"]
 
         Qinterval1 = np.sum(charges[time_offsets < interval1])
         Qinterval2 = np.sum(charges[time_offsets < interval2])
@@ -407,27 +610,27 @@ class PMTSummariser:
 
         return np.array([Qinterval1, Qinterval2, Qtotal], dtype=np.float32)
 
-    def _get_first_pulse_time(self, pulses: np.ndarray) -> np.ndarray:
+    def _get_first_pulse_time(self, pulses: DOMPulses) -> np.ndarray:
         _fillIncomplete = -1
-        if pulses.shape[0] < self.n_pulse_collect:
+        if len(pulses["charge"]) < self.n_pulse_collect:
             pulse_times = np.pad(
-                pulses[:, self.dom_time_idx],
-                (0, self.n_pulse_collect - pulses.shape[0]),
+                pulses["dom_time"],
+                (0, self.n_pulse_collect - len(pulses["charge"])),
                 constant_values=_fillIncomplete,
             )
         else:
-            pulse_times = pulses[: self.n_pulse_collect, self.dom_time_idx]
+            pulse_times = pulses["dom_time"][: self.n_pulse_collect]
         return pulse_times.astype(np.float32)
 
     def _get_elapsed_time_until_charge_fraction(
-        self, pulses: np.ndarray, percentile1=10, percentile2=50
+        self, pulses: DOMPulses, percentile1=10, percentile2=50
     ) -> np.ndarray:
         _fillIncomplete = -1
-        if pulses.shape[0] < 2:
+        if len(pulses["charge"]) < 2:
             return np.full(2, _fillIncomplete, dtype=np.float32)
 
-        charges = pulses[:, self.dom_charge_idx]
-        times = pulses[:, self.dom_time_idx]
+        charges = pulses["charge"]
+        times = pulses["dom_time"]
         Qtotal = np.sum(charges)
         cumulated_charge = np.cumsum(charges)
 
@@ -441,119 +644,129 @@ class PMTSummariser:
 
         T_1 = (
             times[idx1] - times[0]
-            if idx1 < pulses.shape[0]
+            if idx1 < len(pulses["charge"])
             else _fillIncomplete
         )
         T_2 = (
             times[idx2] - times[0]
-            if idx2 < pulses.shape[0]
+            if idx2 < len(pulses["charge"])
             else _fillIncomplete
         )
 
         return np.array([T_1, T_2], dtype=np.float32)
 
-    def _get_time_standard_deviation(self, pulses: np.ndarray) -> float:
+    def _get_time_standard_deviation(self, pulses: DOMPulses) -> float:
         _fillIncomplete = -1
         return (
-            np.std(pulses[:, self.dom_time_idx])
-            if pulses.shape[0] > 1
+            np.std(pulses["dom_time"])
+            if len(pulses["charge"]) > 1
             else _fillIncomplete
         )
 
     # ---------the equinox additional features----------
 
-    def _get_time_at_highest_charge_pulse(self, pulses: np.ndarray) -> float:
+    def _get_time_at_highest_charge_pulse(self, pulses: DOMPulses) -> float:
         _fillIncomplete = -1
-        if pulses.shape[0] < 1:
+        if len(pulses["charge"]) < 1:
             t_qmax = _fillIncomplete
         else:
-            t_qmax = pulses[
-                np.argmax(pulses[:, self.dom_charge_idx]), self.dom_time_idx
-            ]
+            t_qmax = pulses["dom_time"][np.argmax(pulses["charge"])]
         return t_qmax
 
     def _get_time_at_highest_charge_pulse(
-        self, pulses: np.ndarray, how_many: int
+        self, pulses: DOMPulses, how_many: int
     ) -> np.ndarray:
         _fillIncomplete = -1
-        if pulses.shape[0] < how_many:
+        if len(pulses["charge"]) < how_many:
             t_qmax = np.full(how_many, _fillIncomplete, dtype=np.float32)
         else:
-            sorted_indices = np.argsort(pulses[:, self.dom_charge_idx])
-            t_qmax = pulses[sorted_indices[-how_many:], self.dom_time_idx]
+            # stable: of equal charges, the later pulse counts as higher
+            sorted_indices = np.argsort(pulses["charge"], kind="stable")
+            t_qmax = pulses["dom_time"][sorted_indices[-how_many:]]
         return t_qmax.astype(np.float32)
 
     def _get_time_at_highest_charge_pulse_bottom(
-        self, pulses: np.ndarray
+        self, pulses: DOMPulses
     ) -> float:
         _fillIncomplete = -1
-        if pulses.shape[0] < 6:
+        if len(pulses["charge"]) < 6:
             t_qmax_secondhalf = _fillIncomplete
         else:
-            t_middle = (
-                pulses[-1, self.dom_time_idx] + pulses[0, self.dom_time_idx]
-            ) / 2
-            second_half_mask = pulses[:, self.dom_time_idx] > t_middle
-            t_qmax_secondhalf = pulses[
-                np.argmax(pulses[:, self.dom_charge_idx][second_half_mask]),
-                self.dom_time_idx,
+            t_middle = (pulses["dom_time"][-1] + pulses["dom_time"][0]) / 2
+            second_half_mask = pulses["dom_time"] > t_middle
+            if not np.any(second_half_mask):
+                return _fillIncomplete
+            t_qmax_secondhalf = pulses["dom_time"][
+                np.argmax(pulses["charge"][second_half_mask])
             ]
         return t_qmax_secondhalf
 
     def _get_accumulated_charge_in_the_first_half(
-        self, pulses: np.ndarray
+        self, pulses: DOMPulses
     ) -> float:
         _fillIncomplete = -1
-        if pulses.shape[0] < 2:
+        if len(pulses["charge"]) < 2:
             Q_halftime = _fillIncomplete
         else:
-            t_middle = (
-                pulses[-1, self.dom_time_idx] + pulses[0, self.dom_time_idx]
-            ) / 2
-            first_half_mask = pulses[:, self.dom_time_idx] < t_middle
-            Q_halftime = np.sum(
-                pulses[:, self.dom_charge_idx][first_half_mask]
-            )
+            t_middle = (pulses["dom_time"][-1] + pulses["dom_time"][0]) / 2
+            first_half_mask = pulses["dom_time"] < t_middle
+            Q_halftime = np.sum(pulses["charge"][first_half_mask])
         return Q_halftime
 
     # ---------the sakthans additional features----------
 
-    def _get_max_charge(self, pulses: np.ndarray, how_many: int) -> np.ndarray:
+    def _get_max_charge(self, pulses: DOMPulses, how_many: int) -> np.ndarray:
         _fillIncomplete = -1
-        if pulses.shape[0] < how_many:
+        if len(pulses["charge"]) < how_many:
             max_charges = np.full(how_many, _fillIncomplete, dtype=np.float32)
         else:
-            max_charges = np.sort(pulses[:, self.dom_charge_idx])[-how_many:]
+            max_charges = np.sort(pulses["charge"])[-how_many:]
         return max_charges.astype(np.float32)
 
     def _get_time_at_highest_charge_pulse(
-        self, pulses: np.ndarray, how_many: int
+        self, pulses: DOMPulses, how_many: int
     ) -> np.ndarray:
+        """
+        dom_time of the how_many highest charges, ascending in charge.
+        Of equal charges the later pulse counts as higher, as in the segmented engine's lexsort;
+        the default (quick)sort of np.argsort leaves the order of equal charges
+        to the NumPy build and the CPU, so earlier releases could pick either tied pulse.
+        """
         _fillIncomplete = -1
-        if pulses.shape[0] < how_many:
+        if len(pulses["charge"]) < how_many:
             t_qmax = np.full(how_many, _fillIncomplete, dtype=np.float32)
         else:
-            sorted_indices = np.argsort(pulses[:, self.dom_charge_idx])
-            t_qmax = pulses[sorted_indices[-how_many:], self.dom_time_idx]
+            sorted_indices = np.argsort(pulses["charge"], kind="stable")
+            t_qmax = pulses["dom_time"][sorted_indices[-how_many:]]
         return t_qmax.astype(np.float32)
 
-    def _get_max_charge_bottom(self, pulses: np.ndarray) -> float:
+    def _get_max_charge_bottom(self, pulses: DOMPulses) -> float:
         _fillIncomplete = -1
-        if pulses.shape[0] < 4:
+        if len(pulses["charge"]) < 4:
             max_charge_bottom = _fillIncomplete
         else:
-            t_middle = (
-                pulses[-1, self.dom_time_idx] + pulses[0, self.dom_time_idx]
-            ) / 2
-            bottom_half_mask = pulses[:, self.dom_time_idx] > t_middle
-            max_charge_bottom = np.max(
-                pulses[:, self.dom_charge_idx][bottom_half_mask]
-            )
+            t_middle = (pulses["dom_time"][-1] + pulses["dom_time"][0]) / 2
+            bottom_half_mask = pulses["dom_time"] > t_middle
+            if not np.any(bottom_half_mask):
+                return np.float32(_fillIncomplete)
+            max_charge_bottom = np.max(pulses["charge"][bottom_half_mask])
         return np.float32(max_charge_bottom)
 
-    def _build_schema(self) -> pa.Schema:
+    def _get_mode_schema(self, summary_mode: SummaryMode) -> pa.Schema:
+        """
+        Schema of a summary mode with n_pulse_collect first pulses, built once per process.
+        """
+        schema_key = (summary_mode, self.n_pulse_collect)
+        if schema_key not in PMTSummariser._SCHEMAS:
+            PMTSummariser._SCHEMAS[schema_key] = self._build_schema(
+                summary_mode
+            )
+        return PMTSummariser._SCHEMAS[schema_key]
+
+    def _build_schema(self, summary_mode: SummaryMode = None) -> pa.Schema:
+        summary_mode = summary_mode or self.summary_mode
         base_schema = [
-            ("event_no", pa.int32()),
+            ("event_no", pa.int64()),
             ("dom_x", pa.float32()),
             ("dom_y", pa.float32()),
             ("dom_z", pa.float32()),
@@ -599,13 +812,13 @@ class PMTSummariser:
             + accumulated_time_columns
         )
 
-        if self.summary_mode == SummaryMode.SECOND:
+        if summary_mode == SummaryMode.SECOND:
             schema_fields += [
                 ("eccentricity_PCA", pa.float32()),
                 ("aspect_contrast_PCA", pa.float32()),
                 ("hypotenuse", pa.float32()),
             ]
-        elif self.summary_mode == SummaryMode.EQUINOX:
+        elif summary_mode == SummaryMode.EQUINOX:
             schema_fields += [
                 ("t_qmax", pa.float32()),
                 ("t_qmax_bottom", pa.float32()),
@@ -617,7 +830,7 @@ class PMTSummariser:
                 ("hypotenuse", pa.float32()),
             ]
 
-        elif self.summary_mode == SummaryMode.SANKTHANS:
+        elif summary_mode == SummaryMode.SANKTHANS:
             schema_fields += [
                 ("q_max1", pa.float32()),
                 ("q_max2", pa.float32()),
@@ -633,54 +846,140 @@ class PMTSummariser:
 
         return pa.schema(schema_fields)
 
-    @classmethod
-    def _build_empty_arrays(cls) -> Dict[str, List[float]]:
-        if cls._SCHEMA is None:
+    def _build_feature_schema(self, feature_names: List[str]) -> pa.Schema:
+        """
+        Schema of the requested columns, typed as in the summary mode schemas.
+        """
+        available_fields = {}
+        for summary_mode in SummaryMode:
+            for field in self._get_mode_schema(summary_mode):
+                available_fields.setdefault(field.name, field)
+
+        if self.summary_engine == SummaryEngine.LOOP:
+            available_names = self.mode_schema.names
+        else:
+            # e.g. Q10, Q150, T20 of the segmented engine are float32 as Q25, T10
+            for name in feature_names:
+                if SegmentedFeatureEngine.is_available(name):
+                    available_fields.setdefault(
+                        name, pa.field(name, pa.float32())
+                    )
+            available_names = available_fields.keys()
+        unknown = [n for n in feature_names if n not in available_names]
+        if unknown:
             raise ValueError(
-                "Schema must be defined before building empty arrays."
+                f"Features {unknown} are not available for summary mode "
+                f"{self.summary_mode} with the {self.summary_engine} engine."
+            )
+
+        feature_names = ["event_no"] + [
+            name for name in dict.fromkeys(feature_names) if name != "event_no"
+        ]
+        return pa.schema([available_fields[name] for name in feature_names])
+
+    @staticmethod
+    def _replace_feature_family(
+        feature_names: List[str], prefix: str, parameters: List[int]
+    ) -> List[str]:
+        """
+        Replaces Q25, Q75 (prefix "Q") or T10, T50, ... (prefix "T") by the given list,
+        column by column in the positions of the replaced ones,
+        e.g. T10, T50, ..., T70, T90 of EQUINOX keep their places for [10, 50, 70, 90].
+        Extra columns follow the last replaced one, surplus replaced columns are dropped.
+        """
+        if parameters is None:
+            return list(feature_names)
+        is_family = re.compile(f"^{prefix}[0-9]+$").match
+        family = [f"{prefix}{int(parameter)}" for parameter in parameters]
+        n_replaced = sum(1 for name in feature_names if is_family(name))
+        if n_replaced == 0:
+            return list(feature_names) + family
+        slots = iter(
+            [family[idx : idx + 1] for idx in range(n_replaced - 1)]
+            + [family[n_replaced - 1 :]]
+        )
+        replaced = []
+        for name in feature_names:
+            replaced += next(slots) if is_family(name) else [name]
+        return replaced
+
+    @staticmethod
+    def _replace_geometric_features(
+        feature_names: List[str], Q_adj_cuts: List[float]
+    ) -> List[str]:
+        """
+        Replaces eccentricity_PCA, aspect_contrast_PCA, hypotenuse by one suffixed set per cut,
+        e.g. [0, 0.5] -> eccentricity_PCA_Qcut0, ..., hypotenuse_Qcut0, eccentricity_PCA_Qcut0.5, ...
+        """
+        geometric_features = [
+            "eccentricity_PCA",
+            "aspect_contrast_PCA",
+            "hypotenuse",
+        ]
+        requested = [f for f in geometric_features if f in feature_names]
+        swept = [
+            f"{name}{SegmentedFeatureEngine.get_Q_adj_cut_suffix(cut)}"
+            for cut in Q_adj_cuts
+            for name in requested
+        ]
+        kept = [f for f in feature_names if f not in geometric_features]
+        positions = [
+            idx for idx, f in enumerate(feature_names) if f in requested
+        ]
+        insert_at = positions[0] if positions else len(feature_names)
+        return kept[:insert_at] + swept + kept[insert_at:]
+
+    def _build_output_buffers(self, n_doms: int) -> Dict[str, np.ndarray]:
+        return {
+            field.name: np.empty(n_doms, dtype=dtype)
+            for field, dtype in zip(
+                self.mode_schema, self.get_numpy_dtypes(self.mode_schema)
             )
-        return {field: [] for field in cls._SCHEMA.names}
+        }
 
     ## ----------------- Second round features ----------------- ##
     def _get_second_round_event_wise_features(
         self,
-        event_doms_pulses: Dict[int, Dict[int, np.ndarray]],
+        event_doms_pulses: List[DOMPulses],
         Q_adj_cut_second_round: float,
     ) -> Tuple[float, float, float]:
+        """
+        event_doms_pulses in read order (PulseBatch.get_read_dom_order()),
+        so the first high-charge DOM read on a string represents it in XY.
+        """
         Q_threshold = 10 ** (Q_adj_cut_second_round + 2)
         collected_data = []
 
-        for doms_pulses in event_doms_pulses.values():
-            for pulses in doms_pulses.values():
-                Q_tot_dom = np.sum(pulses[:, self.dom_charge_idx])
-                if Q_tot_dom >= Q_threshold:
-                    collected_data.append(
-                        pulses[
-                            0,
-                            [
-                                self.dom_string_idx,
-                                self.dom_x_idx,
-                                self.dom_y_idx,
-                                self.dom_z_idx,
-                            ],
-                        ]
-                    )
+        for pulses in event_doms_pulses:
+            Q_tot_dom = np.sum(pulses["charge"])
+            if Q_tot_dom >= Q_threshold:
+                collected_data.append(
+                    [
+                        pulses["string"][0],
+                        pulses["dom_x"][0],
+                        pulses["dom_y"][0],
+                        pulses["dom_z"][0],
+                    ]
+                )
         if not collected_data:
-            eccentricity_PCA, aspect_contrast_PCA, hypotenuse = -1, -1, -1
-        else:
-            collected_data = np.array(collected_data, dtype=np.float32)
-
-            xy_boundary = self._get_XY_boundary(collected_data)
-            max_Z_stretch = self._get_max_Z_stretch(collected_data)
-            major_PCA, minor_PCA = self._get_PCA(
-                xy_boundary
-            )  # ✅ Returns tuple
-            eccentricity_PCA = self._get_eccentricity(major_PCA, minor_PCA)
-            aspect_contrast_PCA = self._get_aspect_contrast(
-                major_PCA, minor_PCA
-            )
-            xy_extent = self._get_max_xy_extent(xy_boundary)
-            hypotenuse = self._get_hypotenuse(xy_extent, max_Z_stretch)
+            return -1, -1, -1
+        return self._get_second_round_features(
+            np.array(collected_data, dtype=np.float32)
+        )
+
+    def _get_second_round_features(
+        self, collected_data: np.ndarray
+    ) -> Tuple[float, float, float]:
+        """
+        collected_data: (string, dom_x, dom_y, dom_z) of the high-charge DOMs of one event
+        """
+        xy_boundary = self._get_XY_boundary(collected_data)
+        max_Z_stretch = self._get_max_Z_stretch(collected_data)
+        major_PCA, minor_PCA = self._get_PCA(xy_boundary)  # ✅ Returns tuple
+        eccentricity_PCA = self._get_eccentricity(major_PCA, minor_PCA)
+        aspect_contrast_PCA = self._get_aspect_contrast(major_PCA, minor_PCA)
+        xy_extent = self._get_max_xy_extent(xy_boundary)
+        hypotenuse = self._get_hypotenuse(xy_extent, max_Z_stretch)
 
         return eccentricity_PCA, aspect_contrast_PCA, hypotenuse
 
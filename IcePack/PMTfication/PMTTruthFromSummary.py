@@ -3,29 +3,45 @@ import pyarrow.compute as pc
 from scipy.spatial.distance import pdist
 import numpy as np
 
+from IcePack.PMTfication.PulseBatch import PulseBatch
+
 
 class PMTTruthFromSummary:
     """
     Extract event-wise features (e.g., max inter-PMT distance) from a PMTfied PyArrow Table.
     callable() returns a PyArrow Table with 'event_no' and computed features.
+    The same features can be computed from a PulseBatch of the shard instead,
+    in which case every (string, dom_number) of an event counts as one PMT.
     To add new features,
     1. Add a new private function to compute the feature.
     2. Add the feature to the _build_truth_sub_pa() function.
     """
 
-    def __init__(self, pa_pmtfied_shard: pa.Table) -> None:
+    def __init__(
+        self, pa_pmtfied_shard: pa.Table = None, pulse_batch: PulseBatch = None
+    ) -> None:
+        if pa_pmtfied_shard is None and pulse_batch is None:
+            raise ValueError(
+                "Either pa_pmtfied_shard or pulse_batch must be given."
+            )
         self.pa_pmtfied_shard = pa_pmtfied_shard
+        self.pulse_batch = pulse_batch
 
     def __call__(self) -> pa.Table:
         return self._build_truth_sub_pa()
 
     def _build_truth_sub_pa(self) -> pa.Table:
-        unique_events = pc.unique(
-            self.pa_pmtfied_shard.column("original_event_no")
-        ).to_numpy()
-        max_distances = [
-            self._get_max_interPMT_distance(event) for event in unique_events
-        ]
+        if self.pulse_batch is not None:
+            unique_events = self.pulse_batch.event_no
+            max_distances = self._get_max_interPMT_distances_from_pulse_batch()
+        else:
+            unique_events = pc.unique(
+                self.pa_pmtfied_shard.column("original_event_no")
+            ).to_numpy()
+            max_distances = [
+                self._get_max_interPMT_distance(event)
+                for event in unique_events
+            ]
         # add new features here
 
         truth_table = pa.Table.from_arrays(
@@ -65,3 +81,26 @@ class PMTTruthFromSummary:
         return np.max(
             pdist(xyz, metric="euclidean")
         )  # max of  pairwise distances
+
+    def _get_max_interPMT_distances_from_pulse_batch(self) -> np.ndarray:
+        """
+        Same as _get_max_interPMT_distance, using the first pulse position of each DOM.
+        """
+        xyz = np.column_stack(
+            [
+                self.pulse_batch.dom_first("dom_x"),
+                self.pulse_batch.dom_first("dom_y"),
+                self.pulse_batch.dom_first("dom_z"),
+            ]
+        )
+        event_offsets = self.pulse_batch.event_offsets
+        max_distances = np.zeros(self.pulse_batch.n_events, dtype=np.float32)
+        for event_idx in range(self.pulse_batch.n_events):
+            event_xyz = xyz[
+                event_offsets[event_idx] : event_offsets[event_idx + 1]
+            ]
+            if event_xyz.shape[0] >= 2:
+                max_distances[event_idx] = np.max(
+                    pdist(event_xyz, metric="euclidean")
+                )
+        return max_distances
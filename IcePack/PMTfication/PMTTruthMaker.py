@@ -1,9 +1,14 @@
+import logging
 import pyarrow as pa
 import pyarrow.compute as pc
 import sqlite3 as sql
-from typing import List
-from pyarrow.compute import SetLookupOptions
+from typing import List, Tuple
 from IcePack.PMTfication.PMTTruthFromTruth import PMTTruthFromTruth
+from IcePack.PMTfication.DetectorPrism import DetectorPrism
+from IcePack.PMTfication.EventNoSelection import EventNoSelection
+from IcePack.PMTfication.SourceBackend import SourceBackend
+from IcePack.PMTfication.ArrowResultReader import ArrowResultReader
+from IcePack.PMTfication.DOMMapper import DOMMapper
 
 """
 @cyan.jo
@@ -14,13 +19,35 @@ Generates labelled truth tables from raw PMTfied outputs.
 (2)Handles output structure for learning-ready truth tables.
 (3)Supports flexible truth generation per event or shard.
 (4)Adds new truth columns calculated from existing truth columns by PMTTruthFromTruth
+
+get_source_truth (SQL) and derive_truth (joins) are the two halves of __call__,
+so the SQL part can be fetched ahead of the summarisation, see ShardPipeline.
+With a source_backend, e.g. ParquetBackend, the tables are read through it instead of SQL.
+Either way the tables are typed and given their defaults by ArrowResultReader,
+and the queries select only the events of the shard, so the tables need no filtering after.
 """
 
 
 class PMTTruthMaker:
-    def __init__(self, con_source: sql.Connection, table_config: dict) -> None:
+    def __init__(
+        self,
+        con_source: sql.Connection,
+        table_config: dict,
+        source_backend: SourceBackend = None,
+        source_table: str = None,
+        detector_prism: DetectorPrism = None,
+    ) -> None:
+        """
+        source_backend: read the tables through a SourceBackend, e.g. ParquetBackend,
+        instead of the SQL queries on con_source.
+        source_table: the pulsemap the truth is joined on, the pulsemap of table_config by default.
+        detector_prism: the prism of post_vertex_intra_IceCube_segment, the IceCube prism by default.
+        """
         self.con_source = con_source
         self.table_config = table_config
+        self.source_backend = source_backend
+        self.source_table = source_table or table_config["pulsemap"]["name"]
+        self.detector_prism = detector_prism
 
         self._build_schema()
         self._build_nan_replacement()
@@ -33,17 +60,31 @@ class PMTTruthMaker:
         event_no_subset: List[int],
         summary_derived_truth_table: pa.Table,
     ) -> pa.Table:
-
-        receipt_pa = self._build_receipt_pa(
-            subdirectory_no, part_no, shard_no, event_no_subset
+        source_truth_table = self.get_source_truth(
+            subdirectory_no=subdirectory_no,
+            part_no=part_no,
+            shard_no=shard_no,
+            event_no_subset=event_no_subset,
+        )
+        return self.derive_truth(
+            source_truth_table, summary_derived_truth_table
         )
 
+    def get_source_truth(
+        self,
+        subdirectory_no: int,
+        part_no: int,
+        shard_no: int,
+        event_no_subset: List[int],
+    ) -> pa.Table:
+        """
+        The SQL part of the truth: truth and trailing tables of the shard, merged.
+        Needs no PMTfied data, so it can be fetched ahead of the summarisation.
+        """
         # Fetch the TRUTH table using the dedicated query
         truth_table = self._get_pa_shard(
-            receipt_pa=receipt_pa,
             event_no_subset=event_no_subset,
             schema_name="truth",
-            event_no_column="event_no",
             build_query_func=self._build_truth_query,  # Only hardcoded query
         )
 
@@ -60,10 +101,8 @@ class PMTTruthMaker:
             )
 
             table = self._get_pa_shard(
-                receipt_pa=receipt_pa,
                 event_no_subset=event_no_subset,
                 schema_name=name,
-                event_no_column=event_no_col,
                 build_query_func=query_builder,
             )
             trailing_tables[name] = (table, event_no_col)
@@ -76,35 +115,29 @@ class PMTTruthMaker:
             part_no=part_no,
             shard_no=shard_no,
         )
+        return merged_table
 
+    def derive_truth(
+        self, merged_table: pa.Table, summary_derived_truth_table: pa.Table
+    ) -> pa.Table:
+        """
+        Joins the source truth with the summary-derived truth and adds PMTTruthFromTruth.
+        """
         # Join with summary-derived truth table
         merged_table = merged_table.join(
             summary_derived_truth_table, keys=["event_no"], join_type="inner"
         )
 
         # Apply secondary derivation
-        truth_derived_truth = PMTTruthFromTruth(merged_table)()
+        truth_derived_truth = PMTTruthFromTruth(
+            merged_table, detector_prism=self.detector_prism
+        )()
         merged_table = merged_table.join(
             truth_derived_truth, keys=["event_no"], join_type="inner"
         )
 
         return merged_table
 
-    def _build_receipt_pa(
-        self,
-        subdirectory_no: int,
-        part_no: int,
-        shard_no: int,
-        event_no_subset: List[int],
-    ) -> pa.Table:
-        receipt_data = {
-            "event_no": event_no_subset,
-            "subdirectory_no": [subdirectory_no] * len(event_no_subset),
-            "part_no": [part_no] * len(event_no_subset),
-            "shard_no": [shard_no] * len(event_no_subset),
-        }
-        return pa.Table.from_pydict(receipt_data)
-
     def _merge_tables(
         self,
         truth_table: pa.Table,
@@ -140,135 +173,42 @@ class PMTTruthMaker:
 
         return pa.Table.from_pydict(merged_data, schema=self._MERGED_SCHEMA)
 
-    def _filter_rows(
-        self, table: pa.Table, receipt_pa: pa.Table, event_no_column: str
-    ) -> pa.Table:
-        event_no_column_truth_list = table[event_no_column].to_pylist()
-        event_no_column_receipt_list = receipt_pa["event_no"].to_pylist()
-
-        if not event_no_column_truth_list or not event_no_column_receipt_list:
-            return pa.Table.from_pydict(
-                {field.name: [] for field in self._MERGED_SCHEMA},
-                schema=self._MERGED_SCHEMA,
-            )
-
-        lookup_options = SetLookupOptions(
-            value_set=pa.array(event_no_column_receipt_list)
-        )
-        filtered_rows = pc.is_in(
-            pa.array(event_no_column_truth_list), options=lookup_options
-        )
-        return table.filter(filtered_rows)
-
     # --------- TABLE SHARD GETTERS ---------
     def _get_pa_shard(
         self,
-        receipt_pa: pa.Table,
         event_no_subset: List[int],
         schema_name: str,
-        event_no_column: str,
         build_query_func: callable,
     ) -> pa.Table:
         """
         Generic function to retrieve a PyArrow table shard from the database.
         Parameters:
-            - receipt_pa: PyArrow Table containing receipt data.
-            - event_no_subset: List of event numbers to filter by.
+            - event_no_subset: List of event numbers to select.
             - schema_name: The name of the schema (e.g., 'TRUTH', 'GNLabel').
-            - event_no_column: The event number column name in the resulting table.
-            - build_query_func: The query-building function specific to the schema.
+            - build_query_func: The query-building function specific to the schema,
+              returning the query and its bound parameters (SQL only).
 
         Returns:
-            - A filtered PyArrow table shard.
+            - The PyArrow table shard, in the schema with NaN replacements applied.
         """
-        query = build_query_func(event_no_subset)
-        rows, columns = self._execute_query(query)
-
         schema = self._SCHEMAS[schema_name]
-        nan_replacement = self._nan_replacements[schema_name]
-
-        if not rows:
-            # Return an empty table with correct schema
-            return pa.Table.from_pydict(
-                {field.name: [] for field in schema}, schema=schema
-            )
-
-        table = (
-            self._create_truth_pa_table(rows, columns)
-            if schema_name == "truth"
-            else self._create_trailing_pa_table(
-                rows, columns, schema, nan_replacement
-            )
-        )
-        return self._filter_rows(table, receipt_pa, event_no_column)
-
-    # --------- TABLE BUILDERS ---------
-    def _create_truth_pa_table(
-        self, rows: List[tuple], columns: List[str]
-    ) -> pa.Table:
-        if not rows:
-            schema = self._SCHEMAS["truth"]
-            return pa.Table.from_pydict(
-                {field.name: [] for field in schema}, schema=schema
+        reader = ArrowResultReader(schema, self._nan_replacements[schema_name])
+        if self.source_backend is None:
+            query, params = build_query_func(event_no_subset)
+            table = self._execute_query(query, params, reader)
+        else:
+            table = reader.from_table(
+                self._read_backend_table(schema_name, event_no_subset)
             )
 
-        truth_data = {
-            col: [row[i] for row in rows] for i, col in enumerate(columns)
-        }
-        truth_data["offset"] = pc.cumulative_sum(
-            pa.array(truth_data["N_doms"])
-        )
-
-        schema = self._SCHEMAS["truth"]
-        table = pa.Table.from_pydict(truth_data, schema=schema)
-
-        nan_replacement = self._nan_replacements["truth"]
-        for column, replacement in nan_replacement.items():
-            if column in table.column_names:
-                filled_column = pc.fill_null(table[column], replacement)
-                replaced_column = pc.if_else(
-                    pc.is_nan(filled_column),
-                    pa.scalar(replacement, type=filled_column.type),
-                    filled_column,
-                )
-                table = table.set_column(
-                    table.schema.get_field_index(column),
-                    column,
-                    replaced_column,
-                )
-
-        return table
-
-    def _create_trailing_pa_table(
-        self,
-        rows: List[tuple],
-        columns: List[str],
-        schema: pa.Schema,
-        nan_replacement: dict,
-    ) -> pa.Table:
-        if not rows:
-            return pa.Table.from_pydict(
-                {field.name: [] for field in schema}, schema=schema
+        if table.num_rows == 0:
+            # Return an empty table with correct schema
+            return schema.empty_table()
+        if schema_name == "truth" and "offset" in schema.names:
+            table = table.append_column(
+                "offset", pc.cumulative_sum(table["N_doms"])
             )
-
-        data = {col: [row[i] for row in rows] for i, col in enumerate(columns)}
-        table = pa.Table.from_pydict(data, schema=schema)
-
-        for column, replacement in nan_replacement.items():
-            if column in table.column_names:
-                filled_column = pc.fill_null(table[column], replacement)
-                replaced_column = pc.if_else(
-                    pc.is_nan(filled_column),
-                    pa.scalar(replacement, type=filled_column.type),
-                    filled_column,
-                )
-                table = table.set_column(
-                    table.schema.get_field_index(column),
-                    column,
-                    replaced_column,
-                )
-
-        return table
+        return table.select(schema.names)
 
     # --------- dynamic SCHEMA BUILDERS ---------
     def _build_schema(self) -> None:
@@ -279,8 +219,19 @@ class PMTTruthMaker:
                 continue
 
             table_name = table_info["name"]
-            original_schema = self.infer_schema_from_sql(
-                self.con_source, table_name
+            original_schema = (
+                self.infer_schema_from_sql(self.con_source, table_name)
+                if self.source_backend is None
+                else pa.schema(
+                    [
+                        pa.field(
+                            field.name, SourceBackend.to_truth_type(field.type)
+                        )
+                        for field in self.source_backend.get_table_schema(
+                            table_name
+                        )
+                    ]
+                )
             )
 
             if name == "truth":
@@ -325,7 +276,7 @@ class PMTTruthMaker:
             arrow_type = self.sql_to_arrow_type(sql_type)
             final_type = arrow_type
             fields.append(pa.field(name, final_type))
-        print(f"[INFO] Inferred schema for {table_name}: {fields}")
+        logging.info(f"Inferred schema for {table_name}: {fields}")
         return pa.schema(fields)
 
     def sql_to_arrow_type(self, sql_type: str) -> pa.DataType:
@@ -344,8 +295,8 @@ class PMTTruthMaker:
 
     # --------- NAN REPLACEMENTS ---------
     def _build_nan_replacement(self) -> None:
-        print(
-            "[INFO] Building NaN replacement values for all table schemas..."
+        logging.info(
+            "Building NaN replacement values for all table schemas..."
         )
         """
         Builds a dictionary of NaN replacement values for each table schema.
@@ -379,14 +330,16 @@ class PMTTruthMaker:
             self._nan_replacements[name] = replacement_map
 
     # --------- QUERY BUILDERS ---------
-    def _build_truth_query(self, event_no_subset: List[int]) -> str:
+    def _build_truth_query(
+        self, event_no_subset: List[int]
+    ) -> Tuple[str, Tuple[int, ...]]:
         if not event_no_subset:
             raise ValueError(
                 "event_no_subset is empty. Cannot construct a valid SQL query."
             )
 
         truth_table_name = self.table_config["truth"]["name"]
-        pulsemap_table_name = self.table_config["pulsemap"]["name"]
+        pulsemap_table_name = self.source_table
         excluded_columns = self.table_config["truth"].get(
             "excluded_columns", []
         )
@@ -399,31 +352,48 @@ class PMTTruthMaker:
 
         select_columns = ["t.event_no"] + [f"t.{col}" for col in columns]
 
+        # DOMs without string/dom_number are told apart by their position, see DOMMapper
+        dom_key = " || '-' || ".join(
+            f"s.{column}"
+            for column in DOMMapper.get_dom_key_columns(
+                [
+                    row[1]
+                    for row in self.con_source.execute(
+                        f"PRAGMA table_info({pulsemap_table_name})"
+                    )
+                ]
+            )
+        )
         select_clause = ",\n                ".join(
-            select_columns
-            + ["COUNT(DISTINCT s.string || '-' || s.dom_number) AS N_doms"]
+            select_columns + [f"COUNT(DISTINCT {dom_key}) AS N_doms"]
         )
 
-        event_filter = ",".join(map(str, event_no_subset))
+        event_condition, params = EventNoSelection(
+            self.con_source, event_no_subset
+        )("t.event_no")
 
         query = f"""
             SELECT 
                     {select_clause}
             FROM {truth_table_name} t
             JOIN {pulsemap_table_name} s ON t.event_no = s.event_no
-            WHERE t.event_no IN ({event_filter})
+            WHERE {event_condition}
             GROUP BY t.event_no
         """
 
-        print(f"\n[DEBUG] Final TRUTH SQL query:\n{query.strip()}\n")
-        return query
+        logging.debug(f"Final TRUTH SQL query:\n{query.strip()}")
+        return query, params
 
     def _build_generic_query_builder(
         self, schema_name: str, table_name: str, alias_prefix: str = None
     ):
 
-        def query_builder(event_no_subset: List[int]) -> str:
-            event_filter = ",".join(map(str, event_no_subset))
+        def query_builder(
+            event_no_subset: List[int],
+        ) -> Tuple[str, Tuple[int, ...]]:
+            event_condition, params = EventNoSelection(
+                self.con_source, event_no_subset
+            )()
             schema = self._SCHEMAS[schema_name]
             columns = [f.name for f in schema]
 
@@ -445,32 +415,68 @@ class PMTTruthMaker:
             query = f"""
                 SELECT {select_clause}
                 FROM {table_name}
-                WHERE event_no IN ({event_filter})
+                WHERE {event_condition}
             """
-            return query
+            return query, params
 
         return query_builder
 
-    def _execute_query(self, query: str) -> (List[tuple], List[str]):
+    def _read_backend_table(
+        self, schema_name: str, event_no_subset: List[int]
+    ) -> pa.Table:
+        """
+        The table _execute_query returns for the same shard, read from source_backend:
+        the truth with N_doms of the events with pulses, ordered by event_no,
+        or a trailing table with its event_no as <name>_event_no.
+        """
+        table_name = self.table_config[schema_name]["name"]
+        if schema_name == "truth":
+            excluded_columns = self.table_config["truth"].get(
+                "excluded_columns", []
+            )
+            columns = ["event_no"] + [
+                field.name
+                for field in self._SCHEMAS["truth"]
+                if field.name not in excluded_columns
+                and field.name != "event_no"
+            ]
+            table = (
+                self.source_backend.read_events(
+                    table_name, columns, event_no_subset
+                )
+                .join(
+                    self.source_backend.get_dom_counts(event_no_subset),
+                    keys="event_no",
+                    join_type="inner",
+                )
+                .sort_by("event_no")
+            )
+        else:
+            columns = self._SCHEMAS[schema_name].names
+            table = self.source_backend.read_events(
+                table_name,
+                [
+                    "event_no" if column.endswith("_event_no") else column
+                    for column in columns
+                ],
+                event_no_subset,
+            ).rename_columns(columns)
+        return table
+
+    def _execute_query(
+        self, query: str, params: Tuple, reader: ArrowResultReader
+    ) -> pa.Table:
         cursor = self.con_source.cursor()
 
         # LOG BEFORE EXECUTING to make sure it's visible even if broken
-        print(
-            f"\n[DEBUG] About to execute SQL query:\n{query.strip()}",
-            flush=True,
-        )
+        logging.debug(f"About to execute SQL query:\n{query.strip()}")
 
         try:
-            cursor.execute(query)
-            rows = cursor.fetchall()
-            columns = [desc[0] for desc in cursor.description]
-            return rows, columns
-        except sql.OperationalError as e:
-            print(
-                f"\n[ERROR] SQLite error during query:\n{query.strip()}",
-                flush=True,
-            )
-            print(f"[EXCEPTION] {e}", flush=True)
+            cursor.execute(query, params)
+            return reader.from_cursor(cursor)
+        except sql.OperationalError:
+            # the traceback carries the SQLite message
+            logging.exception(f"SQLite error during query:\n{query.strip()}")
             raise
 
     def _build_empty_table_with_defaults(
@@ -1,7 +1,7 @@
 """
 @author: cyan.jo
 Summary:
-Transforms IceCube pulsemap data into PMT-wise representations. 
+Transforms IceCube pulsemap data into PMT-wise representations.
 As of 2025.05.17, this only considers a single-PMT-at-a-single-DOM, perhaps can be extended to multi-PMTs in the future.
 The script is highly source file storage layout dependent,
 and the user is expected to provide the source layout and destination root directory.
@@ -28,8 +28,44 @@ Usage:
         dest_root="path/to/destination",
         N_events_per_shard=1000,
         summary_mode=SummaryMode.CLASSIC,
+        summary_engine=SummaryEngine.LOOP, # or SummaryEngine.SEGMENTED
+        feature_names=None, # or e.g. ["Qtotal", "T10", "T50", "T70"]
+        charge_windows=None, # or e.g. [10, 25, 50, 75, 150] for Q10, ..., Q150
+        charge_fractions=None, # or e.g. [10, 20, ..., 90] for T10, ..., T90
+        Q_adj_cut_second_round=0, # or e.g. [-0.5, 0, 0.5] to sweep the geometric features
+        memory_budget_MB=None, # or e.g. 4096 to stream each shard in chunks of whole events
+        pipelined=False, # or True to overlap reading, summarising and writing of the shards
     )
 
+summary_mode may also be a set of modes, e.g. {SummaryMode.CLASSIC, SummaryMode.SANKTHANS}:
+the pulses of each shard are read once and one shard per mode is written to dest_root/<mode>/,
+each with its own copy of the truth file.
+
+feature_names restricts the PMTfied columns to the given features.
+event_no, dom_x, dom_y, dom_z are always written as the truth table is derived from them.
+
+memory_budget_MB streams the pulses of each shard in chunks of whole events of about that size,
+and each chunk is appended to the shard's Parquet file as soon as it is summarised,
+so a few huge events no longer set the peak memory of a part.
+
+pipelined=True runs the shards of a part through ShardPipeline: a reader thread with its own
+connection fetches the pulses and source truth of shard k+1 while shard k is summarised
+and a writer thread writes shard k-1. At most prefetch_depth shards wait between two stages,
+and the wait time of each stage is logged per part.
+
+source_format=SourceFormat.PARQUET reads GraphNeT-style <table>/<table>_<part_no>.parquet files
+instead of merged_part_<part_no>.db, through ParquetBackend: the pulses of each shard are
+handed to PMTSummariser as a PulseBatch and PMTTruthMaker reads the truth tables from Parquet.
+The PMTfied shards and truth are the same as from the SQLite source of the same events.
+
+source_tables PMTfies several pulsemaps of a part in one pass, e.g. ["SRTInIcePulses", "InIcePulses"].
+The first pulsemap sets the events and their shards and the truth is made once from it,
+the shards of each pulsemap are written to dest_root/<pulsemap>/ with a single truth file in dest_root.
+Events without pulses in another pulsemap are absent from its shards.
+
+detector_prism sets the prism of post_vertex_intra_IceCube_segment, e.g.
+DetectorPrism(corners_xy, z_min, z_max), the IceCube prism by default.
+
 pmtfy_part:  processes a single database file.
 divide_and_conquer_part:  divides the event numbers into batches and processes each batch separately.
 pmtfy_shard:  processes a single shard of data.
@@ -42,7 +78,7 @@ import sqlite3 as sql
 import os
 import time
 
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
 
 import pyarrow as pa
 import pyarrow.parquet as pq
@@ -51,22 +87,52 @@ import json
 import logging
 
 from IcePack.PMTfication.PMTSummariser import PMTSummariser
+from IcePack.PMTfication.PulseBatch import PulseBatch
+from IcePack.PMTfication.MultiModeSummariser import MultiModeSummariser
 from IcePack.PMTfication.PMTTruthMaker import PMTTruthMaker
 from IcePack.PMTfication.PMTTruthFromSummary import PMTTruthFromSummary
+from IcePack.PMTfication.ShardPipeline import ShardPipeline
+from IcePack.PMTfication.SourceConnector import SourceConnector
+from IcePack.PMTfication.PulseStaging import PulseStaging
+from IcePack.PMTfication.SourceBackend import SourceBackend
+from IcePack.PMTfication.SQLiteBackend import SQLiteBackend
+from IcePack.PMTfication.ParquetBackend import ParquetBackend
+from IcePack.PMTfication.DetectorPrism import DetectorPrism
 from tabulate import tabulate
 
 from IcePack.PMTfication.Layout.SourceLayout import SourceLayout
 from IcePack.Enum.SummaryMode import SummaryMode
+from IcePack.Enum.SummaryEngine import SummaryEngine
+from IcePack.Enum.SourceFormat import SourceFormat
 
 
 class PMTfier:
+    # columns PMTTruthFromSummary needs from the PMTfied shard
+    _REQUIRED_FEATURES = ["event_no", "dom_x", "dom_y", "dom_z"]
+
     def __init__(
         self,
         source_root: str,
         source_layout: SourceLayout,  # File storage layout
         source_table_config_file: str,  # sql database table configuration
         dest_root: str,
-        summary_mode: SummaryMode = SummaryMode.CLASSIC,
+        summary_mode: Union[
+            SummaryMode, Iterable[SummaryMode]
+        ] = SummaryMode.CLASSIC,
+        summary_engine: SummaryEngine = SummaryEngine.LOOP,
+        feature_names: List[str] = None,
+        charge_windows: List[int] = None,
+        charge_fractions: List[int] = None,
+        Q_adj_cut_second_round: Union[float, List[float]] = 0,
+        memory_budget_MB: float = None,
+        pipelined: bool = False,
+        prefetch_depth: int = 2,
+        source_connector: SourceConnector = None,
+        prepare_source: bool = False,
+        staging_root: str = None,
+        source_format: SourceFormat = SourceFormat.SQLITE,
+        source_tables: List[str] = None,
+        detector_prism: DetectorPrism = None,
     ) -> None:
         self.source_root = source_root
         self.dest_root = dest_root
@@ -76,50 +142,187 @@ class PMTfier:
         self.subdir_tag = self._get_subdir_tag()
 
         self.N_events_per_shard = source_layout.get_N_events_per_shard()
-        self.summary_mode = summary_mode
+        self.summary_modes = (
+            [summary_mode]
+            if isinstance(summary_mode, SummaryMode)
+            else sorted(set(summary_mode), key=lambda m: m.index)
+        )
+        self.summary_mode = self.summary_modes[0]
+        self.summary_engine = summary_engine
+        if feature_names is not None and len(self.summary_modes) > 1:
+            raise ValueError(
+                "feature_names cannot be combined with several summary modes."
+            )
+        self.feature_names = (
+            None
+            if feature_names is None
+            else PMTfier._REQUIRED_FEATURES
+            + [f for f in feature_names if f not in PMTfier._REQUIRED_FEATURES]
+        )
+        self.charge_windows = charge_windows
+        self.charge_fractions = charge_fractions
+        self.Q_adj_cut_second_round = Q_adj_cut_second_round
+        if summary_engine == SummaryEngine.LOOP:
+            self._check_loop_options()
+        self.memory_budget_MB = memory_budget_MB
+        if pipelined and memory_budget_MB is not None:
+            raise ValueError(
+                "pipelined prefetches whole shards and cannot be combined with memory_budget_MB."
+            )
+        self.pipelined = pipelined
+        self.prefetch_depth = prefetch_depth
+        # source databases are read-only; prepare_source opts in to indexing them first
+        self.source_connector = source_connector or SourceConnector()
+        self.prepare_source = prepare_source
+        # opt-in PulseStaging of the decoded pulses under staging_root/<family>/<subdir>
+        self.staging_root = staging_root
+        self.pulse_stagings = {}
+        self.source_format = source_format
+        if prepare_source and source_format != SourceFormat.SQLITE:
+            raise ValueError("prepare_source applies to SQLite sources only.")
 
         self.table_config = self.load_table_config(source_table_config_file)
-        self.source_table = self.table_config.get("pulsemap", {}).get(
-            "name", "SRTInIcePulses"
-        )
+        # the first pulsemap sets the events and the truth
+        self.source_tables = source_tables or [
+            self.table_config.get("pulsemap", {}).get("name", "SRTInIcePulses")
+        ]
+        if len(set(self.source_tables)) != len(self.source_tables):
+            raise ValueError(f"Duplicate pulsemaps in {self.source_tables}.")
+        self.source_table = self.source_tables[0]
+        self.detector_prism = detector_prism
+        # a single pulsemap is written to dest_root, several to dest_root/<pulsemap>,
+        # and a single mode to there, several modes to <...>/<mode>
+        self.dest_roots = {
+            pulsemap: {
+                mode: os.path.join(
+                    dest_root,
+                    *([pulsemap] if len(self.source_tables) > 1 else []),
+                    *([str(mode)] if len(self.summary_modes) > 1 else []),
+                )
+                for mode in self.summary_modes
+            }
+            for pulsemap in self.source_tables
+        }
 
-    def __call__(self, part_no: int) -> None:
-        source_part_file = os.path.join(
+    def __call__(self, part_no: int, shard_range: range = None) -> pa.Table:
+        """
+        shard_range: only these shards (numbered from 1, as in the whole part),
+        e.g. range(5, 9) for PMTfied_5 to PMTfied_8. Their truth is returned
+        and not written, see PartCoordinator for the merge into truth_{part_no}.parquet.
+        """
+        return self.pmtfy_part(self.get_source_part_file(part_no), shard_range)
+
+    def get_source_part_file(self, part_no: int) -> str:
+        """the database of the part, or the Parquet file of its pulsemap"""
+        if self.source_format == SourceFormat.PARQUET:
+            return self._get_source_table_file(self.source_table, part_no)
+        return os.path.join(
             self.source_root,
             self.family,
             self.source_subdirectory,
             self.source_layout.get_db_file_name(part_no),
         )
-        self.pmtfy_part(source_part_file)
 
-    def _get_table_event_count(self, conn: sql.Connection, table: str) -> int:
-        cursor = conn.cursor()
-        cursor.execute(
-            f"CREATE INDEX IF NOT EXISTS idx_{table}_event_no ON {table}(event_no)"
+    def _get_source_table_file(self, table_name: str, part_no: int) -> str:
+        return os.path.join(
+            self.source_root,
+            self.family,
+            self.source_subdirectory,
+            self.source_layout.get_parquet_file_name(table_name, part_no),
         )
-        cursor.execute(f"SELECT COUNT(DISTINCT event_no) FROM {table}")
-        event_count = cursor.fetchone()[0]
-        return event_count
+
+    def _get_pulse_source_file(
+        self, source_part_file: str, source_table: str
+    ) -> str:
+        """the file holding the pulses of source_table"""
+        if self.source_format == SourceFormat.PARQUET:
+            return self._get_source_table_file(
+                source_table,
+                self.source_layout.extract_part_no(source_part_file),
+            )
+        return source_part_file
+
+    def open_source_backend(
+        self, source_part_file: str, source_table: str = None
+    ) -> SourceBackend:
+        """SourceBackend of a pulsemap, the first by default, to be closed by the caller"""
+        source_table = source_table or self.source_table
+        if self.source_format == SourceFormat.PARQUET:
+            part_no = self.source_layout.extract_part_no(source_part_file)
+            table_names = [
+                table["name"] for table in self.table_config.values()
+            ] + self.source_tables
+            return ParquetBackend(
+                table_files={
+                    table_name: self._get_source_table_file(
+                        table_name, part_no
+                    )
+                    for table_name in table_names
+                },
+                source_table=source_table,
+            )
+        con_source = self.source_connector(source_part_file)
+        if not SourceConnector.has_event_no_index(con_source, source_table):
+            logging.warning(
+                f"{source_table} of {source_part_file} has no event_no index, "
+                "so every shard scans the whole table: index it once with "
+                "examples/0.PrepareSource.py (or PMTfier(..., prepare_source=True))."
+            )
+        return SQLiteBackend(con_source, source_table)
+
+    def _open_source_backends(
+        self, source_part_file: str
+    ) -> Dict[str, SourceBackend]:
+        """{pulsemap: SourceBackend} of every pulsemap, the first pulsemap first"""
+        return {
+            source_table: self.open_source_backend(
+                source_part_file, source_table
+            )
+            for source_table in self.source_tables
+        }
 
     def _get_event_no_batches(
-        self, conn: sql.Connection, table: str, batch_size: int
-    ):
-        last_event_no = None
-        while True:
-            query = f"""
-            SELECT DISTINCT event_no
-            FROM {table}
-            {f"WHERE event_no > {last_event_no}" if last_event_no else ""}
-            ORDER BY event_no
-            LIMIT {batch_size}
-            """
-            cursor = conn.cursor()
-            cursor.execute(query)
-            batch = [row[0] for row in cursor.fetchall()]
-            if not batch:
-                break
-            last_event_no = batch[-1]
-            yield batch
+        self, source_backend: SourceBackend, batch_size: int
+    ) -> List[List[int]]:
+        event_nos, pulse_counts = source_backend.get_event_index()
+        logging.info(
+            f"{event_nos.shape[0]} events, {int(pulse_counts.sum())} pulses in {self.source_table}"
+            f" (at most {pulse_counts.max(initial=0)} pulses per event)"
+        )
+        return source_backend.get_event_no_batches(batch_size)
+
+    def _select_shards(
+        self, event_no_batches: List[List[int]], shard_range: range = None
+    ) -> List[Tuple[int, List[int]]]:
+        """(shard_no, event_batch) of the shards in shard_range, all if None"""
+        return [
+            (shard_no, event_batch)
+            for shard_no, event_batch in enumerate(event_no_batches, start=1)
+            if shard_range is None or shard_no in shard_range
+        ]
+
+    def _check_loop_options(self) -> None:
+        """
+        SummaryEngine.LOOP computes the fixed Q25, Q75, T10, T50 (, T70, T90) columns
+        and one geometric cut only; other columns need SummaryEngine.SEGMENTED.
+        """
+        loop_options = {
+            "charge_windows": self.charge_windows,
+            "charge_fractions": self.charge_fractions,
+            "a list of Q_adj_cut_second_round": (
+                self.Q_adj_cut_second_round
+                if isinstance(self.Q_adj_cut_second_round, (list, tuple))
+                else None
+            ),
+        }
+        unsupported = [
+            name for name, value in loop_options.items() if value is not None
+        ]
+        if unsupported:
+            raise ValueError(
+                f"{' and '.join(unsupported)} need summary_engine=SummaryEngine.SEGMENTED; "
+                "SummaryEngine.LOOP computes the fixed columns of the summary mode only."
+            )
 
     def _get_subdir_tag(self) -> int:
         if self.family not in ["Snowstorm", "Corsika"]:
@@ -165,7 +368,7 @@ class PMTfier:
             family_tag = "0"
 
         if "event_no" in pa_table.schema.names:
-            original_event_no = pa_table["event_no"]  # .cast(pa.int32())
+            original_event_no = pa_table["event_no"]
             enhanced_event_no = [
                 int(
                     f"{family_tag}{self.subdir_tag:02}{part_no:04}{event_no.as_py():08}"
@@ -178,7 +381,8 @@ class PMTfier:
             )
             pa_table = pa_table.append_column(
                 "original_event_no",
-                pa.array(original_event_no, type=pa.int32()),
+                # a safe cast: an event_no beyond int32 raises instead of wrapping
+                original_event_no.cast(pa.int32()),
             )
             pa_table = pa_table.append_column(
                 "event_no", pa.array(enhanced_event_no, type=pa.int64())
@@ -195,33 +399,24 @@ class PMTfier:
 
     def pmtfy_shard(
         self,
-        con_source: sql.Connection,
+        source_backends: Dict[str, SourceBackend],
         part_no: int,
         shard_no: int,
         truth_maker: PMTTruthMaker,
         event_batch: List[int],
     ) -> pa.Table:
-        dest_dir = os.path.join(
-            self.dest_root, self.source_subdirectory, str(part_no)
+        # the truth is derived from the first pulsemap, the others are only written
+        summary_derived_truth = self._write_pmtfied_shard(
+            source_backends[self.source_table],
+            part_no,
+            shard_no,
+            event_batch,
+            derive_truth=True,
         )
-        os.makedirs(dest_dir, exist_ok=True)
-
-        # NOTE
-        # PMTSummariser is the core class to be called for PMTfication
-        pa_pmtfied = PMTSummariser(
-            con_source=con_source,
-            source_table=self.source_table,
-            event_no_subset=event_batch,
-            summary_mode=self.summary_mode,
-        )()
-        pa_pmtfied = self._add_enhance_event_no(pa_pmtfied, part_no)
-        dest_dir = os.path.join(
-            self.dest_root, self.source_subdirectory, str(part_no)
-        )
-        pmtfied_file = os.path.join(dest_dir, f"PMTfied_{shard_no}.parquet")
-        pq.write_table(pa_pmtfied, pmtfied_file)
-
-        summary_derived_truth = PMTTruthFromSummary(pa_pmtfied)()
+        for source_table in self.source_tables[1:]:
+            self._write_pmtfied_shard(
+                source_backends[source_table], part_no, shard_no, event_batch
+            )
 
         # NOTE
         # PMT truth table for this shard is created by PMTTruthMaker and returned
@@ -236,21 +431,238 @@ class PMTfier:
 
         return pa_truth_shard
 
-    def _divide_and_conquer_part(
+    def _write_pmtfied_shard(
         self,
+        source_backend: SourceBackend,
+        part_no: int,
+        shard_no: int,
+        event_batch: List[int],
+        derive_truth: bool = False,
+    ) -> pa.Table:
+        """
+        Writes the PMTfied shard of each mode of a pulsemap,
+        and returns its summary-derived truth if derive_truth.
+        """
+        writers = {}
+        summary_derived_truths = []
+        try:
+            for pa_pmtfied_per_mode in self._iter_pmtfied_per_mode(
+                source_backend, event_batch
+            ):
+                for summary_mode, pa_pmtfied in pa_pmtfied_per_mode.items():
+                    pa_pmtfied = self._add_enhance_event_no(
+                        pa_pmtfied, part_no
+                    )
+                    if summary_mode not in writers:
+                        writers[summary_mode] = pq.ParquetWriter(
+                            self._get_pmtfied_file(
+                                summary_mode,
+                                part_no,
+                                shard_no,
+                                source_backend.source_table,
+                            ),
+                            pa_pmtfied.schema,
+                        )
+                    writers[summary_mode].write_table(pa_pmtfied)
+
+                # every mode carries event_no and the DOM positions the truth needs
+                if derive_truth:
+                    summary_derived_truths.append(
+                        PMTTruthFromSummary(pa_pmtfied)()
+                    )
+        finally:
+            for writer in writers.values():
+                writer.close()
+        if not derive_truth:
+            return None
+        return pa.concat_tables(summary_derived_truths)
+
+    def _get_pmtfied_file(
+        self,
+        summary_mode: SummaryMode,
+        part_no: int,
+        shard_no: int,
+        source_table: str = None,
+    ) -> str:
+        dest_dir = os.path.join(
+            self.dest_roots[source_table or self.source_table][summary_mode],
+            self.source_subdirectory,
+            str(part_no),
+        )
+        os.makedirs(dest_dir, exist_ok=True)
+        return os.path.join(dest_dir, f"PMTfied_{shard_no}.parquet")
+
+    def stage_part(
+        self,
+        source_part_file: str,
+        source_backends: Dict[str, SourceBackend] = None,
+    ) -> Dict[str, PulseStaging]:
+        """
+        {pulsemap: PulseStaging} of the part, built from the source if not staged yet.
+        Every pulsemap is staged in the event batches of the first one.
+        """
+        staging_dir = os.path.join(
+            self.staging_root, self.family, self.source_subdirectory
+        )
+        pulse_stagings = {
+            source_table: PulseStaging(
+                staging_dir=staging_dir,
+                source_part_file=self._get_pulse_source_file(
+                    source_part_file, source_table
+                ),
+                source_table=source_table,
+                table_config=self.table_config,
+                pulse_columns=PMTSummariser._PULSE_COLUMNS,
+            )
+            for source_table in self.source_tables
+        }
+        for pulse_staging in pulse_stagings.values():
+            if pulse_staging.exists():
+                logging.info(
+                    f"Reading staged pulses {pulse_staging.pulse_file}"
+                )
+        if all(
+            pulse_staging.exists() for pulse_staging in pulse_stagings.values()
+        ):
+            return pulse_stagings
+
+        stage_backends = source_backends or self._open_source_backends(
+            source_part_file
+        )
+        try:
+            event_no_batches = self._get_event_no_batches(
+                stage_backends[self.source_table], self.N_events_per_shard
+            )
+            for source_table, pulse_staging in pulse_stagings.items():
+                if not pulse_staging.exists():
+                    pulse_staging.build(
+                        event_no_batches,
+                        stage_backends[source_table].get_pulse_batch,
+                    )
+        finally:
+            if source_backends is None:
+                for stage_backend in stage_backends.values():
+                    stage_backend.close()
+        return pulse_stagings
+
+    def _read_pulse_batch(
+        self, source_backend: SourceBackend, event_batch: List[int]
+    ) -> PulseBatch:
+        """pulses of the shard, from the staged pulses of the part if any"""
+        pulse_staging = self.pulse_stagings.get(source_backend.source_table)
+        if pulse_staging is not None:
+            return pulse_staging.get_pulse_batch(event_batch)
+        return source_backend.get_pulse_batch(event_batch)
+
+    def _iter_pmtfied_per_mode(
+        self, source_backend: SourceBackend, event_batch: List[int]
+    ) -> Iterator[Dict[SummaryMode, pa.Table]]:
+        """
+        {summary_mode: pa.Table} of the shard, in one piece,
+        or per chunk of whole events if memory_budget_MB is set.
+        Staged pulses are a memory-mapped view and Parquet pulses are read per shard,
+        both are always summarised in one piece.
+        """
+        source_table = source_backend.source_table
+        con_source = self._get_con_source(source_backend)
+        if source_table in self.pulse_stagings or con_source is None:
+            yield self._get_pmtfied_per_mode(
+                source_table,
+                con_source,
+                event_batch,
+                self._read_pulse_batch(source_backend, event_batch),
+            )
+            return
+        # the summarisers are built once for the shard, and summarise each chunk
+        if len(self.summary_modes) == 1:
+            for pa_pmtfied in self._get_mode_summariser(
+                source_table, con_source, event_batch
+            ).iter_PMTfied_pa():
+                yield {self.summary_mode: pa_pmtfied}
+            return
+        yield from self._get_multi_mode_summariser(
+            source_table, con_source, event_batch
+        ).iter_pmtfied_per_mode()
+
+    def _get_pmtfied_per_mode(
+        self,
+        source_table: str,
+        con_source: sql.Connection,
+        event_batch: List[int],
+        pulse_batch: PulseBatch = None,
+    ) -> Dict[SummaryMode, pa.Table]:
+        if len(self.summary_modes) == 1:
+            return {
+                self.summary_mode: self._get_mode_summariser(
+                    source_table, con_source, event_batch, pulse_batch
+                )()
+            }
+        # one pulse fetch for all modes
+        return self._get_multi_mode_summariser(
+            source_table, con_source, event_batch, pulse_batch
+        )()
+
+    def _get_mode_summariser(
+        self,
+        source_table: str,
         con_source: sql.Connection,
+        event_batch: List[int],
+        pulse_batch: PulseBatch = None,
+    ) -> PMTSummariser:
+        # NOTE
+        # PMTSummariser is the core class to be called for PMTfication
+        return PMTSummariser(
+            con_source=con_source,
+            source_table=source_table,
+            event_no_subset=event_batch,
+            summary_mode=self.summary_mode,
+            summary_engine=self.summary_engine,
+            pulse_batch=pulse_batch,
+            feature_names=self.feature_names,
+            charge_windows=self.charge_windows,
+            charge_fractions=self.charge_fractions,
+            Q_adj_cut_second_round=self.Q_adj_cut_second_round,
+            memory_budget_MB=self.memory_budget_MB,
+        )
+
+    def _get_multi_mode_summariser(
+        self,
+        source_table: str,
+        con_source: sql.Connection,
+        event_batch: List[int],
+        pulse_batch: PulseBatch = None,
+    ) -> MultiModeSummariser:
+        return MultiModeSummariser(
+            con_source=con_source,
+            source_table=source_table,
+            event_no_subset=event_batch,
+            summary_modes=self.summary_modes,
+            summary_engine=self.summary_engine,
+            pulse_batch=pulse_batch,
+            charge_windows=self.charge_windows,
+            charge_fractions=self.charge_fractions,
+            Q_adj_cut_second_round=self.Q_adj_cut_second_round,
+            memory_budget_MB=self.memory_budget_MB,
+        )
+
+    def _divide_and_conquer_part(
+        self,
+        source_backends: Dict[str, SourceBackend],
         part_no: int,
         truth_maker: PMTTruthMaker,
+        shard_range: range = None,
     ) -> pa.Table:
         truth_shards = []
 
         event_no_batches = self._get_event_no_batches(
-            con_source, self.source_table, self.N_events_per_shard
+            source_backends[self.source_table], self.N_events_per_shard
         )
-        for shard_no, event_batch in enumerate(event_no_batches, start=1):
+        for shard_no, event_batch in self._select_shards(
+            event_no_batches, shard_range
+        ):
             start_time = time.time()
             pa_truth_shard = self.pmtfy_shard(
-                con_source=con_source,
+                source_backends=source_backends,
                 part_no=part_no,
                 shard_no=shard_no,
                 truth_maker=truth_maker,
@@ -267,7 +679,103 @@ class PMTfier:
 
         return pa.concat_tables(truth_shards)
 
-    def pmtfy_part(self, source_part_file: str) -> None:
+    def _divide_and_conquer_part_pipelined(
+        self,
+        source_part_file: str,
+        source_backends: Dict[str, SourceBackend],
+        part_no: int,
+        truth_maker: PMTTruthMaker,
+        shard_range: range = None,
+    ) -> pa.Table:
+        """
+        Same output as _divide_and_conquer_part, with reading, summarising and writing
+        of consecutive shards overlapped by ShardPipeline.
+        """
+        shards = self._select_shards(
+            self._get_event_no_batches(
+                source_backends[self.source_table], self.N_events_per_shard
+            ),
+            shard_range,
+        )
+
+        def read_shards():
+            # sqlite3 connections are bound to their thread
+            reader_backends = self._open_source_backends(source_part_file)
+            try:
+                reader_truth_maker = self._get_truth_maker(
+                    reader_backends[self.source_table]
+                )
+                for shard_no, event_batch in shards:
+                    pulse_batches = {
+                        source_table: self._read_pulse_batch(
+                            reader_backends[source_table], event_batch
+                        )
+                        for source_table in self.source_tables
+                    }
+                    source_truth = reader_truth_maker.get_source_truth(
+                        subdirectory_no=int(self.subdir_tag),
+                        part_no=part_no,
+                        shard_no=shard_no,
+                        event_no_subset=event_batch,
+                    )
+                    yield shard_no, event_batch, pulse_batches, source_truth
+            finally:
+                for reader_backend in reader_backends.values():
+                    reader_backend.close()
+
+        def compute_shard(shard_input):
+            shard_no, event_batch, pulse_batches, source_truth = shard_input
+            start_time = time.time()
+            pa_pmtfied_per_pulsemap = {
+                source_table: {
+                    summary_mode: self._add_enhance_event_no(
+                        pa_pmtfied, part_no
+                    )
+                    for summary_mode, pa_pmtfied in self._get_pmtfied_per_mode(
+                        source_table, None, event_batch, pulse_batch
+                    ).items()
+                }
+                for source_table, pulse_batch in pulse_batches.items()
+            }
+            # every mode carries event_no and the DOM positions the truth needs
+            summary_derived_truth = PMTTruthFromSummary(
+                pa_pmtfied_per_pulsemap[self.source_table][
+                    self.summary_modes[-1]
+                ]
+            )()
+            pa_truth_shard = self._add_enhance_event_no(
+                truth_maker.derive_truth(source_truth, summary_derived_truth),
+                part_no,
+            )
+            logging.info(
+                f"Compute time for shard {shard_no}: {time.time() - start_time:.1f}s"
+            )
+            return pa_truth_shard, (shard_no, pa_pmtfied_per_pulsemap)
+
+        def write_shard(shard_output):
+            shard_no, pa_pmtfied_per_pulsemap = shard_output
+            for (
+                source_table,
+                pa_pmtfied_per_mode,
+            ) in pa_pmtfied_per_pulsemap.items():
+                for summary_mode, pa_pmtfied in pa_pmtfied_per_mode.items():
+                    pq.write_table(
+                        pa_pmtfied,
+                        self._get_pmtfied_file(
+                            summary_mode, part_no, shard_no, source_table
+                        ),
+                    )
+
+        pipeline = ShardPipeline(prefetch_depth=self.prefetch_depth)
+        truth_shards = pipeline(
+            read=read_shards, compute=compute_shard, write=write_shard
+        )
+        pipeline.log_wait_times()
+        return pa.concat_tables(truth_shards)
+
+    def pmtfy_part(
+        self, source_part_file: str, shard_range: range = None
+    ) -> pa.Table:
         """
         the primary function that operates on a single database file.
         (1) read the event_no from the database
@@ -280,35 +788,106 @@ class PMTfier:
         (9) close the database connection
         Args:
             source_part_file (str): _description_
+            shard_range (range): only these shards; their truth is returned, not written
         """
         part_no = self.source_layout.extract_part_no(source_part_file)
         source_size_MB = self.get_file_size_MB(source_part_file)
         logging.info(f"Source part file size: {source_size_MB:.2f} MB")
 
-        con_source = sql.connect(source_part_file)
+        if self.prepare_source:
+            for source_table in self.source_tables:
+                SourceConnector.prepare(source_part_file, source_table)
+        source_backends = self._open_source_backends(source_part_file)
+        if self.staging_root is not None:
+            self.pulse_stagings = self.stage_part(
+                source_part_file, source_backends
+            )
+
+        truth_maker = self._get_truth_maker(source_backends[self.source_table])
 
-        truth_maker = PMTTruthMaker(
+        if self.pipelined:
+            consolidated_truth = self._divide_and_conquer_part_pipelined(
+                source_part_file=source_part_file,
+                source_backends=source_backends,
+                part_no=part_no,
+                truth_maker=truth_maker,
+                shard_range=shard_range,
+            )
+        else:
+            consolidated_truth = self._divide_and_conquer_part(
+                source_backends=source_backends,
+                part_no=part_no,
+                truth_maker=truth_maker,
+                shard_range=shard_range,
+            )
+        for source_backend in source_backends.values():
+            source_backend.close()
+        self.pulse_stagings = {}
+
+        if shard_range is None:
+            self.write_truth(consolidated_truth, part_no)
+        return consolidated_truth
+
+    def _get_truth_maker(self, source_backend: SourceBackend) -> PMTTruthMaker:
+        """SQLite sources join the truth in SQL, other sources through the backend"""
+        con_source = self._get_con_source(source_backend)
+        return PMTTruthMaker(
             con_source=con_source,
             table_config=self.table_config,
+            source_backend=source_backend if con_source is None else None,
+            source_table=self.source_table,
+            detector_prism=self.detector_prism,
+        )
+
+    @staticmethod
+    def _get_con_source(source_backend: SourceBackend) -> sql.Connection:
+        if isinstance(source_backend, SQLiteBackend):
+            return source_backend.con_source
+        return None
+
+    def write_truth(self, consolidated_truth: pa.Table, part_no: int) -> None:
+        if len(self.source_tables) == 1:
+            for dest_root in self.dest_roots[self.source_table].values():
+                self._write_truth_and_log_sizes(
+                    consolidated_truth, dest_root, part_no
+                )
+            return
+        # several pulsemaps share a single truth file in dest_root
+        consolidated_file = self._write_truth(
+            consolidated_truth, self.dest_root, part_no
         )
+        for dest_roots in self.dest_roots.values():
+            for dest_root in dest_roots.values():
+                self._log_sizes(dest_root, part_no, consolidated_file)
 
-        consolidated_truth = self._divide_and_conquer_part(
-            con_source=con_source, part_no=part_no, truth_maker=truth_maker
+    def _write_truth_and_log_sizes(
+        self, consolidated_truth: pa.Table, dest_root: str, part_no: int
+    ) -> None:
+        consolidated_file = self._write_truth(
+            consolidated_truth, dest_root, part_no
         )
+        self._log_sizes(dest_root, part_no, consolidated_file)
 
+    def _write_truth(
+        self, consolidated_truth: pa.Table, dest_root: str, part_no: int
+    ) -> str:
         dest_subdirectory_path = os.path.join(
-            self.dest_root, self.source_subdirectory
+            dest_root, self.source_subdirectory
         )
         os.makedirs(dest_subdirectory_path, exist_ok=True)
         consolidated_file = os.path.join(
             dest_subdirectory_path, f"truth_{part_no}.parquet"
         )
         pq.write_table(consolidated_truth, consolidated_file)
+        return consolidated_file
 
+    def _log_sizes(
+        self, dest_root: str, part_no: int, consolidated_file: str
+    ) -> None:
         truth_file_size_MB = self.get_file_size_MB(consolidated_file)
 
         dest_dir = os.path.join(
-            self.dest_root, self.source_subdirectory, str(part_no)
+            dest_root, self.source_subdirectory, str(part_no)
         )
         shard_files = [
             f
@@ -338,9 +917,7 @@ class PMTfier:
         table_str = tabulate(
             table_data, headers=["File", "Size"], tablefmt="pretty"
         )
-        logging.info(f"\n{table_str}")
-
-        con_source.close()
+        logging.info(f"{dest_dir}\n{table_str}")
 
     def get_file_size_MB(self, path):
         return os.path.getsize(path) / (1024 * 1024)
@@ -0,0 +1,182 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from typing import Dict, List, Tuple
+
+from IcePack.PMTfication.SourceBackend import SourceBackend
+from IcePack.PMTfication.PulseBatch import PulseBatch
+from IcePack.PMTfication.PMTSummariser import PMTSummariser
+from IcePack.PMTfication.DOMMapper import DOMMapper
+
+"""
+@author: cyan.jo
+Summary:
+SourceBackend of GraphNeT-style Parquet files, one file per table of a part:
+    table_files = {
+        "SRTInIcePulses": ".../SRTInIcePulses/SRTInIcePulses_<part_no>.parquet",
+        "truth": ".../truth/truth_<part_no>.parquet",
+        "GNLabel": ".../GNLabel/GNLabel_<part_no>.parquet",
+    }
+No SQLite is involved: PMTSummariser is given the PulseBatch of each shard,
+and PMTTruthMaker reads the truth tables through read_events.
+
+(1) event selection: the min/max statistics of event_no in each row group select the row
+    groups that can hold the events of a shard; only those are read, then filtered by event_no
+(2) projection: only the columns needed are read, e.g. the PMTSummariser pulse columns
+(3) threads: the column chunks of the selected row groups are decoded in parallel (use_threads)
+
+A pulsemap without string and dom_number has its DOMs identified at read time by DOMMapper.
+Files are sorted by event_no in practice, so a shard maps to a few row groups;
+unsorted files are still read correctly, from more row groups.
+
+Usage:
+    source_backend = ParquetBackend(table_files, "SRTInIcePulses")
+    pulse_batch = source_backend.get_pulse_batch(event_batch)
+"""
+
+
+class ParquetBackend(SourceBackend):
+    def __init__(
+        self,
+        table_files: Dict[str, str],
+        source_table: str,
+        use_threads: bool = True,
+    ) -> None:
+        super().__init__(source_table)
+        self.table_files = table_files
+        self.use_threads = use_threads
+        self._parquet_files = {}
+        self._row_group_ranges = {}
+        self._event_index = None
+
+        pulse_columns = self.get_table_schema(source_table).names
+        self.dom_key_columns = DOMMapper.get_dom_key_columns(pulse_columns)
+        self.dom_mapper = (
+            None if "string" in self.dom_key_columns else DOMMapper()
+        )
+        self.pulse_columns = (
+            PMTSummariser._PULSE_COLUMNS
+            if self.dom_mapper is None
+            else DOMMapper.get_source_columns(PMTSummariser._PULSE_COLUMNS)
+        )
+        missing_columns = [
+            column
+            for column in self.pulse_columns
+            if column not in pulse_columns
+        ]
+        if missing_columns:
+            raise ValueError(
+                f"{table_files[source_table]} lacks the pulse columns {missing_columns}."
+            )
+
+    def get_event_index(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._event_index is None:
+            event_no = (
+                self._get_parquet_file(self.source_table)
+                .read(columns=["event_no"], use_threads=self.use_threads)
+                .column("event_no")
+                .to_numpy()
+            )
+            self._event_index = np.unique(event_no, return_counts=True)
+        return self._event_index
+
+    def get_pulse_batch(self, event_batch: List[int]) -> PulseBatch:
+        pulses = self.read_events(
+            self.source_table, self.pulse_columns, event_batch
+        )
+        if self.dom_mapper is None:
+            return PulseBatch.from_arrow(pulses)
+        return PulseBatch.from_columns(
+            self.dom_mapper(
+                {
+                    name: pulses.column(name).to_numpy()
+                    for name in pulses.column_names
+                }
+            )
+        )
+
+    def get_table_schema(self, table_name: str) -> pa.Schema:
+        return self._get_parquet_file(table_name).schema_arrow
+
+    def read_events(
+        self, table_name: str, columns: List[str], event_batch: List[int]
+    ) -> pa.Table:
+        event_nos = np.asarray(event_batch, dtype=np.int64)
+        parquet_file = self._get_parquet_file(table_name)
+        if event_nos.shape[0] == 0:
+            return parquet_file.schema_arrow.empty_table().select(columns)
+
+        row_groups = self._select_row_groups(
+            table_name, event_nos.min(), event_nos.max()
+        )
+        table = parquet_file.read_row_groups(
+            row_groups,
+            columns=list(dict.fromkeys(["event_no", *columns])),
+            use_threads=self.use_threads,
+        )
+        is_selected = (
+            pc.and_(
+                pc.greater_equal(table["event_no"], event_nos.min()),
+                pc.less_equal(table["event_no"], event_nos.max()),
+            )
+            if event_nos.max() - event_nos.min() + 1
+            == np.unique(event_nos).shape[0]
+            else pc.is_in(table["event_no"], value_set=pa.array(event_nos))
+        )
+        return table.filter(is_selected).select(columns)
+
+    def get_dom_counts(self, event_batch: List[int]) -> pa.Table:
+        dom_columns = ["event_no", *self.dom_key_columns]
+        pulses = self.read_events(self.source_table, dom_columns, event_batch)
+        return (
+            pulses.group_by(dom_columns)
+            .aggregate([])
+            .group_by("event_no")
+            .aggregate([(self.dom_key_columns[0], "count")])
+            .rename_columns(["event_no", "N_doms"])
+        )
+
+    def close(self) -> None:
+        for parquet_file in self._parquet_files.values():
+            parquet_file.close()
+        self._parquet_files = {}
+
+    # --------- HELPERS ---------
+    def _get_parquet_file(self, table_name: str) -> pq.ParquetFile:
+        if table_name not in self._parquet_files:
+            self._parquet_files[table_name] = pq.ParquetFile(
+                self.table_files[table_name], memory_map=True
+            )
+        return self._parquet_files[table_name]
+
+    def _select_row_groups(
+        self, table_name: str, min_event_no: int, max_event_no: int
+    ) -> List[int]:
+        """row groups whose event_no statistics overlap [min_event_no, max_event_no]"""
+        if table_name not in self._row_group_ranges:
+            self._row_group_ranges[table_name] = self._get_row_group_ranges(
+                table_name
+            )
+        return [
+            row_group
+            for row_group, (low, high) in enumerate(
+                self._row_group_ranges[table_name]
+            )
+            if low is None or (low <= max_event_no and high >= min_event_no)
+        ]
+
+    def _get_row_group_ranges(self, table_name: str) -> List[Tuple]:
+        """(min, max) of event_no per row group, (None, None) without statistics"""
+        metadata = self._get_parquet_file(table_name).metadata
+        event_no_idx = metadata.schema.names.index("event_no")
+        ranges = []
+        for row_group in range(metadata.num_row_groups):
+            statistics = (
+                metadata.row_group(row_group).column(event_no_idx).statistics
+            )
+            if statistics is not None and statistics.has_min_max:
+                ranges.append((statistics.min, statistics.max))
+            else:
+                ranges.append((None, None))
+        return ranges
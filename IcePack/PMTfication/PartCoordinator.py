@@ -0,0 +1,99 @@
+import copy
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+import numpy as np
+import pyarrow as pa
+
+from IcePack.PMTfication.PMTfier import PMTfier
+from IcePack.PMTfication.SourceConnector import SourceConnector
+
+"""
+@author: cyan.jo
+Summary:
+PMTfies one part (merged_part_<part_no>.db, or its Parquet files) in n_workers processes.
+
+(1) the shards of the part are planned once from its event index, which SQLite sources also cache
+    for the workers; the source is prepared here once if PMTfier.prepare_source is set,
+    and its pulses are staged here once if PMTfier.staging_root is set
+(2) the shards are split into n_workers contiguous, disjoint shard ranges
+(3) each range is PMTfied in a worker process by PMTfier(part_no, shard_range)
+    with its own read-only connection, writing PMTfied_<shard_no>.parquet
+    under the same shard numbers as a single process would
+(4) the truth of the ranges is concatenated in shard order and written as truth_<part_no>.parquet
+
+The output is identical to PMTfier(part_no).
+
+Usage:
+    pmtfier = PMTfier(source_root, layout, table_config_file, dest_root, ...)
+    PartCoordinator(pmtfier, n_workers=8)(part_no)
+"""
+
+
+def _pmtfy_shard_range(
+    pmtfier: PMTfier, part_no: int, shard_range: range
+) -> pa.Table:
+    return pmtfier(part_no, shard_range)
+
+
+class PartCoordinator:
+    def __init__(self, pmtfier: PMTfier, n_workers: int = 1) -> None:
+        if n_workers < 1:
+            raise ValueError("n_workers must be at least 1.")
+        self.pmtfier = pmtfier
+        self.n_workers = n_workers
+
+    def __call__(self, part_no: int) -> None:
+        source_part_file = self.pmtfier.get_source_part_file(part_no)
+        if self.pmtfier.prepare_source:
+            for source_table in self.pmtfier.source_tables:
+                SourceConnector.prepare(source_part_file, source_table)
+
+        shard_ranges = self.get_shard_ranges(source_part_file)
+        if self.pmtfier.staging_root is not None:
+            # staged once here, memory-mapped by every worker
+            self.pmtfier.stage_part(source_part_file)
+        # the workers, and a single range in this process, must not prepare the source again
+        worker_pmtfier = copy.copy(self.pmtfier)
+        worker_pmtfier.prepare_source = False
+        if len(shard_ranges) <= 1:
+            worker_pmtfier.pmtfy_part(source_part_file)
+            return
+        logging.info(
+            f"Part {part_no}: shards {', '.join(f'{r.start}-{r.stop - 1}' for r in shard_ranges)} on {len(shard_ranges)} workers"
+        )
+
+        start_time = time.time()
+        with ProcessPoolExecutor(max_workers=len(shard_ranges)) as executor:
+            truth_ranges = list(
+                executor.map(
+                    _pmtfy_shard_range,
+                    [worker_pmtfier] * len(shard_ranges),
+                    [part_no] * len(shard_ranges),
+                    shard_ranges,
+                )
+            )
+        logging.info(
+            f"Part {part_no} PMTfied in {time.time() - start_time:.1f}s"
+        )
+
+        # executor.map keeps the order of shard_ranges: truth rows stay in shard order
+        self.pmtfier.write_truth(pa.concat_tables(truth_ranges), part_no)
+
+    def get_shard_ranges(self, source_part_file: str) -> List[range]:
+        """contiguous shard ranges of about equal length, at most one per worker"""
+        source_backend = self.pmtfier.open_source_backend(source_part_file)
+        try:
+            n_events = source_backend.get_event_index()[0].shape[0]
+        finally:
+            source_backend.close()
+        n_shards = -(-n_events // self.pmtfier.N_events_per_shard)
+        shard_nos = np.arange(1, n_shards + 1)
+        return [
+            range(int(chunk[0]), int(chunk[-1]) + 1)
+            for chunk in np.array_split(
+                shard_nos, min(self.n_workers, max(n_shards, 1))
+            )
+            if chunk.size > 0
+        ]
@@ -0,0 +1,470 @@
+import numpy as np
+import pyarrow as pa
+from typing import Callable, Dict, Iterator, List, Tuple, Union
+
+"""
+@author: cyan.jo
+Summary:
+Compact, CSR-style container of the pulses of a shard.
+
+Every source column is stored once as a contiguous typed array, with all pulses sorted by
+(event_no, string, dom_number, dom_time). Two offset arrays describe the nesting:
+    dom_offsets   : pulses of DOM d are rows dom_offsets[d]:dom_offsets[d + 1]
+    event_offsets : DOMs of event e are dom_offsets[event_offsets[e]:event_offsets[e + 1]]
+
+NOTE structure
+```python
+    pulse_batch.columns = {
+        "event_no": np.ndarray(n_pulses, int64),
+        "string": np.ndarray(n_pulses, int32),
+        "dom_number": np.ndarray(n_pulses, int32),
+        "dom_x": np.ndarray(n_pulses, float32),
+        ...
+    }
+    pulse_batch.dom_offsets     # (n_doms + 1,)
+    pulse_batch.event_offsets   # (n_events + 1,)
+```
+This replaces the nested event -> string -> DOM dictionary of row lists:
+no per-row or per-DOM Python objects are created, and a DOM is a slice of the columns.
+
+Usage:
+    pulse_batch = PulseBatch.from_cursor(cursor)       # after cursor.execute(query)
+    for pulse_batch in PulseBatch.iter_from_cursor(cursor, n_rows_per_fetch):
+        ...                                             # whole events, query ordered by event_no
+    pulse_batch = PulseBatch.from_arrow(pa_table)
+    for event_no, event_batch in pulse_batch.iter_events():
+        ...
+"""
+
+
+# maps the typed columns of a chunk, e.g. DOMMapper adding string and dom_number
+ColumnMapper = Callable[[Dict[str, np.ndarray]], Dict[str, np.ndarray]]
+
+
+class PulseBatch:
+    __slots__ = ("columns", "dom_offsets", "event_offsets", "dom_first_rows")
+
+    # columns not listed here are kept as float64
+    _COLUMN_DTYPES = {
+        "event_no": np.int64,
+        "string": np.int32,
+        "dom_number": np.int32,
+        "dom_x": np.float32,
+        "dom_y": np.float32,
+        "dom_z": np.float32,
+        "dom_time": np.float32,
+        "charge": np.float32,
+        "hlc": np.int8,
+        "pmt_area": np.float32,
+        "rde": np.float32,
+        "is_saturated_dom": np.int8,
+        "is_bad_dom": np.int8,
+        "is_bright_dom": np.int8,
+        "rowid": np.int64,
+    }
+    _SORT_KEYS = ("event_no", "string", "dom_number", "dom_time")
+    # optional input column: the source row of each pulse, read into dom_first_rows
+    _ROW_ID = "rowid"
+    # rows fetched and typed at a time when reading a cursor
+    _ROWS_PER_FETCH = 65536
+
+    def __init__(
+        self,
+        columns: Dict[str, np.ndarray],
+        dom_offsets: np.ndarray,
+        event_offsets: np.ndarray,
+        dom_first_rows: np.ndarray = None,
+    ) -> None:
+        """
+        Expects columns already sorted by (event_no, string, dom_number, dom_time).
+        Use the from_* constructors to build a PulseBatch from unsorted pulses.
+        dom_first_rows: the first row of each DOM in the order the pulses were read,
+        the sorted order if not given.
+        """
+        self.columns = columns
+        self.dom_offsets = dom_offsets
+        self.event_offsets = event_offsets
+        self.dom_first_rows = (
+            dom_offsets[:-1] if dom_first_rows is None else dom_first_rows
+        )
+
+    # --------- CONSTRUCTORS ---------
+    @classmethod
+    def from_columns(
+        cls, columns: Dict[str, np.ndarray], presorted: bool = False
+    ) -> "PulseBatch":
+        """
+        presorted: the columns are known to be sorted by (event_no, string, dom_number, dom_time),
+        e.g. read in the order of the sort index of a prepared source database,
+        and are not sorted again.
+        A "rowid" column (the source row of each pulse) is not kept as a column,
+        but orders the DOMs by first appearance in dom_first_rows;
+        without it, the input position of the pulses does.
+        """
+        columns = {
+            name: np.asarray(values, dtype=cls._get_dtype(name))
+            for name, values in columns.items()
+        }
+        row_ids = columns.pop(cls._ROW_ID, None)
+        event_no = columns["event_no"]
+        n_pulses = event_no.shape[0]
+        # a single event, e.g. an online alert: event_no is neither sorted nor segmented
+        is_single_event = n_pulses > 0 and event_no.min() == event_no.max()
+        sort_keys = cls._SORT_KEYS[1:] if is_single_event else cls._SORT_KEYS
+        if n_pulses > 0 and not presorted:
+            order = np.lexsort(
+                tuple(columns[key] for key in reversed(sort_keys))
+            )
+            if np.any(order != np.arange(n_pulses)):
+                columns = {
+                    name: values[order] for name, values in columns.items()
+                }
+                row_ids = order if row_ids is None else row_ids[order]
+
+        dom_offsets = cls._get_segment_offsets(
+            [columns[key] for key in sort_keys[:-1]]
+        )
+        if is_single_event:
+            event_offsets = np.array([0, dom_offsets.shape[0] - 1])
+        else:
+            event_offsets = cls._get_segment_offsets(
+                [columns["event_no"][dom_offsets[:-1]]]
+            )
+        dom_first_rows = (
+            np.minimum.reduceat(row_ids, dom_offsets[:-1])
+            if row_ids is not None and n_pulses > 0
+            else None
+        )
+        return cls(columns, dom_offsets, event_offsets, dom_first_rows)
+
+    @classmethod
+    def from_rows(
+        cls, rows: List[tuple], column_names: List[str]
+    ) -> "PulseBatch":
+        """
+        Builds the typed columns in one pass over the SQL result rows.
+        """
+        return cls.from_columns(cls._rows_to_columns(rows, column_names))
+
+    @classmethod
+    def from_cursor(
+        cls,
+        cursor,
+        n_rows_per_fetch: int = None,
+        presorted: bool = False,
+        map_columns: ColumnMapper = None,
+    ) -> "PulseBatch":
+        """
+        All rows of an executed cursor. The rows are fetched n_rows_per_fetch at a time,
+        typed right away and copied into columns grown in place,
+        so only one chunk is ever held besides the columns.
+        map_columns is applied to the typed columns of each chunk, e.g. DOMMapper.
+        """
+        column_names = [description[0] for description in cursor.description]
+        columns, n_rows, capacity = None, 0, 0
+        for chunk in cls._iter_column_chunks(
+            cursor,
+            column_names,
+            n_rows_per_fetch or cls._ROWS_PER_FETCH,
+            map_columns,
+        ):
+            n_chunk_rows = next(iter(chunk.values())).shape[0]
+            if columns is None:
+                columns = {
+                    name: np.empty(0, dtype=values.dtype)
+                    for name, values in chunk.items()
+                }
+            if n_rows + n_chunk_rows > capacity:
+                capacity = max(n_rows + n_chunk_rows, 2 * capacity)
+                cls._resize_columns(columns, capacity)
+            for name, values in chunk.items():
+                columns[name][n_rows : n_rows + n_chunk_rows] = values
+            n_rows += n_chunk_rows
+
+        if columns is None:
+            columns = {
+                name: np.empty(0, dtype=cls._get_dtype(name))
+                for name in column_names
+            }
+            if map_columns is not None:
+                columns = map_columns(columns)
+        else:
+            cls._resize_columns(columns, n_rows)
+        return cls.from_columns(columns, presorted=presorted)
+
+    @classmethod
+    def iter_from_cursor(
+        cls,
+        cursor,
+        n_rows_per_fetch: int = None,
+        presorted: bool = False,
+        map_columns: ColumnMapper = None,
+    ) -> Iterator["PulseBatch"]:
+        """
+        Streams an executed cursor ordered by event_no as PulseBatch of whole events,
+        cut at the last event boundary of each fetch of n_rows_per_fetch rows.
+        The rows of an event continuing in the next fetch are carried over,
+        so an event larger than a fetch is still yielded whole.
+        """
+        column_names = [description[0] for description in cursor.description]
+        # typed columns of the last, possibly incomplete, event, one piece per fetch
+        pending = []
+        for columns in cls._iter_column_chunks(
+            cursor,
+            column_names,
+            n_rows_per_fetch or cls._ROWS_PER_FETCH,
+            map_columns,
+        ):
+            event_no = columns["event_no"]
+            split = int(np.searchsorted(event_no, event_no[-1], side="left"))
+            if (
+                split == 0
+                and pending
+                and pending[0]["event_no"][0] == event_no[0]
+            ):
+                # the fetch continues the pending event, joined once it closes
+                pending.append(columns)
+                continue
+            pieces = pending + [
+                {name: values[:split] for name, values in columns.items()}
+            ]
+            if split > 0 or pending:
+                yield cls.from_columns(
+                    cls._concatenate_columns(pieces), presorted=presorted
+                )
+            pending = [
+                {name: values[split:] for name, values in columns.items()}
+            ]
+        if pending:
+            yield cls.from_columns(
+                cls._concatenate_columns(pending), presorted=presorted
+            )
+
+    @classmethod
+    def from_arrow(
+        cls, table: Union[pa.Table, pa.RecordBatch]
+    ) -> "PulseBatch":
+        return cls.from_columns(
+            {
+                name: cls._arrow_to_numpy(table.column(name), name)
+                for name in table.schema.names
+            }
+        )
+
+    # --------- PROPERTIES ---------
+    @property
+    def n_pulses(self) -> int:
+        return int(self.dom_offsets[-1])
+
+    @property
+    def n_doms(self) -> int:
+        return self.dom_offsets.shape[0] - 1
+
+    @property
+    def n_events(self) -> int:
+        return self.event_offsets.shape[0] - 1
+
+    @property
+    def column_names(self) -> List[str]:
+        return list(self.columns.keys())
+
+    @property
+    def dom_starts(self) -> np.ndarray:
+        return self.dom_offsets[:-1]
+
+    @property
+    def dom_counts(self) -> np.ndarray:
+        return np.diff(self.dom_offsets)
+
+    @property
+    def event_dom_starts(self) -> np.ndarray:
+        return self.event_offsets[:-1]
+
+    @property
+    def event_dom_counts(self) -> np.ndarray:
+        return np.diff(self.event_offsets)
+
+    @property
+    def event_pulse_offsets(self) -> np.ndarray:
+        return self.dom_offsets[self.event_offsets]
+
+    @property
+    def event_no(self) -> np.ndarray:
+        """event_no of each event"""
+        return self.columns["event_no"][self.event_pulse_offsets[:-1]]
+
+    @property
+    def dom_event_index(self) -> np.ndarray:
+        """index of the event each DOM belongs to"""
+        return np.repeat(np.arange(self.n_events), self.event_dom_counts)
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    def __contains__(self, column: str) -> bool:
+        return column in self.columns
+
+    def __len__(self) -> int:
+        return self.n_pulses
+
+    # --------- ACCESS ---------
+    def dom_first(self, column: str) -> np.ndarray:
+        """value of the first pulse of each DOM"""
+        return self.columns[column][self.dom_starts]
+
+    def get_read_dom_order(self) -> np.ndarray:
+        """
+        The DOMs in the order the source lists them: the events in order, within an event
+        the strings by first appearance, within a string the DOMs by first appearance.
+        The loop path visits the DOMs of an event in this order.
+        """
+        if self.n_doms == 0:
+            return np.empty(0, dtype=np.int64)
+        string_offsets = self._get_segment_offsets(
+            [self.dom_first("event_no"), self.dom_first("string")]
+        )
+        string_first_rows = np.repeat(
+            np.minimum.reduceat(self.dom_first_rows, string_offsets[:-1]),
+            np.diff(string_offsets),
+        )
+        return np.lexsort(
+            (self.dom_first_rows, string_first_rows, self.dom_event_index)
+        )
+
+    def get_pulse_first_rows(self) -> np.ndarray:
+        """dom_first_rows of the DOM of each pulse, e.g. to stage or select the pulses"""
+        return np.repeat(self.dom_first_rows, self.dom_counts)
+
+    def iter_events(self) -> Iterator[Tuple[int, "PulseBatch"]]:
+        for event_idx, event_no in enumerate(self.event_no):
+            yield int(event_no), self.slice_events(event_idx, event_idx + 1)
+
+    def slice_events(self, start: int, stop: int) -> "PulseBatch":
+        """
+        PulseBatch of the events [start, stop), sharing memory with this batch.
+        """
+        dom_start, dom_stop = (
+            self.event_offsets[start],
+            self.event_offsets[stop],
+        )
+        pulse_start = self.dom_offsets[dom_start]
+        pulse_stop = self.dom_offsets[dom_stop]
+        columns = {
+            name: values[pulse_start:pulse_stop]
+            for name, values in self.columns.items()
+        }
+        dom_offsets = self.dom_offsets[dom_start : dom_stop + 1] - pulse_start
+        event_offsets = self.event_offsets[start : stop + 1] - dom_start
+        return PulseBatch(
+            columns,
+            dom_offsets,
+            event_offsets,
+            self.dom_first_rows[dom_start:dom_stop],
+        )
+
+    def select_events(self, event_nos: List[int]) -> "PulseBatch":
+        event_mask = np.isin(self.event_no, np.asarray(event_nos))
+        pulse_mask = np.repeat(event_mask, np.diff(self.event_pulse_offsets))
+        columns = {
+            name: values[pulse_mask] for name, values in self.columns.items()
+        }
+        columns[PulseBatch._ROW_ID] = self.get_pulse_first_rows()[pulse_mask]
+        return PulseBatch.from_columns(columns)
+
+    def to_arrow(self) -> pa.Table:
+        return pa.Table.from_pydict(
+            {name: pa.array(values) for name, values in self.columns.items()}
+        )
+
+    @classmethod
+    def get_pulse_nbytes(cls, column_names: List[str]) -> int:
+        """bytes of one pulse in the typed columns"""
+        return sum(cls._get_dtype(name).itemsize for name in column_names)
+
+    # --------- HELPERS ---------
+    @classmethod
+    def _iter_column_chunks(
+        cls,
+        cursor,
+        column_names: List[str],
+        n_rows_per_fetch: int,
+        map_columns: ColumnMapper = None,
+    ) -> Iterator[Dict[str, np.ndarray]]:
+        while True:
+            rows = cursor.fetchmany(n_rows_per_fetch)
+            if not rows:
+                return
+            columns = cls._rows_to_columns(rows, column_names)
+            yield columns if map_columns is None else map_columns(columns)
+
+    @staticmethod
+    def _resize_columns(columns: Dict[str, np.ndarray], n_rows: int) -> None:
+        """
+        in place: a large array is grown by realloc (mremap), without a second copy
+        of the columns held so far
+        """
+        for values in columns.values():
+            values.resize(n_rows, refcheck=False)
+
+    @staticmethod
+    def _concatenate_columns(
+        pieces: List[Dict[str, np.ndarray]],
+    ) -> Dict[str, np.ndarray]:
+        if len(pieces) == 1:
+            return pieces[0]
+        return {
+            name: np.concatenate([piece[name] for piece in pieces])
+            for name in pieces[0]
+        }
+
+    @classmethod
+    def _rows_to_columns(
+        cls, rows: List[tuple], column_names: List[str]
+    ) -> Dict[str, np.ndarray]:
+        structured_dtype = np.dtype(
+            [(name, cls._get_dtype(name)) for name in column_names]
+        )
+        try:
+            records = np.array(rows, dtype=structured_dtype)
+        except (TypeError, ValueError):
+            # NULL entries, e.g. string/dom_number not yet assigned
+            records = np.array(rows, dtype=np.float64).reshape(
+                -1, len(column_names)
+            )
+            return {
+                name: cls._fill_nan(records[:, idx], cls._get_dtype(name))
+                for idx, name in enumerate(column_names)
+            }
+        # contiguous copies, so the record array of the chunk is freed
+        return {
+            name: np.ascontiguousarray(records[name]) for name in column_names
+        }
+
+    @classmethod
+    def _arrow_to_numpy(
+        cls, column: Union[pa.Array, pa.ChunkedArray], name: str
+    ) -> np.ndarray:
+        """copies where needed, e.g. bool columns; NULL entries as in _rows_to_columns"""
+        if column.null_count > 0:
+            values = column.cast(pa.float64()).to_numpy(zero_copy_only=False)
+            return cls._fill_nan(values, cls._get_dtype(name))
+        return column.to_numpy(zero_copy_only=False)
+
+    @classmethod
+    def _get_dtype(cls, column: str) -> np.dtype:
+        return np.dtype(cls._COLUMN_DTYPES.get(column, np.float64))
+
+    @staticmethod
+    def _fill_nan(values: np.ndarray, dtype: np.dtype) -> np.ndarray:
+        if np.issubdtype(dtype, np.integer):
+            values = np.where(np.isnan(values), -1, values)
+        return values.astype(dtype)
+
+    @staticmethod
+    def _get_segment_offsets(keys: List[np.ndarray]) -> np.ndarray:
+        n = keys[0].shape[0]
+        is_new_segment = np.zeros(n, dtype=bool)
+        is_new_segment[:1] = True
+        for values in keys:
+            is_new_segment[1:] |= values[1:] != values[:-1]
+        return np.append(np.flatnonzero(is_new_segment), n)
@@ -0,0 +1,210 @@
+import os
+import glob
+import json
+import hashlib
+import logging
+import numpy as np
+import pyarrow as pa
+from typing import Callable, List
+
+from IcePack.PMTfication.PulseBatch import PulseBatch
+
+"""
+@author: cyan.jo
+Summary:
+Opt-in staging cache of the decoded pulses of a part, so that reruns,
+e.g. with another SummaryMode or threshold, skip SQLite.
+
+The pulses of a pulsemap are staged as read for PMTSummariser, after the string/dom_number
+assignment, sorted by (event_no, string, dom_number, dom_time), in two Arrow IPC files:
+    <staging_dir>/<db file>.<pulsemap>.<key>.pulses.arrow  : the pulse columns and the rowid (first source row
+                                                             of the pulse's DOM), one record batch per shard
+    <staging_dir>/<db file>.<pulsemap>.<key>.events.arrow  : event_no, pulse_start, pulse_count per event
+Later runs memory-map them: the PulseBatch of a shard is a zero-copy slice of the pulses file.
+
+The key is a hash of the source database (absolute path, size, modification time),
+the table config and the pulse columns, so a changed source or config is staged anew
+and the stale files of the same database and pulsemap are removed.
+A checksum of the content would read the whole multi-GB database on every run,
+which is what the cache is there to avoid.
+
+Usage:
+    pulse_staging = PulseStaging(staging_dir, source_part_file, source_table, table_config, pulse_columns)
+    if not pulse_staging.exists():
+        pulse_staging.build(event_no_batches, read_pulse_batch)   # read_pulse_batch(event_batch) -> PulseBatch
+    pulse_batch = pulse_staging.get_pulse_batch(event_batch)
+"""
+
+
+class PulseStaging:
+    def __init__(
+        self,
+        staging_dir: str,
+        source_part_file: str,
+        source_table: str,
+        table_config: dict,
+        pulse_columns: List[str],
+    ) -> None:
+        self.staging_dir = staging_dir
+        # the first row of each pulse's DOM keeps the source order of the DOMs
+        self.pulse_columns = list(pulse_columns) + [PulseBatch._ROW_ID]
+        self.source_name = os.path.basename(source_part_file)
+        self.source_table = source_table
+        self.key = self._get_key(source_part_file, table_config)
+        stem = os.path.join(
+            staging_dir, f"{self.source_name}.{source_table}.{self.key}"
+        )
+        self.pulse_file = f"{stem}.pulses.arrow"
+        self.event_file = f"{stem}.events.arrow"
+        self.schema = pa.schema(
+            [
+                (name, pa.from_numpy_dtype(PulseBatch._get_dtype(name)))
+                for name in self.pulse_columns
+            ]
+        )
+        self._pulses = None
+        self._event_nos = None
+        self._pulse_starts = None
+        self._pulse_counts = None
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.pulse_file) and os.path.isfile(
+            self.event_file
+        )
+
+    def build(
+        self,
+        event_no_batches: List[List[int]],
+        read_pulse_batch: Callable[[List[int]], PulseBatch],
+    ) -> None:
+        """
+        Stages the pulses of every event batch, read by read_pulse_batch.
+        Files are written under a temporary name and moved in place when complete.
+        """
+        os.makedirs(self.staging_dir, exist_ok=True)
+        event_nos, pulse_counts = [], []
+        tmp_pulse_file = f"{self.pulse_file}.{os.getpid()}.tmp"
+        tmp_event_file = f"{self.event_file}.{os.getpid()}.tmp"
+        with pa.OSFile(tmp_pulse_file, "wb") as sink:
+            with pa.ipc.new_file(sink, self.schema) as writer:
+                for event_batch in event_no_batches:
+                    pulse_batch = read_pulse_batch(event_batch)
+                    writer.write_table(
+                        pa.Table.from_arrays(
+                            [
+                                pa.array(pulse_batch[name])
+                                for name in self.pulse_columns[:-1]
+                            ]
+                            + [pa.array(pulse_batch.get_pulse_first_rows())],
+                            schema=self.schema,
+                        )
+                    )
+                    event_nos.append(pulse_batch.event_no)
+                    pulse_counts.append(
+                        np.diff(pulse_batch.event_pulse_offsets)
+                    )
+
+        event_nos = np.concatenate(event_nos or [np.empty(0, np.int64)])
+        pulse_counts = np.concatenate(
+            pulse_counts or [np.empty(0, np.int64)]
+        ).astype(np.int64)
+        pulse_starts = np.concatenate(([0], np.cumsum(pulse_counts)[:-1]))
+        event_table = pa.table(
+            {
+                "event_no": pa.array(event_nos, type=pa.int64()),
+                "pulse_start": pa.array(pulse_starts, type=pa.int64()),
+                "pulse_count": pa.array(pulse_counts, type=pa.int64()),
+            }
+        )
+        with pa.OSFile(tmp_event_file, "wb") as sink:
+            with pa.ipc.new_file(sink, event_table.schema) as writer:
+                writer.write_table(event_table)
+
+        os.replace(tmp_pulse_file, self.pulse_file)
+        os.replace(tmp_event_file, self.event_file)
+        self._remove_stale_files()
+        logging.info(
+            f"Staged {event_nos.shape[0]} events, {int(pulse_counts.sum())} pulses of {self.source_name} {self.source_table} in {self.pulse_file}"
+        )
+
+    def get_pulse_batch(self, event_batch: List[int]) -> PulseBatch:
+        """PulseBatch of the staged events of event_batch, read from the memory map"""
+        self._open()
+        event_batch = np.asarray(event_batch, dtype=np.int64)
+        event_idx = np.searchsorted(self._event_nos, event_batch)
+        event_idx = event_idx[event_idx < self._event_nos.shape[0]]
+        event_idx = np.unique(
+            event_idx[np.isin(self._event_nos[event_idx], event_batch)]
+        )
+
+        if event_idx.shape[0] > 0 and np.all(np.diff(event_idx) == 1):
+            # consecutive events, e.g. a shard: a zero-copy slice
+            start = self._pulse_starts[event_idx[0]]
+            stop = (
+                self._pulse_starts[event_idx[-1]]
+                + self._pulse_counts[event_idx[-1]]
+            )
+            pulses = self._pulses.slice(start, stop - start)
+        else:
+            pulses = self._pulses.take(
+                self._get_pulse_rows(
+                    self._pulse_starts[event_idx],
+                    self._pulse_counts[event_idx],
+                )
+            )
+        return PulseBatch.from_columns(
+            {
+                name: pulses.column(name).to_numpy()
+                for name in self.pulse_columns
+            },
+            presorted=True,
+        )
+
+    # --------- HELPERS ---------
+    def _open(self) -> None:
+        if self._pulses is not None:
+            return
+        self._pulses = pa.ipc.open_file(
+            pa.memory_map(self.pulse_file, "r")
+        ).read_all()
+        events = pa.ipc.open_file(
+            pa.memory_map(self.event_file, "r")
+        ).read_all()
+        self._event_nos = events.column("event_no").to_numpy()
+        self._pulse_starts = events.column("pulse_start").to_numpy()
+        self._pulse_counts = events.column("pulse_count").to_numpy()
+
+    def _get_key(self, source_part_file: str, table_config: dict) -> str:
+        source_stat = os.stat(source_part_file)
+        fingerprint = json.dumps(
+            {
+                "source": os.path.abspath(source_part_file),
+                "size": source_stat.st_size,
+                "mtime_ns": source_stat.st_mtime_ns,
+                "table_config": table_config,
+                "pulse_columns": self.pulse_columns,
+            },
+            sort_keys=True,
+        )
+        return hashlib.blake2b(fingerprint.encode(), digest_size=8).hexdigest()
+
+    def _remove_stale_files(self) -> None:
+        for staged_file in glob.glob(
+            os.path.join(
+                glob.escape(self.staging_dir),
+                f"{glob.escape(self.source_name)}.{glob.escape(self.source_table)}.*.arrow",
+            )
+        ):
+            if staged_file not in (self.pulse_file, self.event_file):
+                os.remove(staged_file)
+
+    @staticmethod
+    def _get_pulse_rows(
+        pulse_starts: np.ndarray, pulse_counts: np.ndarray
+    ) -> np.ndarray:
+        """row indices of the pulses of the given events"""
+        total = int(pulse_counts.sum())
+        event_offsets = np.concatenate(([0], np.cumsum(pulse_counts)))
+        return np.repeat(
+            pulse_starts - event_offsets[:-1], pulse_counts
+        ) + np.arange(total)
@@ -0,0 +1,111 @@
+import numpy as np
+import pyarrow as pa
+import sqlite3 as sql
+from typing import List, Tuple
+
+from IcePack.PMTfication.SourceBackend import SourceBackend
+from IcePack.PMTfication.PulseBatch import PulseBatch
+from IcePack.PMTfication.EventIndex import EventIndex
+from IcePack.PMTfication.EventNoSelection import EventNoSelection
+from IcePack.PMTfication.PMTSummariser import PMTSummariser
+from IcePack.PMTfication.DOMMapper import DOMMapper
+from IcePack.Enum.SummaryMode import SummaryMode
+
+"""
+@author: cyan.jo
+Summary:
+SourceBackend of a merged_part_<part_no>.db, on a (read-only) connection from SourceConnector.
+The event index is the cached EventIndex, the pulses are read as by PMTSummariser,
+and the tables are selected with EventNoSelection.
+PMTfier still hands the connection itself to PMTSummariser and PMTTruthMaker,
+which stream the pulses (memory_budget_MB) and join the truth in SQL.
+
+Usage:
+    source_backend = SQLiteBackend(source_connector(source_part_file), "SRTInIcePulses")
+"""
+
+
+class SQLiteBackend(SourceBackend):
+    def __init__(self, con_source: sql.Connection, source_table: str) -> None:
+        super().__init__(source_table)
+        self.con_source = con_source
+        self._event_index = None
+
+    def get_event_index(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._event_index is None:
+            self._event_index = EventIndex(self.con_source, self.source_table)
+        return self._event_index.event_nos, self._event_index.pulse_counts
+
+    def get_pulse_batch(self, event_batch: List[int]) -> PulseBatch:
+        return PMTSummariser(
+            con_source=self.con_source,
+            source_table=self.source_table,
+            event_no_subset=event_batch,
+            summary_mode=SummaryMode.CLASSIC,
+        )._get_pulse_batch()
+
+    def get_table_schema(self, table_name: str) -> pa.Schema:
+        cursor = self.con_source.cursor()
+        cursor.execute(f"PRAGMA table_info({table_name})")
+        # each row: (cid, name, type, notnull, dflt_value, pk)
+        return pa.schema(
+            [
+                pa.field(name, self._get_declared_type(sql_type))
+                for _, name, sql_type, *_ in cursor.fetchall()
+            ]
+        )
+
+    def read_events(
+        self, table_name: str, columns: List[str], event_batch: List[int]
+    ) -> pa.Table:
+        event_condition, params = EventNoSelection(
+            self.con_source, event_batch
+        )()
+        cursor = self.con_source.cursor()
+        cursor.execute(
+            f"SELECT {', '.join(columns)} FROM {table_name} WHERE {event_condition}",
+            params,
+        )
+        return self._rows_to_table(cursor.fetchall(), columns)
+
+    def get_dom_counts(self, event_batch: List[int]) -> pa.Table:
+        event_condition, params = EventNoSelection(
+            self.con_source, event_batch
+        )()
+        dom_key = " || '-' || ".join(
+            DOMMapper.get_dom_key_columns(
+                self.get_table_schema(self.source_table).names
+            )
+        )
+        cursor = self.con_source.cursor()
+        cursor.execute(
+            f"""SELECT event_no, COUNT(DISTINCT {dom_key})
+                FROM {self.source_table}
+                WHERE {event_condition}
+                GROUP BY event_no
+            """,
+            params,
+        )
+        return self._rows_to_table(cursor.fetchall(), ["event_no", "N_doms"])
+
+    def close(self) -> None:
+        self.con_source.close()
+
+    # --------- HELPERS ---------
+    @staticmethod
+    def _rows_to_table(rows: List[tuple], columns: List[str]) -> pa.Table:
+        return pa.table(
+            {
+                column: [row[idx] for row in rows]
+                for idx, column in enumerate(columns)
+            }
+        )
+
+    @staticmethod
+    def _get_declared_type(sql_type: str) -> pa.DataType:
+        sql_type = sql_type.lower()
+        if "int" in sql_type:
+            return pa.int64()
+        if "float" in sql_type or "real" in sql_type or "double" in sql_type:
+            return pa.float64()
+        return pa.string()
@@ -0,0 +1,934 @@
+import numpy as np
+from typing import Dict, Iterator, List, Tuple
+
+from IcePack.PMTfication.PulseBatch import PulseBatch
+from IcePack.PMTfication.BatchedEventGeometry import BatchedEventGeometry
+from IcePack.PMTfication.FeatureRegistry import FeatureContext, FeatureRegistry
+
+"""
+@author: cyan.jo
+Summary:
+Vectorised alternative to the event -> string -> DOM loop of PMTSummariser.
+
+All pulses of a shard are sorted once by (event_no, string, dom_number, dom_time) in a PulseBatch.
+The sorted pulses form contiguous DOM segments, and the DOM segments form contiguous
+event segments. Every per-DOM feature is then a segmented NumPy reduction:
+    - np.add/maximum/minimum.reduceat over the DOM segment offsets
+    - segmented cumulative sums, restarted at every DOM and accumulated in the pulse dtype
+    - segmented sums that replay the pairwise summation of np.sum (_get_segmented_sum)
+    - first-N gathers with a validity mask for q1.., hlc1.., t1..
+
+Features and the intermediates they share are declared in a FeatureRegistry (see FeatureRegistry.py).
+The engine computes exactly the requested feature_names, in any order and any combination,
+and every intermediate (cumulated charge, time offsets, top-charge indices, half-time masks, ...)
+at most once per PulseBatch.
+
+Charge windows and charge fractions are families of features:
+    Q{N} : charge accumulated within N ns after the first pulse, e.g. Q10, Q25, Q50, Q75, Q150
+    T{N} : time elapsed until N % of the total charge is reached, e.g. T10, T20, ..., T90
+All requested windows/fractions are found with a single batched per-DOM binary search
+(_get_segmented_searchsorted), so a longer list costs a few more gathers rather than another pass.
+
+NOTE
+Charges stay float32 and are summed in the order of the loop path: np.cumsum per DOM for T{N},
+np.sum of the pulse prefix for Q{N}, Qtotal and Q_halftime. A charge fraction that lands exactly
+on a cumulated charge (e.g. two equal pulses and T50) then selects the same pulse in both engines.
+
+The column names and -1 fill values are those of PMTSummariser._build_schema.
+The event-wise geometric features (eccentricity_PCA, aspect_contrast_PCA, hypotenuse)
+are computed for all events at once on the high-charge DOMs (see BatchedEventGeometry.py).
+The unsuffixed columns use Q_adj_cut_second_round. A sweep over DOM charge thresholds
+10 ** (Q_adj_cut + 2) is requested with suffixed columns, e.g. hypotenuse_Qcut0, hypotenuse_Qcut0.5;
+all thresholds share the DOM charge totals and one batched geometry call.
+
+NOTE pulses are given as a PulseBatch (see PulseBatch.py)
+"""
+
+_FILL_INCOMPLETE = -1
+# padded blocks of segments up to this many values are built at once
+_MAX_PADDED_SIZE = 1 << 16
+
+_REGISTRY = FeatureRegistry()
+
+# families indexed by the first pulses, bounded by n_pulse_collect
+_PULSE_FAMILIES = ("q{i}", "hlc{i}", "t{i}")
+
+_GEOMETRY_FEATURES = ("eccentricity_PCA", "aspect_contrast_PCA", "hypotenuse")
+_GEOMETRY_FAMILIES = tuple(f"{name}_Qcut{{x}}" for name in _GEOMETRY_FEATURES)
+
+
+class SegmentedFeatureEngine:
+    def __init__(
+        self,
+        feature_names: List[str],
+        n_pulse_collect: int,
+        Q_adj_cut_second_round: float = 0,
+    ) -> None:
+        self.feature_names = list(feature_names)
+        self.n_pulse_collect = n_pulse_collect
+        self.Q_adj_cut_second_round = Q_adj_cut_second_round
+        self.event_geometry = BatchedEventGeometry()
+
+        unknown = [
+            name for name in self.feature_names if name not in _REGISTRY
+        ]
+        if unknown:
+            raise ValueError(f"Unknown features: {unknown}")
+        beyond_collect = [
+            name
+            for name in self.feature_names
+            if _REGISTRY.get_family(name) in _PULSE_FAMILIES
+            and _REGISTRY.get_parameter(name) > n_pulse_collect
+        ]
+        if beyond_collect:
+            raise ValueError(
+                f"{beyond_collect} exceed n_pulse_collect={n_pulse_collect}."
+            )
+
+        self.charge_windows = self._get_family_parameters("Q{i}")
+        self.charge_fractions = self._get_family_parameters("T{i}")
+        if any(fraction >= 100 for fraction in self.charge_fractions):
+            raise ValueError(
+                f"Charge fractions must be below 100%: {self.charge_fractions}"
+            )
+
+        # Q_adj_cut_second_round serves the unsuffixed geometric features
+        self.Q_adj_cuts = set()
+        for family in _GEOMETRY_FAMILIES:
+            self.Q_adj_cuts.update(self._get_family_parameters(family))
+        if any(name in self.feature_names for name in _GEOMETRY_FEATURES):
+            self.Q_adj_cuts.add(float(Q_adj_cut_second_round))
+        self.Q_adj_cuts = sorted(self.Q_adj_cuts)
+
+        # resolved once, so that a call does no registry lookups
+        self._intermediates = _REGISTRY.get_intermediates(self.feature_names)
+        self._resolved_features = [
+            (name, *_REGISTRY.resolve(name)) for name in self.feature_names
+        ]
+
+    def __call__(self, pulse_batch: PulseBatch) -> Dict[str, np.ndarray]:
+        context = FeatureContext(_REGISTRY, self, pulse_batch)
+        context.prepare(self._intermediates)
+        return {
+            name: _REGISTRY.compute_resolved(function, parameter, context)
+            for name, function, parameter in self._resolved_features
+        }
+
+    @staticmethod
+    def get_feature_names(n_pulse_collect: int) -> List[str]:
+        return _REGISTRY.get_feature_names(n_pulse_collect)
+
+    @staticmethod
+    def is_available(feature_name: str) -> bool:
+        return feature_name in _REGISTRY
+
+    @staticmethod
+    def get_Q_adj_cut_suffix(Q_adj_cut: float) -> str:
+        """e.g. 0 -> "_Qcut0", 0.5 -> "_Qcut0.5", for hypotenuse_Qcut0.5"""
+        return f"_Qcut{Q_adj_cut:g}"
+
+    def _get_family_parameters(self, family: str) -> List[float]:
+        return sorted(
+            {
+                _REGISTRY.get_parameter(name)
+                for name in self.feature_names
+                if _REGISTRY.get_family(name) == family
+            }
+        )
+
+    # --------- INTERMEDIATES ---------
+    @_REGISTRY.intermediate("times")
+    def _times(self, context: FeatureContext) -> np.ndarray:
+        return context.pulse_batch["dom_time"]
+
+    @_REGISTRY.intermediate("charges")
+    def _charges(self, context: FeatureContext) -> np.ndarray:
+        return context.pulse_batch["charge"]
+
+    @_REGISTRY.intermediate("Q_total", requires=("charges",))
+    def _Q_total(self, context: FeatureContext) -> np.ndarray:
+        return self._get_segmented_sum(
+            context["charges"], context.dom_starts, context.dom_counts
+        )
+
+    @_REGISTRY.intermediate("dom_event_index")
+    def _dom_event_index(self, context: FeatureContext) -> np.ndarray:
+        return context.pulse_batch.dom_event_index
+
+    @_REGISTRY.intermediate("read_dom_order")
+    def _read_dom_order(self, context: FeatureContext) -> np.ndarray:
+        return context.pulse_batch.get_read_dom_order()
+
+    @_REGISTRY.intermediate("dom_position")
+    def _dom_position(self, context: FeatureContext) -> np.ndarray:
+        return np.column_stack(
+            [
+                context.pulse_batch.dom_first(c)
+                for c in ("dom_x", "dom_y", "dom_z")
+            ]
+        )
+
+    @_REGISTRY.intermediate(
+        "relative_dom_position",
+        requires=(
+            "dom_position",
+            "dom_event_index",
+            "Q_total",
+            "read_dom_order",
+        ),
+    )
+    def _relative_dom_position(self, context: FeatureContext) -> np.ndarray:
+        avg_dom_position = self._get_Q_weighted_DOM_position(
+            context.pulse_batch,
+            context["Q_total"],
+            context.dom_starts,
+            context.dom_counts,
+            context["read_dom_order"],
+        )
+        return (
+            context["dom_position"]
+            - avg_dom_position[context["dom_event_index"]]
+        )
+
+    @_REGISTRY.intermediate("time_offsets", requires=("times",))
+    def _time_offsets(self, context: FeatureContext) -> np.ndarray:
+        times = context["times"]
+        return times - np.repeat(times[context.dom_starts], context.dom_counts)
+
+    @_REGISTRY.intermediate("cumulated_charge", requires=("charges",))
+    def _cumulated_charge(self, context: FeatureContext) -> np.ndarray:
+        return self._get_segmented_cumsum(
+            context["charges"], context.dom_starts, context.dom_counts
+        )
+
+    @_REGISTRY.intermediate(
+        "charge_windows", requires=("time_offsets", "charges")
+    )
+    def _charge_windows(self, context: FeatureContext) -> np.ndarray:
+        return self._get_accumulated_charge_after_ns(
+            context["time_offsets"],
+            context["charges"],
+            context.dom_starts,
+            context.dom_counts,
+            self.charge_windows,
+        )
+
+    @_REGISTRY.intermediate(
+        "charge_fraction_times",
+        requires=("times", "cumulated_charge", "Q_total"),
+    )
+    def _charge_fraction_times(self, context: FeatureContext) -> np.ndarray:
+        return self._get_elapsed_time_until_charge_fraction(
+            context["times"],
+            context["cumulated_charge"],
+            context["Q_total"],
+            context.dom_starts,
+            context.dom_counts,
+            self.charge_fractions,
+        )
+
+    @_REGISTRY.intermediate("first_charges")
+    def _first_charges(self, context: FeatureContext) -> np.ndarray:
+        return self._gather_first_n(
+            context.pulse_batch["charge"],
+            context.dom_starts,
+            context.dom_counts,
+        )
+
+    @_REGISTRY.intermediate("first_hlcs")
+    def _first_hlcs(self, context: FeatureContext) -> np.ndarray:
+        return self._gather_first_n(
+            context.pulse_batch["hlc"], context.dom_starts, context.dom_counts
+        )
+
+    @_REGISTRY.intermediate("first_times", requires=("times",))
+    def _first_times(self, context: FeatureContext) -> np.ndarray:
+        return self._gather_first_n(
+            context["times"], context.dom_starts, context.dom_counts
+        )
+
+    @_REGISTRY.intermediate("top_charge_indices")
+    def _top_charge_indices(self, context: FeatureContext) -> np.ndarray:
+        return self._get_top_charge_indices(
+            context.pulse_batch["charge"],
+            context.dom_starts,
+            context.dom_counts,
+        )
+
+    @_REGISTRY.intermediate("half_time_masks", requires=("times",))
+    def _half_time_masks(
+        self, context: FeatureContext
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        return self._get_half_time_masks(
+            context["times"], context.dom_starts, context.dom_counts
+        )
+
+    @_REGISTRY.intermediate("max_charge_bottom", requires=("half_time_masks",))
+    def _max_charge_bottom(
+        self, context: FeatureContext
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        _, bottom_half_mask = context["half_time_masks"]
+        return self._get_max_charge_in_mask(
+            context.pulse_batch["charge"], bottom_half_mask, context.dom_starts
+        )
+
+    @_REGISTRY.intermediate(
+        "event_geometry",
+        requires=("Q_total", "dom_event_index", "read_dom_order"),
+    )
+    def _event_geometry(
+        self, context: FeatureContext
+    ) -> Dict[float, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        return self._get_second_round_event_wise_features(
+            context.pulse_batch,
+            context.dom_starts,
+            context["Q_total"],
+            context["dom_event_index"],
+            context["read_dom_order"],
+            context.n_events,
+            self.Q_adj_cuts,
+        )
+
+    # --------- FEATURES ---------
+    @_REGISTRY.feature("event_no")
+    def _event_no(self, context: FeatureContext) -> np.ndarray:
+        return context.pulse_batch.dom_first("event_no")
+
+    @_REGISTRY.feature("dom_x", requires=("dom_position",))
+    def _dom_x(self, context: FeatureContext) -> np.ndarray:
+        return context["dom_position"][:, 0]
+
+    @_REGISTRY.feature("dom_y", requires=("dom_position",))
+    def _dom_y(self, context: FeatureContext) -> np.ndarray:
+        return context["dom_position"][:, 1]
+
+    @_REGISTRY.feature("dom_z", requires=("dom_position",))
+    def _dom_z(self, context: FeatureContext) -> np.ndarray:
+        return context["dom_position"][:, 2]
+
+    @_REGISTRY.feature("dom_x_rel", requires=("relative_dom_position",))
+    def _dom_x_rel(self, context: FeatureContext) -> np.ndarray:
+        return context["relative_dom_position"][:, 0]
+
+    @_REGISTRY.feature("dom_y_rel", requires=("relative_dom_position",))
+    def _dom_y_rel(self, context: FeatureContext) -> np.ndarray:
+        return context["relative_dom_position"][:, 1]
+
+    @_REGISTRY.feature("dom_z_rel", requires=("relative_dom_position",))
+    def _dom_z_rel(self, context: FeatureContext) -> np.ndarray:
+        return context["relative_dom_position"][:, 2]
+
+    @_REGISTRY.feature("pmt_area")
+    def _pmt_area(self, context: FeatureContext) -> np.ndarray:
+        return context.pulse_batch.dom_first("pmt_area")
+
+    @_REGISTRY.feature("rde")
+    def _rde(self, context: FeatureContext) -> np.ndarray:
+        return context.pulse_batch.dom_first("rde")
+
+    @_REGISTRY.feature("saturation_status")
+    def _saturation_status(self, context: FeatureContext) -> np.ndarray:
+        return context.pulse_batch.dom_first("is_saturated_dom")
+
+    @_REGISTRY.feature("bad_dom_status")
+    def _bad_dom_status(self, context: FeatureContext) -> np.ndarray:
+        return context.pulse_batch.dom_first("is_bad_dom")
+
+    @_REGISTRY.feature("bright_dom_status")
+    def _bright_dom_status(self, context: FeatureContext) -> np.ndarray:
+        return context.pulse_batch.dom_first("is_bright_dom")
+
+    @_REGISTRY.feature("q{i}", requires=("first_charges",))
+    def _q_i(self, context: FeatureContext, i: int) -> np.ndarray:
+        return context["first_charges"][:, i - 1]
+
+    @_REGISTRY.feature("hlc{i}", requires=("first_hlcs",))
+    def _hlc_i(self, context: FeatureContext, i: int) -> np.ndarray:
+        return context["first_hlcs"][:, i - 1]
+
+    @_REGISTRY.feature("t{i}", requires=("first_times",))
+    def _t_i(self, context: FeatureContext, i: int) -> np.ndarray:
+        return context["first_times"][:, i - 1]
+
+    @_REGISTRY.feature("Q{i}", requires=("charge_windows",))
+    def _Q_i(self, context: FeatureContext, interval: int) -> np.ndarray:
+        return context["charge_windows"][
+            :, self.charge_windows.index(interval)
+        ]
+
+    @_REGISTRY.feature("Qtotal", requires=("Q_total",))
+    def _Qtotal(self, context: FeatureContext) -> np.ndarray:
+        return context["Q_total"]
+
+    @_REGISTRY.feature("T{i}", requires=("charge_fraction_times",))
+    def _T_i(self, context: FeatureContext, percentile: int) -> np.ndarray:
+        return context["charge_fraction_times"][
+            :, self.charge_fractions.index(percentile)
+        ]
+
+    @_REGISTRY.feature("sigmaT", requires=("times",))
+    def _sigmaT(self, context: FeatureContext) -> np.ndarray:
+        return self._get_time_standard_deviation(
+            context["times"], context.dom_starts, context.dom_counts
+        )
+
+    @_REGISTRY.feature("t_qmax", requires=("times", "top_charge_indices"))
+    def _t_qmax(self, context: FeatureContext) -> np.ndarray:
+        return np.where(
+            context.dom_counts >= 1,
+            context["times"][context["top_charge_indices"][:, -1]],
+            _FILL_INCOMPLETE,
+        )
+
+    # ascending order, as np.sort(...)[-2:] in the loop path
+    @_REGISTRY.feature("q_max1", requires=("top_charge_indices",))
+    def _q_max1(self, context: FeatureContext) -> np.ndarray:
+        return self._get_top_two_value(
+            context.pulse_batch["charge"], context, 0
+        )
+
+    @_REGISTRY.feature("q_max2", requires=("top_charge_indices",))
+    def _q_max2(self, context: FeatureContext) -> np.ndarray:
+        return self._get_top_two_value(
+            context.pulse_batch["charge"], context, 1
+        )
+
+    @_REGISTRY.feature("t_qmax1", requires=("times", "top_charge_indices"))
+    def _t_qmax1(self, context: FeatureContext) -> np.ndarray:
+        return self._get_top_two_value(context["times"], context, 0)
+
+    @_REGISTRY.feature("t_qmax2", requires=("times", "top_charge_indices"))
+    def _t_qmax2(self, context: FeatureContext) -> np.ndarray:
+        return self._get_top_two_value(context["times"], context, 1)
+
+    @_REGISTRY.feature("q_max_bottom", requires=("max_charge_bottom",))
+    def _q_max_bottom(self, context: FeatureContext) -> np.ndarray:
+        max_charge_bottom, has_bottom = context["max_charge_bottom"]
+        return np.where(
+            (context.dom_counts >= 4) & has_bottom,
+            max_charge_bottom,
+            _FILL_INCOMPLETE,
+        )
+
+    @_REGISTRY.feature(
+        "t_qmax_bottom",
+        requires=("times", "half_time_masks", "max_charge_bottom"),
+    )
+    def _t_qmax_bottom(self, context: FeatureContext) -> np.ndarray:
+        _, bottom_half_mask = context["half_time_masks"]
+        return self._get_time_at_highest_charge_pulse_bottom(
+            context["times"],
+            context.pulse_batch["charge"],
+            bottom_half_mask,
+            context["max_charge_bottom"],
+            context.dom_starts,
+            context.dom_counts,
+        )
+
+    @_REGISTRY.feature("Q_halftime", requires=("charges", "half_time_masks"))
+    def _Q_halftime(self, context: FeatureContext) -> np.ndarray:
+        first_half_mask, _ = context["half_time_masks"]
+        return self._get_accumulated_charge_in_the_first_half(
+            context["charges"],
+            first_half_mask,
+            context.dom_starts,
+            context.dom_counts,
+        )
+
+    @_REGISTRY.feature(
+        "eccentricity_PCA", requires=("event_geometry", "dom_event_index")
+    )
+    def _eccentricity_PCA(self, context: FeatureContext) -> np.ndarray:
+        return self._get_event_geometry(
+            context, self.Q_adj_cut_second_round, 0
+        )
+
+    @_REGISTRY.feature(
+        "aspect_contrast_PCA", requires=("event_geometry", "dom_event_index")
+    )
+    def _aspect_contrast_PCA(self, context: FeatureContext) -> np.ndarray:
+        return self._get_event_geometry(
+            context, self.Q_adj_cut_second_round, 1
+        )
+
+    @_REGISTRY.feature(
+        "hypotenuse", requires=("event_geometry", "dom_event_index")
+    )
+    def _hypotenuse(self, context: FeatureContext) -> np.ndarray:
+        return self._get_event_geometry(
+            context, self.Q_adj_cut_second_round, 2
+        )
+
+    @_REGISTRY.feature(
+        "eccentricity_PCA_Qcut{x}",
+        requires=("event_geometry", "dom_event_index"),
+    )
+    def _eccentricity_PCA_Qcut(
+        self, context: FeatureContext, Q_adj_cut: float
+    ) -> np.ndarray:
+        return self._get_event_geometry(context, Q_adj_cut, 0)
+
+    @_REGISTRY.feature(
+        "aspect_contrast_PCA_Qcut{x}",
+        requires=("event_geometry", "dom_event_index"),
+    )
+    def _aspect_contrast_PCA_Qcut(
+        self, context: FeatureContext, Q_adj_cut: float
+    ) -> np.ndarray:
+        return self._get_event_geometry(context, Q_adj_cut, 1)
+
+    @_REGISTRY.feature(
+        "hypotenuse_Qcut{x}", requires=("event_geometry", "dom_event_index")
+    )
+    def _hypotenuse_Qcut(
+        self, context: FeatureContext, Q_adj_cut: float
+    ) -> np.ndarray:
+        return self._get_event_geometry(context, Q_adj_cut, 2)
+
+    # --------- HELPERS ---------
+    def _get_Q_weighted_DOM_position(
+        self,
+        pulses: PulseBatch,
+        Q_total: np.ndarray,
+        dom_starts: np.ndarray,
+        dom_counts: np.ndarray,
+        read_dom_order: np.ndarray,
+    ) -> np.ndarray:
+        """
+        charge-weighted mean DOM position of each event, summed as the loop path does:
+        pairwise within a DOM, then DOM by DOM in read order within the event, in float32
+        """
+        q = pulses["charge"]
+        dom_weighted_position = np.column_stack(
+            [
+                self._get_segmented_sum(pulses[c] * q, dom_starts, dom_counts)
+                for c in ("dom_x", "dom_y", "dom_z")
+            ]
+        )[read_dom_order]
+        Q_total = Q_total[read_dom_order]
+        event_dom_starts = pulses.event_dom_starts
+        event_dom_counts = pulses.event_dom_counts
+        event_dom_ends = event_dom_starts + event_dom_counts - 1
+        total_weighted_position = self._get_segmented_cumsum(
+            dom_weighted_position, event_dom_starts, event_dom_counts
+        )[event_dom_ends]
+        Q_event = self._get_segmented_cumsum(
+            Q_total, event_dom_starts, event_dom_counts
+        )[event_dom_ends]
+        avg_dom_position = np.zeros_like(total_weighted_position)
+        np.divide(
+            total_weighted_position,
+            Q_event[:, None],
+            out=avg_dom_position,
+            where=Q_event[:, None] > 0,
+        )
+        return avg_dom_position
+
+    def _gather_first_n(
+        self,
+        values: np.ndarray,
+        dom_starts: np.ndarray,
+        dom_counts: np.ndarray,
+    ) -> np.ndarray:
+        offsets = np.arange(self.n_pulse_collect)
+        is_collected = offsets[None, :] < dom_counts[:, None]
+        indices = np.where(is_collected, dom_starts[:, None] + offsets, 0)
+        return np.where(is_collected, values[indices], _FILL_INCOMPLETE)
+
+    def _get_segmented_cumsum(
+        self,
+        values: np.ndarray,
+        dom_starts: np.ndarray,
+        dom_counts: np.ndarray,
+    ) -> np.ndarray:
+        """
+        np.cumsum of each DOM: restarted at every DOM and accumulated pulse by pulse
+        in the dtype of values, along the rows of (n_doms, width) padded blocks.
+        """
+        if dom_counts.shape[0] == 1 and dom_counts[0] == values.shape[0]:
+            # one segment, e.g. the DOMs of a single event
+            return np.cumsum(values, axis=0)
+        cumulated = np.empty_like(values)
+        for doms in self._iter_size_classes(dom_counts):
+            is_inside, indices = self._get_padded_indices(
+                dom_starts[doms], dom_counts[doms]
+            )
+            cumulated_block = np.cumsum(values[indices], axis=1)
+            cumulated[indices[is_inside]] = cumulated_block[is_inside]
+        return cumulated
+
+    def _get_segmented_sum(
+        self, values: np.ndarray, starts: np.ndarray, lengths: np.ndarray
+    ) -> np.ndarray:
+        """
+        np.sum(values[start : start + length]) of each segment, bit for bit:
+        the pairwise summation of np.sum is replayed for all segments in lock-step.
+        """
+        return np.zeros(starts.shape[0], dtype=values.dtype) + (
+            self._get_pairwise_sum(values, starts, lengths)
+        )
+
+    def _get_pairwise_sum(
+        self, values: np.ndarray, starts: np.ndarray, lengths: np.ndarray
+    ) -> np.ndarray:
+        """
+        as numpy's pairwise_sum: fewer than 8 values are added one by one,
+        up to 128 into 8 interleaved partial sums (then the rest one by one),
+        more are split into two halves of a multiple of 8.
+        Zero padding leaves every partial sum unchanged.
+        """
+        sums = np.zeros(starts.shape[0], dtype=values.dtype)
+        if lengths.max(initial=0) < 8:
+            # e.g. the DOMs of a single event
+            return self._add_one_by_one(sums, values, starts, lengths)
+
+        is_split = lengths > 128
+        unsplit_lengths = np.where(is_split, 0, lengths)
+        n_interleaved = unsplit_lengths - unsplit_lengths % 8
+        for segments in self._iter_size_classes(unsplit_lengths):
+            # zero beyond each segment, at least 7 columns beyond the last full lane
+            width = 8 * (int(unsplit_lengths[segments].max()) // 8 + 1)
+            padded = self._get_padded(
+                values,
+                starts[segments],
+                unsplit_lengths[segments],
+                min_width=width,
+            )
+            lanes = np.where(
+                np.arange(width) < n_interleaved[segments, None], padded, 0
+            ).reshape(segments.shape[0], -1, 8)
+            # (n_segments, 8), summed lane by lane
+            partial = np.cumsum(lanes, axis=1)[:, -1]
+            # ((r0 + r1) + (r2 + r3)) + ((r4 + r5) + (r6 + r7))
+            pairs = partial[:, 0::2] + partial[:, 1::2]
+            quads = pairs[:, 0::2] + pairs[:, 1::2]
+            rest = np.take_along_axis(
+                padded, n_interleaved[segments, None] + np.arange(7), axis=1
+            )
+            sums[segments] = np.cumsum(
+                np.column_stack((quads[:, 0] + quads[:, 1], rest)), axis=1
+            )[:, -1]
+
+        if np.any(is_split):
+            split_starts, split_lengths = starts[is_split], lengths[is_split]
+            half = split_lengths // 2
+            half -= half % 8
+            sums[is_split] = self._get_pairwise_sum(
+                values, split_starts, half
+            ) + self._get_pairwise_sum(
+                values, split_starts + half, split_lengths - half
+            )
+        return sums
+
+    def _add_one_by_one(
+        self,
+        sums: np.ndarray,
+        values: np.ndarray,
+        starts: np.ndarray,
+        lengths: np.ndarray,
+    ) -> np.ndarray:
+        """sums plus values[start], values[start + 1], ... in that order"""
+        rest = self._get_padded(values, starts, lengths)
+        return np.cumsum(np.column_stack((sums, rest)), axis=1)[:, -1]
+
+    def _get_padded(
+        self,
+        values: np.ndarray,
+        starts: np.ndarray,
+        lengths: np.ndarray,
+        min_width: int = 0,
+    ) -> np.ndarray:
+        """values of each segment as a row, zero beyond its length"""
+        is_inside, indices = self._get_padded_indices(
+            starts, lengths, min_width
+        )
+        return np.where(is_inside, values[indices], 0).astype(
+            values.dtype, copy=False
+        )
+
+    @staticmethod
+    def _get_padded_indices(
+        starts: np.ndarray, lengths: np.ndarray, min_width: int = 0
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (n_segments, width) mask of the positions inside each segment,
+        and their indices (0 outside)
+        """
+        offsets = np.arange(max(int(lengths.max(initial=0)), min_width))
+        is_inside = offsets[None, :] < lengths[:, None]
+        return is_inside, np.where(is_inside, starts[:, None] + offsets, 0)
+
+    @staticmethod
+    def _iter_size_classes(lengths: np.ndarray) -> Iterator[np.ndarray]:
+        """
+        Segments to pad into one block each: all of them if the block stays small
+        (e.g. a single event), otherwise those of lengths within a power of two.
+        """
+        if lengths.shape[0] * lengths.max(initial=0) <= _MAX_PADDED_SIZE:
+            yield np.arange(lengths.shape[0])
+            return
+        size_class = np.ceil(np.log2(np.maximum(lengths, 1))).astype(int)
+        yield from np.split(
+            np.argsort(size_class, kind="stable"),
+            np.flatnonzero(np.diff(np.sort(size_class))) + 1,
+        )
+
+    def _get_segmented_searchsorted(
+        self,
+        values: np.ndarray,
+        dom_starts: np.ndarray,
+        dom_counts: np.ndarray,
+        queries: np.ndarray,
+        side: str = "left",
+    ) -> np.ndarray:
+        """
+        np.searchsorted of every query within its DOM segment, for all DOMs at once.
+        values must be non-decreasing within each DOM; queries is (n_doms, n_queries).
+        Returns the insertion positions relative to the DOM start, (n_doms, n_queries).
+        """
+        if queries.size * dom_counts.max(initial=0) <= _MAX_PADDED_SIZE:
+            # few pulses, e.g. a single event: count the pulses before each query
+            is_inside, indices = self._get_padded_indices(
+                dom_starts, dom_counts
+            )
+            padded_values = values[indices][:, :, None]
+            if side == "left":
+                goes_right = padded_values < queries[:, None, :]
+            else:
+                goes_right = padded_values <= queries[:, None, :]
+            return np.sum(goes_right & is_inside[:, :, None], axis=1)
+
+        low = np.broadcast_to(dom_starts[:, None], queries.shape).copy()
+        high = low + dom_counts[:, None]
+        # bisection, all (DOM, query) pairs in lock-step
+        while True:
+            is_open = low < high
+            if not np.any(is_open):
+                break
+            middle = (low + high) // 2
+            middle_values = values[np.where(is_open, middle, 0)]
+            if side == "left":
+                goes_right = middle_values < queries
+            else:
+                goes_right = middle_values <= queries
+            low = np.where(is_open & goes_right, middle + 1, low)
+            high = np.where(is_open & ~goes_right, middle, high)
+        return low - dom_starts[:, None]
+
+    def _get_accumulated_charge_after_ns(
+        self,
+        time_offsets: np.ndarray,
+        charges: np.ndarray,
+        dom_starts: np.ndarray,
+        dom_counts: np.ndarray,
+        intervals: List[float],
+    ) -> np.ndarray:
+        """
+        Charge of the pulses with time_offset < interval, (n_doms, n_intervals).
+        The pulses are time-ordered, so they are a prefix of each DOM.
+        """
+        intervals = np.asarray(intervals, dtype=time_offsets.dtype)
+        queries = np.broadcast_to(
+            intervals, (dom_starts.shape[0], intervals.shape[0])
+        )
+        n_within = self._get_segmented_searchsorted(
+            time_offsets, dom_starts, dom_counts, queries, side="left"
+        )
+        return self._get_segmented_sum(
+            charges,
+            np.repeat(dom_starts, n_within.shape[1]),
+            n_within.ravel(),
+        ).reshape(n_within.shape)
+
+    def _get_elapsed_time_until_charge_fraction(
+        self,
+        times: np.ndarray,
+        cumulated_charge: np.ndarray,
+        Q_total: np.ndarray,
+        dom_starts: np.ndarray,
+        dom_counts: np.ndarray,
+        percentiles: List[float],
+    ) -> np.ndarray:
+        """
+        Time from the first pulse to the pulse at which the cumulated charge
+        exceeds percentile % of the total, (n_doms, n_percentiles).
+        The thresholds are float32(percentile / 100) * Q_total, as in the loop path.
+        """
+        fractions = (np.asarray(percentiles, dtype=np.float64) / 100).astype(
+            Q_total.dtype
+        )
+        thresholds = fractions[None, :] * Q_total[:, None]
+        idx = self._get_segmented_searchsorted(
+            cumulated_charge, dom_starts, dom_counts, thresholds, side="right"
+        )
+        is_reached = (idx < dom_counts[:, None]) & (dom_counts[:, None] >= 2)
+        pulse_idx = dom_starts[:, None] + np.minimum(
+            idx, dom_counts[:, None] - 1
+        )
+        return np.where(
+            is_reached,
+            times[pulse_idx] - times[dom_starts][:, None],
+            _FILL_INCOMPLETE,
+        )
+
+    def _get_time_standard_deviation(
+        self, times: np.ndarray, dom_starts: np.ndarray, dom_counts: np.ndarray
+    ) -> np.ndarray:
+        # np.std of each DOM, in the dtype of times
+        n_pulses = dom_counts.astype(times.dtype)
+        mean = (
+            self._get_segmented_sum(times, dom_starts, dom_counts) / n_pulses
+        )
+        deviation = times - np.repeat(mean, dom_counts)
+        variance = (
+            self._get_segmented_sum(
+                deviation * deviation, dom_starts, dom_counts
+            )
+            / n_pulses
+        )
+        return np.where(dom_counts > 1, np.sqrt(variance), _FILL_INCOMPLETE)
+
+    def _get_top_charge_indices(
+        self,
+        charges: np.ndarray,
+        dom_starts: np.ndarray,
+        dom_counts: np.ndarray,
+        how_many: int = 2,
+    ) -> np.ndarray:
+        """
+        Pulse indices of the how_many highest charges of each DOM, ascending in charge.
+        Entries beyond the DOM size point at the first pulse and must be masked by the caller.
+        """
+        dom_index = np.repeat(np.arange(dom_starts.shape[0]), dom_counts)
+        charge_order = np.lexsort((charges, dom_index))
+        offsets = np.arange(-how_many, 0)
+        positions = dom_starts[:, None] + dom_counts[:, None] + offsets
+        positions = np.maximum(positions, dom_starts[:, None])
+        return charge_order[positions]
+
+    def _get_half_time_masks(
+        self, times: np.ndarray, dom_starts: np.ndarray, dom_counts: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        dom_ends = dom_starts + dom_counts - 1
+        t_middle = (times[dom_ends] + times[dom_starts]) / 2
+        t_middle = np.repeat(t_middle, dom_counts)
+        return times < t_middle, times > t_middle
+
+    def _get_accumulated_charge_in_the_first_half(
+        self,
+        charges: np.ndarray,
+        first_half_mask: np.ndarray,
+        dom_starts: np.ndarray,
+        dom_counts: np.ndarray,
+    ) -> np.ndarray:
+        # the pulses before t_middle are a prefix of the time-ordered DOM
+        Q_halftime = self._get_segmented_sum(
+            charges,
+            dom_starts,
+            np.add.reduceat(first_half_mask.astype(np.int64), dom_starts),
+        )
+        return np.where(dom_counts >= 2, Q_halftime, _FILL_INCOMPLETE)
+
+    def _get_max_charge_in_mask(
+        self, charges: np.ndarray, mask: np.ndarray, dom_starts: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """highest charge among the masked pulses of each DOM, and whether any pulse is masked"""
+        has_masked = np.add.reduceat(mask, dom_starts) > 0
+        max_charge = np.maximum.reduceat(
+            np.where(mask, charges, -np.inf), dom_starts
+        )
+        return max_charge, has_masked
+
+    def _get_event_geometry(
+        self, context: FeatureContext, Q_adj_cut: float, component: int
+    ) -> np.ndarray:
+        event_geometry = context["event_geometry"][float(Q_adj_cut)]
+        return event_geometry[component][context["dom_event_index"]]
+
+    def _get_top_two_value(
+        self, values: np.ndarray, context: FeatureContext, rank: int
+    ) -> np.ndarray:
+        return np.where(
+            context.dom_counts >= 2,
+            values[context["top_charge_indices"][:, rank]],
+            _FILL_INCOMPLETE,
+        )
+
+    def _get_time_at_highest_charge_pulse_bottom(
+        self,
+        times: np.ndarray,
+        charges: np.ndarray,
+        bottom_half_mask: np.ndarray,
+        max_charge_bottom: Tuple[np.ndarray, np.ndarray],
+        dom_starts: np.ndarray,
+        dom_counts: np.ndarray,
+    ) -> np.ndarray:
+        max_charge_bottom, has_bottom = max_charge_bottom
+        is_bottom_max = bottom_half_mask & (
+            charges == np.repeat(max_charge_bottom, dom_counts)
+        )
+        # NOTE
+        # the loop path takes np.argmax over the bottom-half charges and uses
+        # that position to index the whole DOM, so the rank within the
+        # bottom half is used here as well to keep the column identical
+        bottom_rank = (
+            self._get_segmented_cumsum(
+                bottom_half_mask.astype(np.int64), dom_starts, dom_counts
+            )
+            - 1
+        )
+        first_max_rank = np.minimum.reduceat(
+            np.where(is_bottom_max, bottom_rank, np.iinfo(np.int64).max),
+            dom_starts,
+        )
+        is_valid = (dom_counts >= 6) & has_bottom
+        pulse_idx = dom_starts + np.where(is_valid, first_max_rank, 0)
+        return np.where(is_valid, times[pulse_idx], _FILL_INCOMPLETE)
+
+    # --------- EVENT-WISE FEATURES ---------
+    def _get_second_round_event_wise_features(
+        self,
+        pulses: PulseBatch,
+        dom_starts: np.ndarray,
+        Q_total: np.ndarray,
+        dom_event_index: np.ndarray,
+        read_dom_order: np.ndarray,
+        n_events: int,
+        Q_adj_cuts: List[float],
+    ) -> Dict[float, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        eccentricity_PCA, aspect_contrast_PCA, hypotenuse per event for every Q_adj_cut.
+        The (cut, event) pairs are stacked as n_cuts * n_events events of one geometry call,
+        so all thresholds share a single hull/PCA pass.
+        """
+        n_cuts = len(Q_adj_cuts)
+        Q_thresholds = 10 ** (np.asarray(Q_adj_cuts, dtype=np.float64) + 2)
+        cut_idx, high_charge_doms = np.nonzero(
+            Q_total[None, :] >= Q_thresholds[:, None]
+        )
+        # the first high-charge DOM read on a string represents it in XY,
+        # as the geometry keeps the input order within each (event, string)
+        read_rank = np.empty(read_dom_order.shape[0], dtype=np.int64)
+        read_rank[read_dom_order] = np.arange(read_dom_order.shape[0])
+        in_read_order = np.argsort(read_rank[high_charge_doms], kind="stable")
+        cut_idx = cut_idx[in_read_order]
+        high_charge_doms = high_charge_doms[in_read_order]
+        high_charge_starts = dom_starts[high_charge_doms]
+        eccentricity_PCA, aspect_contrast_PCA, hypotenuse = (
+            self.event_geometry(
+                cut_idx * n_events + dom_event_index[high_charge_doms],
+                pulses["string"][high_charge_starts],
+                pulses["dom_x"][high_charge_starts],
+                pulses["dom_y"][high_charge_starts],
+                pulses["dom_z"][high_charge_starts],
+                n_cuts * n_events,
+            )
+        )
+        return {
+            float(Q_adj_cut): (
+                eccentricity_PCA[k * n_events : (k + 1) * n_events],
+                aspect_contrast_PCA[k * n_events : (k + 1) * n_events],
+                hypotenuse[k * n_events : (k + 1) * n_events],
+            )
+            for k, Q_adj_cut in enumerate(Q_adj_cuts)
+        }
@@ -0,0 +1,185 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterable, List, Tuple
+
+"""
+@author: cyan.jo
+Summary:
+Runs the shards of a part through three overlapping stages:
+    read    (reader thread)  : fetches the inputs of shard k+1, e.g. pulses and source truth
+    compute (calling thread) : summarises shard k
+    write   (writer thread)  : encodes and writes shard k-1
+SQLite, NumPy and Parquet release the GIL in their heavy parts, so the stages overlap.
+
+The stages are connected by queues of at most prefetch_depth items:
+a reader faster than the computation blocks instead of loading the whole part (backpressure).
+The time each stage spends waiting on its neighbours is kept in wait_times:
+    read_blocked    : reader waiting for room in the compute queue  -> compute bound
+    compute_starved : compute waiting for the reader                -> read bound
+    compute_blocked : compute waiting for room in the write queue   -> write bound
+    write_starved   : writer waiting for compute
+
+An exception in any stage stops the others and is raised from __call__.
+
+Usage:
+    pipeline = ShardPipeline(prefetch_depth=2)
+    results = pipeline(read=iter_shard_inputs, compute=compute_shard, write=write_shard)
+    pipeline.log_wait_times()
+"""
+
+_DONE = object()
+
+
+class ShardPipeline:
+    # seconds between checks of the stop flag while a stage waits on a queue
+    _POLL_INTERVAL = 0.1
+
+    def __init__(self, prefetch_depth: int = 2) -> None:
+        if prefetch_depth < 1:
+            raise ValueError("prefetch_depth must be at least 1.")
+        self.prefetch_depth = prefetch_depth
+        self.wait_times = dict.fromkeys(
+            (
+                "read_blocked",
+                "compute_starved",
+                "compute_blocked",
+                "write_starved",
+            ),
+            0.0,
+        )
+
+    def __call__(
+        self,
+        read: Callable[[], Iterable[Any]],
+        compute: Callable[[Any], Tuple[Any, Any]],
+        write: Callable[[Any], None],
+    ) -> List[Any]:
+        """
+        read() yields the input of each shard and runs in the reader thread,
+        compute(input) returns (result, output), write(output) runs in the writer thread.
+        Returns the results in the order of the inputs.
+        """
+        read_queue = queue.Queue(maxsize=self.prefetch_depth)
+        write_queue = queue.Queue(maxsize=self.prefetch_depth)
+        stop = threading.Event()
+        errors = []
+
+        reader = threading.Thread(
+            target=self._read,
+            args=(read, read_queue, stop, errors),
+            daemon=True,
+        )
+        writer = threading.Thread(
+            target=self._write,
+            args=(write, write_queue, stop, errors),
+            daemon=True,
+        )
+        reader.start()
+        writer.start()
+
+        results = []
+        try:
+            while True:
+                item = self._get(read_queue, "compute_starved", stop)
+                if item is _DONE:
+                    break
+                result, output = compute(item)
+                results.append(result)
+                if not self._put(write_queue, output, "compute_blocked", stop):
+                    break
+        except BaseException:
+            stop.set()
+            raise
+        finally:
+            # the writer drains the queued outputs before it stops
+            self._put(write_queue, _DONE, None, stop)
+            writer.join()
+            stop.set()
+            reader.join()
+
+        if errors:
+            raise errors[0]
+        return results
+
+    def log_wait_times(self) -> None:
+        wait_times = ", ".join(
+            f"{stage} {seconds:.1f}s"
+            for stage, seconds in self.wait_times.items()
+        )
+        logging.info(f"Pipeline wait times: {wait_times}")
+
+    # --------- STAGES ---------
+    def _read(
+        self,
+        read: Callable[[], Iterable[Any]],
+        read_queue: queue.Queue,
+        stop: threading.Event,
+        errors: List[BaseException],
+    ) -> None:
+        items = None
+        try:
+            items = iter(read())
+            for item in items:
+                if not self._put(read_queue, item, "read_blocked", stop):
+                    return
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            # closes e.g. the reader's own connection inside this thread
+            if hasattr(items, "close"):
+                items.close()
+            self._put(read_queue, _DONE, None, stop)
+
+    def _write(
+        self,
+        write: Callable[[Any], None],
+        write_queue: queue.Queue,
+        stop: threading.Event,
+        errors: List[BaseException],
+    ) -> None:
+        try:
+            while True:
+                output = self._get(write_queue, "write_starved", stop)
+                if output is _DONE:
+                    return
+                write(output)
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    # --------- HELPERS ---------
+    def _get(
+        self, source: queue.Queue, wait_key: str, stop: threading.Event
+    ) -> Any:
+        start_time = time.perf_counter()
+        try:
+            while True:
+                try:
+                    return source.get(timeout=ShardPipeline._POLL_INTERVAL)
+                except queue.Empty:
+                    if stop.is_set():
+                        return _DONE
+        finally:
+            self.wait_times[wait_key] += time.perf_counter() - start_time
+
+    def _put(
+        self,
+        target: queue.Queue,
+        item: Any,
+        wait_key: str,
+        stop: threading.Event,
+    ) -> bool:
+        start_time = time.perf_counter()
+        try:
+            while True:
+                try:
+                    target.put(item, timeout=ShardPipeline._POLL_INTERVAL)
+                    return True
+                except queue.Full:
+                    if stop.is_set():
+                        return False
+        finally:
+            if wait_key is not None:
+                self.wait_times[wait_key] += time.perf_counter() - start_time
@@ -0,0 +1,70 @@
+import abc
+import numpy as np
+import pyarrow as pa
+from typing import List, Tuple
+
+from IcePack.PMTfication.PulseBatch import PulseBatch
+
+"""
+@author: cyan.jo
+Summary:
+What PMTfier, PMTSummariser and PMTTruthMaker read from the source of one part,
+independent of its storage format:
+    get_event_index   : all event_no of the pulsemap with their pulse counts, sorted
+    get_pulse_batch   : the pulses of a shard as a PulseBatch
+    get_table_schema  : the columns of a (truth, trailing) table
+    read_events       : the rows of a table for a shard
+    get_dom_counts    : N_doms of each event of a shard, for the truth
+Implementations: SQLiteBackend (merged_part_<part_no>.db), ParquetBackend (GraphNeT-style Parquet).
+
+Usage:
+    source_backend = ParquetBackend(table_files, "SRTInIcePulses")
+    for event_batch in source_backend.get_event_no_batches(N_events_per_shard):
+        pulse_batch = source_backend.get_pulse_batch(event_batch)
+"""
+
+
+class SourceBackend(abc.ABC):
+    def __init__(self, source_table: str) -> None:
+        self.source_table = source_table
+
+    @abc.abstractmethod
+    def get_event_index(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(event_no, pulse count) of every event of the pulsemap, sorted by event_no"""
+
+    @abc.abstractmethod
+    def get_pulse_batch(self, event_batch: List[int]) -> PulseBatch:
+        """pulses of the events of event_batch"""
+
+    @abc.abstractmethod
+    def get_table_schema(self, table_name: str) -> pa.Schema:
+        """columns of table_name, typed as PMTTruthMaker writes them"""
+
+    @abc.abstractmethod
+    def read_events(
+        self, table_name: str, columns: List[str], event_batch: List[int]
+    ) -> pa.Table:
+        """columns of the rows of table_name whose event_no is in event_batch"""
+
+    @abc.abstractmethod
+    def get_dom_counts(self, event_batch: List[int]) -> pa.Table:
+        """event_no and N_doms, the number of distinct (string, dom_number), of each event"""
+
+    def get_event_no_batches(self, N_events_per_shard: int) -> List[List[int]]:
+        event_nos, _ = self.get_event_index()
+        return [
+            event_nos[start : start + N_events_per_shard].tolist()
+            for start in range(0, event_nos.shape[0], N_events_per_shard)
+        ]
+
+    def close(self) -> None:
+        pass
+
+    @staticmethod
+    def to_truth_type(dtype: pa.DataType) -> pa.DataType:
+        """the type of a source column in the truth, as for SQLite declared types"""
+        if pa.types.is_integer(dtype) or pa.types.is_boolean(dtype):
+            return pa.int32()
+        if pa.types.is_floating(dtype):
+            return pa.float32()
+        return pa.string()
@@ -0,0 +1,150 @@
+import os
+import time
+import logging
+import sqlite3 as sql
+from typing import Dict, Iterator, Tuple
+from urllib.request import pathname2url
+
+from IcePack.PMTfication.PulseBatch import PulseBatch
+
+"""
+@author: cyan.jo
+Summary:
+Opens the source (merged_part_*.db) databases read-only, with a connection profile
+tuned for large scans of files that are not modified while they are read:
+    mode=ro             : the file is never written, nor its journal created
+    immutable=1         : (optional) no file locking and no change detection,
+                          only for files nothing writes to, e.g. archived parts on Lustre
+    mmap_size           : pages are read through a memory map instead of read() calls
+    cache_size          : page cache of the connection
+    temp_store=MEMORY   : sorts and temp tables (EventNoSelection) stay in memory
+    query_only          : any statement changing the database fails
+
+Schema and index changes are never made on these connections.
+They are made by prepare(), a separate step run explicitly before reading,
+e.g. PMTfier(..., prepare_source=True) or, for all parts at once, SourcePreparer.
+prepare() indexes the pulsemap on the PulseBatch sort keys; has_sort_index() detects it,
+and PMTSummariser then reads the pulses in index order and skips its own sort.
+has_event_no_index() tells an unprepared source, which PMTfier warns about when it connects.
+
+Usage:
+    source_connector = SourceConnector(immutable=True)
+    SourceConnector.prepare(source_part_file, "SRTInIcePulses")  # optional, writes the file
+    con_source = source_connector(source_part_file)
+    SourceConnector.has_sort_index(con_source, "SRTInIcePulses")
+    SourceConnector.has_event_no_index(con_source, "SRTInIcePulses")
+"""
+
+
+class SourceConnector:
+    def __init__(
+        self,
+        immutable: bool = False,
+        mmap_size_MB: int = 1024,
+        cache_size_MB: int = 64,
+        query_only: bool = True,
+    ) -> None:
+        self.immutable = immutable
+        self.mmap_size_MB = mmap_size_MB
+        self.cache_size_MB = cache_size_MB
+        self.query_only = query_only
+
+    def __call__(self, db_file: str) -> sql.Connection:
+        """read-only connection to an existing db_file"""
+        if not os.path.isfile(db_file):
+            raise FileNotFoundError(f"Source database not found: {db_file}")
+        uri = f"file:{pathname2url(os.path.abspath(db_file))}?mode=ro"
+        if self.immutable:
+            uri += "&immutable=1"
+        con_source = sql.connect(uri, uri=True)
+
+        cursor = con_source.cursor()
+        cursor.execute(f"PRAGMA mmap_size = {self.mmap_size_MB * 1024 * 1024}")
+        # a negative cache_size is in KiB instead of pages
+        cursor.execute(f"PRAGMA cache_size = {-self.cache_size_MB * 1024}")
+        cursor.execute("PRAGMA temp_store = MEMORY")
+        if self.query_only:
+            cursor.execute("PRAGMA query_only = ON")
+        return con_source
+
+    @staticmethod
+    def prepare(db_file: str, source_table: str) -> Dict[str, object]:
+        """
+        The only place where the source database is modified:
+        creates the index on the PulseBatch sort keys (event_no, string, dom_number, dom_time),
+        which the event selections, EventIndex and the ordered pulse reads scan on.
+        Without string/dom_number (identified at read time by DOMMapper) it indexes event_no alone.
+        Returns the record of what was prepared.
+        """
+        start_time = time.time()
+        con_source = sql.connect(db_file)
+        try:
+            cursor = con_source.cursor()
+            cursor.execute(f"PRAGMA table_info({source_table})")
+            columns = {row[1] for row in cursor.fetchall()}
+            index_keys = (
+                PulseBatch._SORT_KEYS
+                if set(PulseBatch._SORT_KEYS) <= columns
+                else ("event_no",)
+            )
+            index_name = f"idx_{source_table}_{'_'.join(index_keys)}"
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {index_name} ON {source_table}({', '.join(index_keys)})"
+            )
+            con_source.commit()
+            is_presorted = SourceConnector.has_sort_index(
+                con_source, source_table
+            )
+        finally:
+            con_source.close()
+        logging.info(f"Prepared {source_table} of {db_file}: {index_name}")
+        return {
+            "db_file": db_file,
+            "source_table": source_table,
+            "index": index_name,
+            "presorted": is_presorted,
+            "seconds": round(time.time() - start_time, 1),
+        }
+
+    @staticmethod
+    def has_sort_index(con_source: sql.Connection, source_table: str) -> bool:
+        """
+        Whether source_table has an index on the PulseBatch sort keys,
+        so that its pulses can be read already sorted.
+        """
+        return any(
+            index_keys[: len(PulseBatch._SORT_KEYS)] == PulseBatch._SORT_KEYS
+            for index_keys in SourceConnector._iter_index_keys(
+                con_source, source_table
+            )
+        )
+
+    @staticmethod
+    def has_event_no_index(
+        con_source: sql.Connection, source_table: str
+    ) -> bool:
+        """
+        Whether source_table has an index led by event_no, without which
+        every event selection and EventIndex scans the whole table.
+        """
+        return any(
+            index_keys[:1] == ("event_no",)
+            for index_keys in SourceConnector._iter_index_keys(
+                con_source, source_table
+            )
+        )
+
+    # --------- HELPERS ---------
+    @staticmethod
+    def _iter_index_keys(
+        con_source: sql.Connection, source_table: str
+    ) -> Iterator[Tuple[str, ...]]:
+        """the key columns of each full (not partial) index of source_table"""
+        cursor = con_source.cursor()
+        cursor.execute(f"PRAGMA index_list({source_table})")
+        # (seq, name, unique, origin, partial)
+        index_names = [row[1] for row in cursor.fetchall() if not row[4]]
+        for index_name in index_names:
+            cursor.execute(f'PRAGMA index_info("{index_name}")')
+            # (seqno, cid, name)
+            yield tuple(row[2] for row in cursor.fetchall())
@@ -0,0 +1,82 @@
+import os
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+from tabulate import tabulate
+
+from IcePack.PMTfication.Layout.SourceLayout import SourceLayout
+from IcePack.PMTfication.SourceConnector import SourceConnector
+
+"""
+@author: cyan.jo
+Summary:
+Offline preparation of every source database of a layout, run once before the PMTfication jobs,
+so that no job takes a write lock on the shared source files.
+Each database is prepared by SourceConnector.prepare in a process pool of n_workers:
+the pulsemap gets an index on (event_no, string, dom_number, dom_time), which
+    - EventIndex and the event selections of every query scan on,
+    - PMTSummariser detects (SourceConnector.has_sort_index) to read the pulses in
+      index order and skip its own sort.
+The record of each database (index, presorted, seconds) is logged and,
+if report_file is given, written to it as JSON.
+
+Usage:
+    records = SourcePreparer(source_root, layout, "SRTInIcePulses", n_workers=8)(report_file)
+"""
+
+
+class SourcePreparer:
+    def __init__(
+        self,
+        source_root: str,
+        source_layout: SourceLayout,
+        source_table: str = "SRTInIcePulses",
+        n_workers: int = 1,
+    ) -> None:
+        self.source_root = source_root
+        self.source_layout = source_layout
+        self.source_table = source_table
+        self.n_workers = n_workers
+        self.source_dir = os.path.join(
+            source_root, source_layout.family, source_layout.subdir
+        )
+
+    def __call__(self, report_file: str = None) -> List[Dict[str, object]]:
+        db_files = self.get_db_files()
+        logging.info(
+            f"Preparing {len(db_files)} databases in {self.source_dir} with {self.n_workers} workers"
+        )
+        with ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+            records = list(
+                executor.map(
+                    SourceConnector.prepare,
+                    db_files,
+                    [self.source_table] * len(db_files),
+                )
+            )
+
+        logging.info(
+            "\n" + tabulate(records, headers="keys", tablefmt="pretty")
+        )
+        if report_file is not None:
+            with open(report_file, "w") as f:
+                json.dump(records, f, indent=4)
+        return records
+
+    def get_db_files(self) -> List[str]:
+        """source databases of the layout, ordered by part_no"""
+        part_nos = []
+        for file_name in os.listdir(self.source_dir):
+            try:
+                part_no = self.source_layout.extract_part_no(file_name)
+            except ValueError:
+                continue
+            if file_name == self.source_layout.get_db_file_name(part_no):
+                part_nos.append(part_no)
+        return [
+            os.path.join(
+                self.source_dir, self.source_layout.get_db_file_name(part_no)
+            )
+            for part_no in sorted(part_nos)
+        ]
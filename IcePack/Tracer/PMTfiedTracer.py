@@ -1,12 +1,25 @@
 import pandas as pd
 import os
 import pyarrow.parquet as pq
-from Tracer.Tracer import Tracer
+from IcePack.Tracer.Tracer import Tracer
+from IcePack.PMTfication.PulseBatch import PulseBatch
+from IcePack.PMTfication.InMemorySummariser import summarise
+from IcePack.Enum.SummaryMode import SummaryMode
 
 
 class PMTfiedTracer(Tracer):
-    def __init__(self, source_root: str):
-        super().__init__(source_root)
+    def __init__(
+        self,
+        source_root: str,
+        pulse_batch: PulseBatch = None,
+        summary_mode: SummaryMode = SummaryMode.CLASSIC,
+    ):
+        """
+        If pulse_batch is given, the PMTfied rows are summarised from it on the fly
+        with summary_mode instead of being read from the PMTfied shard.
+        """
+        super().__init__(source_root, pulse_batch)
+        self.summary_mode = summary_mode
 
     def event_tracer(self, event_no: int) -> pd.DataFrame:
         """
@@ -20,12 +33,17 @@ class PMTfiedTracer(Tracer):
         this_event_truth_df = self._get_truth_df_of_this_event(
             truth_file, event_no
         )
-        shard_file = self._build_shard_path(
-            disintegrated_event_receipt, this_event_truth_df
-        )
-        this_event_shard_df = self._get_event_df_from_table(
-            shard_file, event_no
-        )
+        if self.pulse_batch is not None:
+            this_event_shard_df = self._get_event_df_from_pulse_batch(
+                disintegrated_event_receipt, event_no
+            )
+        else:
+            shard_file = self._build_shard_path(
+                disintegrated_event_receipt, this_event_truth_df
+            )
+            this_event_shard_df = self._get_event_df_from_table(
+                shard_file, event_no
+            )
         df = pd.merge(
             this_event_shard_df,
             this_event_truth_df,
@@ -67,3 +85,17 @@ class PMTfiedTracer(Tracer):
     ) -> pd.DataFrame:
         shard_df = pq.read_table(shard_file).to_pandas()
         return shard_df[shard_df["event_no"] == event_no]
+
+    def _get_event_df_from_pulse_batch(
+        self, disintegrated_event_receipt: dict, event_no: int
+    ) -> pd.DataFrame:
+        event_pulse_batch = self.pulse_batch.select_events(
+            [disintegrated_event_receipt["original_event_no"]]
+        )
+        event_df = (
+            summarise(event_pulse_batch, summary_mode=self.summary_mode)
+            .to_pandas()
+            .rename(columns={"event_no": "original_event_no"})
+        )
+        event_df.insert(0, "event_no", event_no)
+        return event_df
@@ -1,12 +1,27 @@
 import pandas as pd
 import sqlite3 as sql
 import os
-from Tracer.Tracer import Tracer
+from IcePack.Tracer.Tracer import Tracer
+from IcePack.PMTfication.PulseBatch import PulseBatch
+from IcePack.PMTfication.SourceConnector import SourceConnector
 
 
 class PulseMapTracer(Tracer):
-    def __init__(self, source_root: str):
-        super().__init__(source_root)
+    def __init__(
+        self,
+        source_root: str,
+        pulse_batch: PulseBatch = None,
+        source_connector: SourceConnector = None,
+    ):
+        super().__init__(source_root, pulse_batch)
+        self.source_connector = source_connector or SourceConnector()
+        # one read-only connection per source database, reused across lookups
+        self._connections = {}
+
+    def close(self) -> None:
+        for con in self._connections.values():
+            con.close()
+        self._connections.clear()
 
     def event_tracer(self, event_no: int) -> pd.DataFrame:
         """
@@ -19,9 +34,16 @@ class PulseMapTracer(Tracer):
         db_path = self._build_db_path(disintegrated_event_receipt)
         short_event_no = disintegrated_event_receipt["original_event_no"]
 
-        srt_df = self._get_event_df_from_table(
-            db_path, "SRTInIcePulses", short_event_no
-        )
+        if self.pulse_batch is not None:
+            srt_df = (
+                self.pulse_batch.select_events([short_event_no])
+                .to_arrow()
+                .to_pandas()
+            )
+        else:
+            srt_df = self._get_event_df_from_table(
+                db_path, "SRTInIcePulses", short_event_no
+            )
         truth_df = self._get_event_df_from_table(
             db_path, "truth", short_event_no
         )
@@ -29,6 +51,27 @@ class PulseMapTracer(Tracer):
 
         return df
 
+    def event_pulse_batch(self, event_no: int) -> PulseBatch:
+        """
+        Given an enhanced event number, return the SRTInIcePulses of the event as a PulseBatch.
+        """
+        disintegrated_event_receipt = Tracer.disintegrate_enhanced_event_no(
+            event_no
+        )
+        short_event_no = disintegrated_event_receipt["original_event_no"]
+        if self.pulse_batch is not None:
+            return self.pulse_batch.select_events([short_event_no])
+
+        db_path = self._build_db_path(disintegrated_event_receipt)
+        return PulseBatch.from_columns(
+            {
+                column: values.to_numpy()
+                for column, values in self._get_event_df_from_table(
+                    db_path, "SRTInIcePulses", short_event_no
+                ).items()
+            }
+        )
+
     def _build_db_path(self, disintegrated_event_receipt: dict) -> str:
         """
         Build the path to the database file based on the disintegrated event information.
@@ -50,6 +93,12 @@ class PulseMapTracer(Tracer):
         self, db_file: str, table: str, event_no: int
     ) -> pd.DataFrame:
         query = f"SELECT * FROM {table} WHERE event_no = ?"
-        with sql.connect(db_file) as con:
-            df = pd.read_sql_query(query, con, params=(event_no,))
+        df = pd.read_sql_query(
+            query, self._get_connection(db_file), params=(event_no,)
+        )
         return df
+
+    def _get_connection(self, db_file: str) -> sql.Connection:
+        if db_file not in self._connections:
+            self._connections[db_file] = self.source_connector(db_file)
+        return self._connections[db_file]
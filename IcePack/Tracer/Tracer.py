@@ -1,10 +1,17 @@
 import abc
 import pandas as pd
 
+from IcePack.PMTfication.PulseBatch import PulseBatch
+
 
 class Tracer(abc.ABC):
-    def __init__(self, source_root: str):
+    def __init__(self, source_root: str, pulse_batch: PulseBatch = None):
+        """
+        pulse_batch: optional in-memory pulses (original event_no) to trace from
+        instead of reading the pulsemap from the source files.
+        """
         self.source_root = source_root
+        self.pulse_batch = pulse_batch
 
     def __call__(self, event_no: int):
         """
@@ -0,0 +1,74 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from os import getenv
+import argparse
+import logging
+import time
+
+from IcePack.PMTfication.SourcePreparer import SourcePreparer
+from IcePack.Enum.Flavour import Flavour
+from IcePack.Enum.EnergyRange import EnergyRange
+from IcePack.PMTfication.Layout.SnowstormLayout import SnowstormLayout
+from IcePack.PMTfication.Layout.CorsikaLayout import CorsikaLayout
+
+
+def prepare_wrap():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    start_time = time.time()
+    args = parse_arguments()
+
+    # ============= USER SETTINGS ==============
+    # Run once per layout before submitting the 1.PMTfy.py jobs:
+    # the PMTfication jobs then only read the source databases.
+    source_root = (
+        "/lustre/hpc/project/icecube/HE_Nu_Aske_Oct2024/sqlite_pulses/"
+    )
+    layout = SnowstormLayout.from_flavour_energy(
+        flavour=Flavour.TAU, energy_range=EnergyRange.ER_1_PEV_100_PEV
+    )
+    # layout = CorsikaLayout.from_alias(2)
+    # ===========================================
+
+    SourcePreparer(
+        source_root=source_root,
+        source_layout=layout,
+        source_table=args.source_table,
+        n_workers=args.n_workers,
+    )(report_file=args.report_file)
+
+    logging.info(f"Preparation took {time.time() - start_time:.1f}s")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Index every source database of a layout for PMTfication, in parallel."
+    )
+    parser.add_argument(
+        "--source_table",
+        type=str,
+        default="SRTInIcePulses",
+        help="Pulsemap table to index.",
+    )
+    parser.add_argument(
+        "--n_workers",
+        type=int,
+        default=int(getenv("SLURM_CPUS_PER_TASK", "1")),
+        help="Databases prepared in parallel (default: SLURM_CPUS_PER_TASK).",
+    )
+    parser.add_argument(
+        "--report_file",
+        type=str,
+        default=None,
+        help="Write the record of each prepared database to this JSON file.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    prepare_wrap()
@@ -8,7 +8,11 @@ import argparse
 import logging
 import json
 from IcePack.PMTfication.PMTfier import PMTfier
+from IcePack.PMTfication.SourceConnector import SourceConnector
+from IcePack.PMTfication.PartCoordinator import PartCoordinator
 from IcePack.Enum.SummaryMode import SummaryMode
+from IcePack.Enum.SummaryEngine import SummaryEngine
+from IcePack.Enum.SourceFormat import SourceFormat
 from IcePack.Enum.Flavour import Flavour
 from IcePack.Enum.EnergyRange import EnergyRange
 import time
@@ -49,7 +53,12 @@ def pmtfy_wrap():
         flavour=Flavour.TAU, energy_range=EnergyRange.ER_1_PEV_100_PEV
     )
 
-    summary_mode = SummaryMode.from_index(args.summary_mode)
+    # several modes are written from one read, to dest_root/<mode>/
+    summary_modes = {SummaryMode.from_index(i) for i in args.summary_mode}
+    summary_mode = (
+        summary_modes.pop() if len(summary_modes) == 1 else summary_modes
+    )
+    summary_engine = SummaryEngine.from_index(args.summary_engine)
     table_config_path = "/groups/icecube/cyan/factory/IcePACK/IcePack/PMTfication/Layout/TableConfig.json"
     # layout = CorsikaLayout.from_alias(2)
     # ===========================================
@@ -60,13 +69,33 @@ def pmtfy_wrap():
     )
 
     # NOTE 3. instantiate and invoke the PMTfier class with a part number
-    PMTfier(
+    pmtfier = PMTfier(
         source_root=source_root,
         source_layout=layout,
         source_table_config_file=table_config_path,
         dest_root=dest_root_base,
         summary_mode=summary_mode,
-    )(part_no=part_no)
+        summary_engine=summary_engine,
+        feature_names=args.feature_names,
+        charge_windows=args.charge_windows,
+        charge_fractions=args.charge_fractions,
+        Q_adj_cut_second_round=(
+            args.Q_adj_cut[0] if len(args.Q_adj_cut) == 1 else args.Q_adj_cut
+        ),
+        memory_budget_MB=args.memory_budget_MB,
+        pipelined=args.pipelined,
+        prefetch_depth=args.prefetch_depth,
+        source_connector=SourceConnector(immutable=args.immutable_source),
+        prepare_source=args.prepare_source,
+        staging_root=args.staging_root,
+        source_format=SourceFormat.from_index(args.source_format),
+        source_tables=args.source_tables,
+    )
+    if args.n_workers > 1:
+        # the shards of the part are split across worker processes
+        PartCoordinator(pmtfier, n_workers=args.n_workers)(part_no=part_no)
+    else:
+        pmtfier(part_no=part_no)
 
     # NOTE Log the end time
     logging.info(
@@ -88,9 +117,98 @@ def parse_arguments():
     parser.add_argument(
         "--summary_mode",
         type=int,
+        nargs="+",
         choices=[0, 1, 2, 3],
+        default=[0],
+        help="Summary mode(s): 0=Thorsten's 32, 1=geometric, 2=geometric + later, 3=geometric + max. Several modes are written from one read.",
+    )
+    parser.add_argument(
+        "--summary_engine",
+        type=int,
+        choices=[0, 1],
         default=0,
-        help="Summary mode: 0=Thorsten's 32, 1=geometric, 2=geometric + later, 3=geometric + max.",
+        help="Summary engine: 0=per-DOM loop, 1=segmented NumPy reductions.",
+    )
+    parser.add_argument(
+        "--feature_names",
+        type=str,
+        nargs="+",
+        default=None,
+        help="Write only these features (default: all features of the summary mode).",
+    )
+    parser.add_argument(
+        "--charge_windows",
+        type=int,
+        nargs="+",
+        default=None,
+        help="Time windows in ns for the Q<N> columns, e.g. 10 25 50 75 150 (default: 25 75). Segmented engine only.",
+    )
+    parser.add_argument(
+        "--charge_fractions",
+        type=int,
+        nargs="+",
+        default=None,
+        help="Charge fractions in %% for the T<N> columns, e.g. 10 20 30 40 50 60 70 80 90. Segmented engine only.",
+    )
+    parser.add_argument(
+        "--Q_adj_cut",
+        type=float,
+        nargs="+",
+        default=[0],
+        help="DOM charge cut(s) of the geometric features, threshold 10**(cut + 2). Several values write one set of columns per cut (segmented engine only).",
+    )
+    parser.add_argument(
+        "--memory_budget_MB",
+        type=float,
+        default=None,
+        help="Stream each shard in chunks of whole events of about this many MB of pulses (default: whole shard at once).",
+    )
+    parser.add_argument(
+        "--pipelined",
+        action="store_true",
+        help="Overlap reading, summarising and writing of consecutive shards in threads.",
+    )
+    parser.add_argument(
+        "--prefetch_depth",
+        type=int,
+        default=2,
+        help="With --pipelined, the number of shards that may wait between two stages.",
+    )
+    parser.add_argument(
+        "--n_workers",
+        type=int,
+        default=1,
+        help="Worker processes sharing the shards of the part, e.g. $SLURM_CPUS_PER_TASK (default: 1).",
+    )
+    parser.add_argument(
+        "--staging_root",
+        type=str,
+        default=None,
+        help="Stage the decoded pulses of the part in Arrow IPC files under this directory and read them from there on reruns.",
+    )
+    parser.add_argument(
+        "--source_format",
+        type=int,
+        choices=[0, 1],
+        default=SourceFormat.SQLITE.index,
+        help="Format of the source: 0 for merged_part_<part_no>.db, 1 for <table>/<table>_<part_no>.parquet (default: 0).",
+    )
+    parser.add_argument(
+        "--source_tables",
+        nargs="+",
+        type=str,
+        default=None,
+        help="Pulsemaps to PMTfy in one pass, e.g. SRTInIcePulses InIcePulses; the first sets the events and the truth (default: the pulsemap of the table config).",
+    )
+    parser.add_argument(
+        "--immutable_source",
+        action="store_true",
+        help="Open the source database as immutable: no locking, for files nothing writes to.",
+    )
+    parser.add_argument(
+        "--prepare_source",
+        action="store_true",
+        help="Index the pulsemap of the source database on its sort keys before reading it (writes the file).",
     )
     return parser.parse_args()
 
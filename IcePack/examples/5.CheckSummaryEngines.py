@@ -0,0 +1,182 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+import argparse
+import logging
+import sqlite3 as sql
+
+import numpy as np
+import pyarrow as pa
+
+from IcePack.PMTfication.PMTSummariser import PMTSummariser
+from IcePack.PMTfication.PulseBatch import PulseBatch
+from IcePack.PMTfication.EventIndex import EventIndex
+from IcePack.Enum.SummaryMode import SummaryMode
+from IcePack.Enum.SummaryEngine import SummaryEngine
+
+# sklearn's PCA (LOOP) and the closed-form 2x2 eigenvalues (SEGMENTED) are different
+# algorithms, so these two columns may differ in the last float32 bits; all others must be equal
+_PCA_COLUMNS = ("eccentricity_PCA", "aspect_contrast_PCA")
+_PCA_RTOL = 1e-6
+# aspect_contrast_PCA near 0 is a difference of two eigenvalues
+_PCA_ATOL = 1e-6
+# two equal pulses: T50 lands exactly on the cumulated charge of the first one
+_TIE_EVENT_NO = 7
+# in the order of the synthetic pulse tuples
+_SYNTHETIC_COLUMNS = (
+    "event_no",
+    "string",
+    "dom_number",
+    "dom_x",
+    "dom_y",
+    "dom_z",
+    "dom_time",
+    "hlc",
+    "charge",
+    "pmt_area",
+    "rde",
+    "is_saturated_dom",
+    "is_bad_dom",
+    "is_bright_dom",
+)
+
+
+def check_wrap():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    args = parse_arguments()
+
+    n_mismatches = 0
+    for summary_mode in SummaryMode:
+        for name, get_summariser in get_shards(args, summary_mode):
+            tables = [
+                get_summariser(summary_engine)()
+                for summary_engine in (
+                    SummaryEngine.LOOP,
+                    SummaryEngine.SEGMENTED,
+                )
+            ]
+            mismatches = compare(*tables)
+            n_mismatches += len(mismatches)
+            logging.info(
+                f"{summary_mode} {name}: {tables[0].num_rows} DOMs, "
+                f"mismatched columns {mismatches or 'none'}"
+            )
+    if n_mismatches > 0:
+        sys.exit(f"LOOP and SEGMENTED differ in {n_mismatches} columns")
+    logging.info("LOOP and SEGMENTED agree in every summary mode")
+
+
+def get_shards(args, summary_mode: SummaryMode):
+    """(name, summariser factory by engine) of each shard to compare"""
+    pulse_columns = get_synthetic_pulses(args.seed)
+    yield "synthetic", lambda summary_engine: PMTSummariser(
+        summary_mode=summary_mode,
+        summary_engine=summary_engine,
+        pulse_batch=PulseBatch.from_columns(pulse_columns),
+    )
+    if args.source_db is not None:
+        con_source = sql.connect(args.source_db)
+        event_no_subset = EventIndex(
+            con_source, args.source_table
+        ).get_event_no_batches(args.n_events)[0]
+        yield args.source_db, lambda summary_engine: PMTSummariser(
+            con_source=con_source,
+            source_table=args.source_table,
+            event_no_subset=event_no_subset,
+            summary_mode=summary_mode,
+            summary_engine=summary_engine,
+        )
+
+
+def get_synthetic_pulses(seed: int):
+    """
+    events of DOMs with 1 to 300 pulses, half of them with repeated charges,
+    and the exact-tie event _TIE_EVENT_NO
+    """
+    rng = np.random.default_rng(seed)
+    pulses = []
+    for event_no in range(1, 41):
+        for dom in range(rng.integers(1, 12)):
+            n_pulses = int(rng.choice([1, 2, 3, 7, 8, 9, 20, 130, 300]))
+            times = np.sort(rng.uniform(0, 300, n_pulses))
+            charges = (
+                rng.choice([0.125, 0.25, 0.7, 0.975, 1.0, 3.3], n_pulses)
+                if event_no % 2
+                else rng.lognormal(0, 1, n_pulses)
+            )
+            if event_no == _TIE_EVENT_NO and dom == 0:
+                times, charges = np.array([149.2, 167.0]), np.full(2, 0.1)
+            for time, charge in zip(times, charges):
+                pulses.append(
+                    (event_no, dom + 1, dom % 60 + 1)
+                    + (10.0 * dom, 5.0 * dom, -17.0 * (dom % 60))
+                    + (time, 1, charge, 1.0, 1.35, 0, 0, 0)
+                )
+    return {
+        name: np.array(column)
+        for name, column in zip(_SYNTHETIC_COLUMNS, zip(*pulses))
+        if name in PMTSummariser._PULSE_COLUMNS
+    }
+
+
+def compare(loop_table: pa.Table, segmented_table: pa.Table):
+    """names of the columns that differ"""
+    mismatches = []
+    for name in loop_table.column_names:
+        loop_column = loop_table[name].to_numpy()
+        segmented_column = segmented_table[name].to_numpy()
+        if name in _PCA_COLUMNS:
+            is_equal = np.allclose(
+                loop_column,
+                segmented_column,
+                rtol=_PCA_RTOL,
+                atol=_PCA_ATOL,
+                equal_nan=True,
+            )
+        else:
+            is_equal = np.array_equal(
+                loop_column, segmented_column, equal_nan=True
+            )
+        if not is_equal:
+            mismatches.append(name)
+    return mismatches
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Check that SummaryEngine.LOOP and SummaryEngine.SEGMENTED write the same columns."
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the synthetic shard.",
+    )
+    parser.add_argument(
+        "--source_db",
+        type=str,
+        default=None,
+        help="Also compare the first shard of this merged_part_<part_no>.db.",
+    )
+    parser.add_argument(
+        "--source_table",
+        type=str,
+        default="SRTInIcePulses",
+        help="Pulsemap table of --source_db.",
+    )
+    parser.add_argument(
+        "--n_events",
+        type=int,
+        default=200,
+        help="Events of the --source_db shard.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    check_wrap()
@@ -0,0 +1,123 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+import argparse
+import logging
+import sqlite3 as sql
+import time
+
+import numpy as np
+
+from IcePack.PMTfication.PMTSummariser import PMTSummariser
+from IcePack.PMTfication.InMemorySummariser import InMemorySummariser
+from IcePack.PMTfication.PulseBatch import PulseBatch
+from IcePack.PMTfication.EventIndex import EventIndex
+from IcePack.Enum.SummaryMode import SummaryMode
+
+# the latency an online alert stream can afford per event
+_TARGET_MS = 1.0
+
+
+def benchmark_wrap():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    args = parse_arguments()
+
+    events = get_events(args)
+    n_pulses = [event["charge"].shape[0] for event in events]
+    logging.info(
+        f"{len(events)} events of {args.source_db}, "
+        f"median {np.median(n_pulses):.0f} pulses per event"
+    )
+    for summary_mode_index in args.summary_mode:
+        summary_mode = SummaryMode.from_index(summary_mode_index)
+        latencies_ms = get_latencies_ms(
+            InMemorySummariser(summary_mode=summary_mode),
+            events,
+            args.repeats,
+        )
+        median_ms = np.median(latencies_ms)
+        logging.info(
+            f"{summary_mode}: median {median_ms:.3f} ms, "
+            f"p90 {np.percentile(latencies_ms, 90):.3f} ms per event "
+            f"({'within' if median_ms < _TARGET_MS else 'above'} "
+            f"the {_TARGET_MS:g} ms target)"
+        )
+
+
+def get_events(args):
+    """pulse columns of each event, as an alert stream delivers them"""
+    con_source = sql.connect(args.source_db)
+    event_no_subset = EventIndex(
+        con_source, args.source_table
+    ).get_event_no_batches(args.n_events)[0]
+    cursor = con_source.execute(
+        f"SELECT {', '.join(PMTSummariser._PULSE_COLUMNS)} "
+        f"FROM {args.source_table} "
+        f"WHERE event_no IN ({', '.join(map(str, event_no_subset))})"
+    )
+    pulse_batch = PulseBatch.from_cursor(cursor)
+    con_source.close()
+    return [
+        {name: values.copy() for name, values in event_batch.columns.items()}
+        for _, event_batch in pulse_batch.iter_events()
+    ]
+
+
+def get_latencies_ms(summariser: InMemorySummariser, events, repeats: int):
+    """wall time of each call, after one warm-up pass"""
+    for event in events:
+        summariser(event)
+    latencies_ms = []
+    for _ in range(repeats):
+        for event in events:
+            start_time = time.perf_counter()
+            summariser(event)
+            latencies_ms.append((time.perf_counter() - start_time) * 1e3)
+    return np.array(latencies_ms)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Time InMemorySummariser on single events of a source database."
+    )
+    parser.add_argument(
+        "--source_db",
+        type=str,
+        required=True,
+        help="A merged_part_<part_no>.db to take the events from.",
+    )
+    parser.add_argument(
+        "--source_table",
+        type=str,
+        default="SRTInIcePulses",
+        help="Pulsemap table of --source_db.",
+    )
+    parser.add_argument(
+        "--n_events",
+        type=int,
+        default=300,
+        help="Events to summarise, one call each.",
+    )
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=5,
+        help="Timed passes over the events.",
+    )
+    parser.add_argument(
+        "--summary_mode",
+        type=int,
+        nargs="+",
+        default=[mode.index for mode in SummaryMode],
+        help="Summary mode indices to time (default: all).",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    benchmark_wrap()
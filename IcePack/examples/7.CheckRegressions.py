@@ -0,0 +1,306 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+import argparse
+import json
+import logging
+import os
+import sqlite3 as sql
+import tempfile
+
+import numpy as np
+import pyarrow as pa
+
+from IcePack.PMTfication.EventIndex import EventIndex
+from IcePack.PMTfication.PMTSummariser import PMTSummariser
+from IcePack.PMTfication.PulseBatch import PulseBatch
+from IcePack.PMTfication.PMTfier import PMTfier
+from IcePack.PMTfication.Layout.SnowstormLayout import SnowstormLayout
+from IcePack.Enum.SummaryEngine import SummaryEngine
+from IcePack.Enum.SummaryMode import SummaryMode
+from IcePack.Enum.Flavour import Flavour
+from IcePack.Enum.EnergyRange import EnergyRange
+
+# SummaryMode.EQUINOX columns, in the order of the previous release
+_EQUINOX_COLUMNS = (
+    ["event_no", "dom_x", "dom_y", "dom_z", "dom_x_rel", "dom_y_rel"]
+    + ["dom_z_rel", "pmt_area", "rde", "saturation_status"]
+    + ["bad_dom_status", "bright_dom_status"]
+    + [f"q{i}" for i in range(1, 6)]
+    + ["Q25", "Q75", "Qtotal"]
+    + [f"hlc{i}" for i in range(1, 6)]
+    + [f"t{i}" for i in range(1, 6)]
+    + ["T10", "T50", "sigmaT", "t_qmax", "t_qmax_bottom", "Q_halftime"]
+    + ["T70", "T90", "eccentricity_PCA", "aspect_contrast_PCA", "hypotenuse"]
+)
+
+
+def check_wrap():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    parse_arguments()
+
+    failures = []
+    for check in (
+        check_truncated_event_index,
+        check_string_representative,
+        check_equinox_schema_order,
+        check_loop_options,
+        check_arrow_nulls,
+        check_charge_ties,
+        check_large_event_no,
+    ):
+        failures += [f"{check.__name__}: {failure}" for failure in check()]
+    for failure in failures:
+        logging.error(failure)
+    if failures:
+        sys.exit(f"{len(failures)} checks failed")
+    logging.info("all checks passed")
+
+
+def check_truncated_event_index():
+    """a truncated event index cache is scanned and written again"""
+
+    class CountingEventIndex(EventIndex):
+        n_scans = 0
+
+        def _scan(self):
+            CountingEventIndex.n_scans += 1
+            return super()._scan()
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        con_source = get_synthetic_source(os.path.join(tmp_dir, "source.db"))
+        event_index = CountingEventIndex(con_source, "pulses")
+        with open(event_index.cache_file, "r+b") as cache:
+            cache.truncate(os.path.getsize(event_index.cache_file) // 2)
+
+        rerun = CountingEventIndex(con_source, "pulses")
+        if CountingEventIndex.n_scans != 2:
+            failures.append(f"{CountingEventIndex.n_scans} scans, expected 2")
+        if not np.array_equal(rerun.event_nos, event_index.event_nos):
+            failures.append("rescanned event_no differ")
+        CountingEventIndex(con_source, "pulses")
+        if CountingEventIndex.n_scans != 2:
+            failures.append("the rewritten cache is not reused")
+        con_source.close()
+    return failures
+
+
+def check_string_representative():
+    """
+    the high-charge DOM read first on a string represents it in XY,
+    whatever its dom_number
+    """
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        con_source = sql.connect(os.path.join(tmp_dir, "source.db"))
+        con_source.execute(
+            "CREATE TABLE pulses ("
+            + ", ".join(
+                f"{name} FLOAT" for name in PMTSummariser._PULSE_COLUMNS
+            )
+            + ")"
+        )
+        # (string, dom_number, dom_x): dom 10 is read before dom 5 on string 1
+        doms = [(1, 10, 0.0), (1, 5, 30.0), (2, 1, 100.0)]
+        con_source.executemany(
+            f"INSERT INTO pulses VALUES ({', '.join('?' * 14)})",
+            [
+                (1, string, dom_number, dom_x, 0.0, 0.0, 100.0)
+                + (1, 200.0, 1.0, 1.35, 0, 0, 0)
+                for string, dom_number, dom_x in doms
+            ],
+        )
+        con_source.commit()
+        for summary_engine in SummaryEngine:
+            hypotenuse = PMTSummariser(
+                con_source=con_source,
+                source_table="pulses",
+                event_no_subset=[1],
+                summary_mode=SummaryMode.SECOND,
+                summary_engine=summary_engine,
+            )()["hypotenuse"].to_numpy()
+            # string 1 at dom_x 0 (dom 10), not 30 (dom 5)
+            if not np.all(hypotenuse == 100.0):
+                failures.append(f"{summary_engine} hypotenuse {hypotenuse}")
+        con_source.close()
+    return failures
+
+
+def check_equinox_schema_order():
+    """
+    EQUINOX keeps its column order, also when its own charge windows
+    and fractions are passed explicitly
+    """
+    failures = []
+    for kwargs in (
+        {},
+        {"charge_windows": [25, 75], "charge_fractions": [10, 50, 70, 90]},
+    ):
+        names = PMTSummariser(
+            summary_mode=SummaryMode.EQUINOX,
+            summary_engine=SummaryEngine.SEGMENTED,
+            pulse_batch=PulseBatch.from_columns(
+                {name: np.empty(0) for name in PMTSummariser._PULSE_COLUMNS}
+            ),
+            **kwargs,
+        ).schema.names
+        if names != _EQUINOX_COLUMNS:
+            failures.append(f"{kwargs or 'default'}: {names}")
+    return failures
+
+
+def check_loop_options():
+    """
+    PMTfier rejects options SummaryEngine.LOOP cannot compute when it is built,
+    and accepts them for SummaryEngine.SEGMENTED
+    """
+    failures = []
+    layout = SnowstormLayout.from_flavour_energy(
+        Flavour.TAU, EnergyRange.ER_10_TEV_1_PEV
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        table_config_file = os.path.join(tmp_dir, "TableConfig.json")
+        with open(table_config_file, "w") as f:
+            json.dump({"tables": {}}, f)
+        for kwargs in (
+            {"charge_windows": [10, 25, 50]},
+            {"charge_fractions": [10, 50, 90]},
+            {"Q_adj_cut_second_round": [0, 0.5]},
+        ):
+            for summary_engine in SummaryEngine:
+                try:
+                    PMTfier(
+                        tmp_dir,
+                        layout,
+                        table_config_file,
+                        tmp_dir,
+                        summary_engine=summary_engine,
+                        **kwargs,
+                    )
+                    is_rejected = False
+                except ValueError:
+                    is_rejected = True
+                if is_rejected != (summary_engine == SummaryEngine.LOOP):
+                    failures.append(
+                        f"{summary_engine} {kwargs}: rejected {is_rejected}"
+                    )
+    return failures
+
+
+def check_arrow_nulls():
+    """
+    NULL and bool columns of a record batch or a table read as from SQLite rows:
+    NaN, and -1 in integer columns
+    """
+    failures = []
+    pulses = {
+        "event_no": [1, 1, 2],
+        "string": [1, 1, 2],
+        "dom_number": [3, 3, 4],
+        "dom_time": [10.0, 20.0, 30.0],
+        "charge": [1.0, 0.5, 2.0],
+        "hlc": pa.array([True, None, False]),
+        "auxiliary": pa.array([None, True, False]),
+    }
+    expected = {"hlc": [1, -1, 0], "auxiliary": [np.nan, 1.0, 0.0]}
+    for table in (pa.RecordBatch.from_pydict(pulses), pa.table(pulses)):
+        try:
+            columns = PulseBatch.from_arrow(table).columns
+        except Exception as error:
+            failures.append(f"{type(table).__name__}: {error!r}")
+            continue
+        for name, values in expected.items():
+            if not np.array_equal(columns[name], values, equal_nan=True):
+                failures.append(
+                    f"{type(table).__name__} {name}: {columns[name]}"
+                )
+    return failures
+
+
+def check_charge_ties():
+    """of equal highest charges, the later pulse counts as higher in both engines"""
+    failures = []
+    charges = [1.0, 2.0, 0.5, 2.0, 1.0, 0.25, 2.0, 1.0, 0.5]
+    n_pulses = len(charges)
+    pulses = {
+        name: np.zeros(n_pulses) for name in PMTSummariser._PULSE_COLUMNS
+    }
+    pulses.update(
+        event_no=np.ones(n_pulses),
+        string=np.ones(n_pulses),
+        dom_number=np.ones(n_pulses),
+        dom_time=10.0 * np.arange(1, n_pulses + 1),
+        charge=np.array(charges),
+    )
+    # the 2.0 pulses are at 20, 40 and 70 ns
+    expected = {
+        SummaryMode.EQUINOX: {"t_qmax": 70.0},
+        SummaryMode.SANKTHANS: {"t_qmax1": 40.0, "t_qmax2": 70.0},
+    }
+    for summary_mode, columns in expected.items():
+        for summary_engine in SummaryEngine:
+            table = PMTSummariser(
+                summary_mode=summary_mode,
+                summary_engine=summary_engine,
+                pulse_batch=PulseBatch.from_columns(pulses),
+            )()
+            for name, value in columns.items():
+                if table[name].to_numpy()[0] != value:
+                    failures.append(
+                        f"{summary_mode} {summary_engine} {name}: "
+                        f"{table[name].to_numpy()[0]}, expected {value}"
+                    )
+    return failures
+
+
+def check_large_event_no():
+    """event_no beyond int32 is written unchanged by both engines"""
+    failures = []
+    event_nos = np.array([2**31 + 5, 2**33])
+    pulses = {name: np.zeros(2) for name in PMTSummariser._PULSE_COLUMNS}
+    pulses.update(
+        event_no=event_nos,
+        string=np.ones(2),
+        dom_number=np.ones(2),
+        dom_time=np.array([10.0, 20.0]),
+        charge=np.ones(2),
+    )
+    for summary_engine in SummaryEngine:
+        written = PMTSummariser(
+            summary_engine=summary_engine,
+            pulse_batch=PulseBatch.from_columns(pulses),
+        )()["event_no"].to_numpy()
+        if not np.array_equal(written, event_nos):
+            failures.append(f"{summary_engine}: {written}")
+    return failures
+
+
+def get_synthetic_source(db_file: str) -> sql.Connection:
+    """a pulsemap table "pulses" of 5 events"""
+    con_source = sql.connect(db_file)
+    con_source.execute(
+        "CREATE TABLE pulses (event_no INTEGER, dom_time FLOAT, charge FLOAT)"
+    )
+    con_source.executemany(
+        "INSERT INTO pulses VALUES (?, ?, ?)",
+        [(event_no, 10.0 * i, 1.0) for event_no in range(5) for i in range(3)],
+    )
+    con_source.commit()
+    return con_source
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Check behaviours that must not change, on synthetic sources."
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    check_wrap()